@@ -1,23 +1,49 @@
 from __future__ import annotations
 
 import asyncio
+import dataclasses
+import inspect
 import logging
 import os
+from contextlib import aclosing
 
 # from lmnr.sdk.decorators import observe
 from browser_use.agent.gif import create_history_gif
-from browser_use.agent.service import Agent, AgentHookFunc
+from browser_use.agent.service import Agent, AgentHookFunc, log_response
 from browser_use.agent.views import (
+    ActionModel,
     ActionResult,
     AgentHistory,
     AgentHistoryList,
+    AgentOutput,
     AgentStepInfo,
+    StepMetadata,
     ToolCallingMethod,
 )
-from browser_use.browser.views import BrowserStateHistory
+from browser_use.browser.views import BrowserState, BrowserStateHistory
+from langchain_core.messages import BaseMessage
 from browser_use.utils import time_execution_async
 from dotenv import load_dotenv
-from browser_use.agent.message_manager.utils import is_model_without_tool_support
+from browser_use.agent.message_manager.utils import extract_json_from_model_output, is_model_without_tool_support
+from browser_use.exceptions import LLMException
+from pydantic import ValidationError
+from typing import Any, Callable, Optional
+
+from src.agent.browser_use.spilling_history import SpillingAgentHistoryList
+from src.utils.artifact_writer import ArtifactWriter, get_artifact_writer
+from src.utils.llm_provider import DeepSeekR1ChatOllama, DeepSeekR1ChatOpenAI
+from src.utils.llm_router import RoutingChatModel
+from src.utils.prompt_cache import PrefixMonitor, supports_cache_control, with_cache_breakpoints
+from src.utils.run_recorder import RunRecorder
+from src.utils.screenshot_store import ScreenshotStore, load_screenshot
+from src.utils.step_profiler import (
+    LLMTimingHandler,
+    StepProfiler,
+    current_profiler,
+    llm_timing_handler,
+    profile_callback,
+)
+from src.utils.usage_tracker import usage_tags
 
 load_dotenv()
 logger = logging.getLogger(__name__)
@@ -27,6 +53,38 @@ SKIP_LLM_API_KEY_VERIFICATION = (
 )
 
 import json
+
+
+class _JsonObjectTracker:
+    """Follows streamed text and reports when the first top-level JSON object is closed."""
+
+    def __init__(self):
+        self.depth = 0
+        self.started = False
+        self.in_string = False
+        self.escaped = False
+
+    def feed(self, text: str) -> bool:
+        for char in text:
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"' and self.started:
+                self.in_string = True
+            elif char == "{":
+                self.depth += 1
+                self.started = True
+            elif char == "}" and self.started:
+                self.depth -= 1
+                if self.depth == 0:
+                    return True
+        return False
+
+
 class BrowserUseAgent(Agent):
     # 重写构造函数，调整部分设置以取消页面上的框框
     from langchain_core.language_models.chat_models import BaseChatModel
@@ -35,14 +93,46 @@ class BrowserUseAgent(Agent):
             task: str,
             llm: BaseChatModel,
             *args,
+            screenshot_store: Optional[ScreenshotStore] = None,
+            artifact_writer: Optional[ArtifactWriter] = None,
+            recorder: Optional[RunRecorder] = None,
+            history_spill_path: Optional[str] = None,
+            max_history_in_memory: int = 20,
+            profiler: Optional[StepProfiler] = None,
+            register_reasoning_callback: Optional[Callable[[str], Any]] = None,
+            prompt_cache: bool = False,
             **kwargs
     ):
+        # Offloads step screenshots to disk so the history only keeps file paths
+        self.screenshot_store = screenshot_store
+        # History, GIF and Playwright script are written off the event loop
+        self.artifact_writer = artifact_writer or get_artifact_writer()
+        self.pending_artifacts: dict[str, asyncio.Task] = {}
+        self._screenshot_writes: list[asyncio.Task] = []
+        # Encodes the recording step by step; replaces the GIF built from the history at the end
+        self.recorder = recorder
+        # Per-step latency breakdown, see src/utils/step_profiler.py
+        self.profiler = profiler
+        # Receives reasoning text of streaming reasoning models (DeepSeek R1) as it arrives
+        self.register_reasoning_callback = register_reasoning_callback
+        # Lays out requests for provider-side prompt caching, see _layout_for_prompt_cache
+        self.prompt_cache = prompt_cache
+        self.prefix_monitor = PrefixMonitor()
+        # With lazily exposed MCP tools, the ones matching the task get their full schema up front
+        controller = kwargs.get("controller")
+        if hasattr(controller, "select_mcp_tools"):
+            controller.select_mcp_tools(task)
         # 调用父类构造函数
         super().__init__(
             task=task,
             llm=llm,
             **kwargs  # 传递所有其他父类参数
         )
+        if history_spill_path:
+            # Streams steps to JSONL and keeps only the newest ones in memory
+            self.spill_history_to(history_spill_path, max_history_in_memory)
+        if self.register_new_step_callback:
+            self.register_new_step_callback = profile_callback(self.register_new_step_callback)
         # 获取当前脚本的绝对路径
         current_script_path = os.path.abspath(__file__)
 
@@ -74,22 +164,304 @@ class BrowserUseAgent(Agent):
             print(f"错误: 配置文件格式无效 - {config_path}")
         except Exception as e:
             print(f"读取配置时发生意外错误: {str(e)}")
+
+    def add_new_task(self, new_task: str) -> None:
+        if hasattr(self.controller, "select_mcp_tools"):
+            self.controller.select_mcp_tools(new_task)
+        super().add_new_task(new_task)
+
+    def _make_history_item(
+            self,
+            model_output: AgentOutput | None,
+            state: BrowserState,
+            result: list[ActionResult],
+            metadata: StepMetadata | None = None,
+    ) -> None:
+        # Same as Agent._make_history_item, but the screenshot is recorded and offloaded
+        # before the item is appended, since a spilling history writes it out right away
+        step_num = metadata.step_number if metadata else self.state.n_steps
+        screenshot = state.screenshot
+        if self.recorder and screenshot:
+            self.recorder.add_step(
+                step_num - 1,
+                screenshot,
+                goal=model_output.current_state.next_goal if model_output else None,
+                is_done=any(r.is_done for r in result),
+            )
+        if self.screenshot_store and screenshot:
+            # Only the path is needed here; encoding runs on the artifact writer
+            ref, is_new = self.screenshot_store.reserve(step_num, screenshot)
+            if is_new:
+                self._screenshot_writes = [t for t in self._screenshot_writes if not t.done()]
+                self._screenshot_writes.append(self.artifact_writer.submit(
+                    f"screenshot of step {step_num}", self.screenshot_store.write, ref, screenshot
+                ))
+            screenshot = ref.path
+
+        if model_output:
+            interacted_elements = AgentHistory.get_interacted_element(model_output, state.selector_map)
+        else:
+            interacted_elements = [None]
+        state_history = BrowserStateHistory(
+            url=state.url,
+            title=state.title,
+            tabs=state.tabs,
+            interacted_element=interacted_elements,
+            screenshot=screenshot,
+        )
+        self.state.history.history.append(
+            AgentHistory(model_output=model_output, result=result, state=state_history, metadata=metadata)
+        )
+
+    def spill_history_to(self, path: str, max_in_memory: int = 20):
+        """
+        Starts a new spilled history in ``path``. A reused agent calls this for each new
+        task, so the task's steps go to its own file and not the first task's.
+        """
+        self.state.history = SpillingAgentHistoryList.create(path, max_in_memory)
+
+    def _history_with_screenshots(self, history: AgentHistoryList | None = None) -> AgentHistoryList:
+        """
+        Copy of the full history with screenshot paths loaded back as base64 (e.g. for the GIF).
+        A spilled history is replayed from its file, its in-memory list only holds the newest steps.
+        """
+        history = history or self.state.history
+        if isinstance(history, SpillingAgentHistoryList):
+            items = history.iter_items(self.AgentOutput)
+        elif not self.screenshot_store:
+            return history
+        else:
+            items = history.history
+        loaded = []
+        for item in items:
+            state = dataclasses.replace(item.state, screenshot=load_screenshot(item.state.screenshot))
+            loaded.append(item.model_copy(update={"state": state}))
+        return AgentHistoryList(history=loaded)
+
+    def _history_snapshot(self) -> AgentHistoryList:
+        if isinstance(self.state.history, SpillingAgentHistoryList):
+            return self.state.history.frozen_copy()
+        # Items are not modified once a step is recorded, so a shallow copy is enough
+        return AgentHistoryList(history=list(self.state.history.history))
+
+    def _write_history_gif(self, task: str, history: AgentHistoryList, output_path: str):
+        create_history_gif(task=task, history=self._history_with_screenshots(history), output_path=output_path)
+
+    def save_history_in_background(self, file_path: str) -> asyncio.Task:
+        """Like ``save_history``, but serialises on the artifact writer. See ``wait_for_artifacts``."""
+        task = self.artifact_writer.submit("history", self._history_snapshot().save_to_file, file_path)
+        self.pending_artifacts["history"] = task
+        return task
+
+    async def wait_for_screenshots(self):
+        """Waits until the offloaded step screenshots are on disk; failures are logged by the writer."""
+        pending, self._screenshot_writes = self._screenshot_writes, []
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    async def wait_for_artifacts(self) -> dict[str, bool]:
+        """Waits for the pending history, GIF and Playwright script writes; returns which succeeded."""
+        await self.wait_for_screenshots()
+        pending, self.pending_artifacts = self.pending_artifacts, {}
+        results = await asyncio.gather(*pending.values(), return_exceptions=True)
+        return {name: not isinstance(result, BaseException) for name, result in zip(pending, results)}
+
+    async def step(self, step_info: AgentStepInfo | None = None) -> None:
+        if not self.profiler:
+            await super().step(step_info)
+        else:
+            self.profiler.start_step(self.state.n_steps)
+            try:
+                await super().step(step_info)
+            finally:
+                self.profiler.end_step()
+        if self.recorder:
+            # Backpressure: the next step starts once the encoder has caught up
+            await self.recorder.wait_for_capacity()
+
+    async def get_next_action(self, input_messages: list[BaseMessage]) -> AgentOutput:
+        if self.profiler:
+            self.profiler.mark_llm_request()
+        if self.prompt_cache:
+            input_messages = self._layout_for_prompt_cache(input_messages)
+        # Streaming skips the response cache, so cached models answer through ainvoke instead
+        if (self.tool_calling_method == 'raw' and isinstance(self.llm, (DeepSeekR1ChatOpenAI, DeepSeekR1ChatOllama))
+                and not self.llm.cache):
+            return await self._stream_next_action(input_messages)
+        return await super().get_next_action(input_messages)
+
+    def _layout_for_prompt_cache(self, input_messages: list[BaseMessage]) -> list[BaseMessage]:
+        """
+        The message history only grows between steps, so everything before the
+        current state message is the static prefix the next request repeats: tool
+        schemas, system prompt, task and examples, then earlier steps. OpenAI and
+        DeepSeek reuse it automatically; Anthropic needs breakpoints, set after the
+        system prompt, after the task and examples, and before the current state.
+        """
+        self.prefix_monitor.check(input_messages[:-1])
+        if not supports_cache_control(self.llm):
+            return input_messages
+        history = self._message_manager.state.history.messages
+        last_init = max((i for i, m in enumerate(history) if m.metadata.message_type == 'init'), default=0)
+        return with_cache_breakpoints(input_messages, [0, last_init, len(input_messages) - 2])
+
+    async def _stream_next_action(self, input_messages: list[BaseMessage]) -> AgentOutput:
+        """
+        Raw-mode ``get_next_action`` for reasoning models: reasoning is forwarded to
+        ``register_reasoning_callback`` while it streams, the answer is parsed as soon
+        as its JSON object is complete and the rest of the stream is dropped.
+        """
+        input_messages = self._convert_input_messages(input_messages)
+        answer = ""
+        parsed: AgentOutput | None = None
+        tracker = _JsonObjectTracker()
+        try:
+            async with aclosing(self.llm.astream(input_messages)) as stream:
+                async for chunk in stream:
+                    reasoning = chunk.additional_kwargs.get("reasoning_content")
+                    if reasoning and self.register_reasoning_callback:
+                        result = self.register_reasoning_callback(reasoning)
+                        if inspect.isawaitable(result):
+                            await result
+                    if not chunk.content:
+                        continue
+                    answer += chunk.content
+                    if tracker.feed(chunk.content):
+                        try:
+                            parsed = self.AgentOutput(**extract_json_from_model_output(answer))
+                            break
+                        except (ValueError, ValidationError):
+                            tracker = _JsonObjectTracker()
+        except Exception as e:
+            logger.error(f'Failed to invoke model: {str(e)}')
+            raise LLMException(401, 'LLM API call failed') from e
+
+        if parsed is None:
+            try:
+                parsed = self.AgentOutput(**extract_json_from_model_output(self._remove_think_tags(answer)))
+            except (ValueError, ValidationError) as e:
+                logger.warning(f'Failed to parse model output: {answer} {str(e)}')
+                raise ValueError('Could not parse response.')
+
+        # cut the number of actions to max_actions_per_step if needed
+        if len(parsed.action) > self.settings.max_actions_per_step:
+            parsed.action = parsed.action[: self.settings.max_actions_per_step]
+        if not (self.state.paused or self.state.stopped):
+            log_response(parsed)
+        return parsed
+
     def _set_tool_calling_method(self) -> ToolCallingMethod | None:
         tool_calling_method = self.settings.tool_calling_method
+        # A routing model answers in the format of its primary endpoint
+        chat_model_library = self.chat_model_library
+        if isinstance(self.llm, RoutingChatModel):
+            chat_model_library = self.llm.primary.__class__.__name__
         if tool_calling_method == 'auto':
             if is_model_without_tool_support(self.model_name):
                 return 'raw'
-            elif self.chat_model_library == 'ChatGoogleGenerativeAI':
+            elif chat_model_library == 'ChatGoogleGenerativeAI':
                 return None
-            elif self.chat_model_library == 'ChatOpenAI':
+            elif chat_model_library == 'ChatOpenAI':
                 return 'function_calling'
-            elif self.chat_model_library == 'AzureChatOpenAI':
+            elif chat_model_library == 'AzureChatOpenAI':
                 return 'function_calling'
             else:
                 return None
         else:
             return tool_calling_method
 
+    async def _act(self, action: ActionModel) -> ActionResult:
+        return await self.controller.act(
+            action,
+            self.browser_context,
+            self.settings.page_extraction_llm,
+            self.sensitive_data,
+            self.settings.available_file_paths,
+            context=self.context,
+        )
+
+    async def _act_concurrently(self, actions: list[ActionModel]) -> list[ActionResult]:
+        # Every call has run by the time one fails, so each keeps its own result or error in the history
+        results = await asyncio.gather(*(self._act(action) for action in actions), return_exceptions=True)
+        for result in results:
+            if isinstance(result, BaseException) and not isinstance(result, Exception):
+                raise result
+        return [
+            ActionResult(error=f'{type(result).__name__}: {result}', include_in_memory=True)
+            if isinstance(result, Exception) else result
+            for result in results
+        ]
+
+    async def multi_act(
+            self,
+            actions: list[ActionModel],
+            check_for_new_elements: bool = True,
+    ) -> list[ActionResult]:
+        """Execute multiple actions; independent MCP actions next to each other run concurrently"""
+        results = []
+
+        cached_selector_map = await self.browser_context.get_selector_map()
+        cached_path_hashes = {e.hash.branch_path_hash for e in cached_selector_map.values()}
+
+        await self.browser_context.remove_highlights()
+
+        parallel_mcp_actions = getattr(self.controller, "parallel_mcp_actions", None)
+        i = 0
+        while i < len(actions):
+            action = actions[i]
+            if action.get_index() is not None and i != 0:
+                new_state = await self.browser_context.get_state(cache_clickable_elements_hashes=False)
+                new_selector_map = new_state.selector_map
+
+                # Detect index change after previous action
+                orig_target = cached_selector_map.get(action.get_index())  # type: ignore
+                orig_target_hash = orig_target.hash.branch_path_hash if orig_target else None
+                new_target = new_selector_map.get(action.get_index())  # type: ignore
+                new_target_hash = new_target.hash.branch_path_hash if new_target else None
+                if orig_target_hash != new_target_hash:
+                    msg = f'Element index changed after action {i} / {len(actions)}, because page changed.'
+                    logger.info(msg)
+                    results.append(ActionResult(extracted_content=msg, include_in_memory=True))
+                    break
+
+                new_path_hashes = {e.hash.branch_path_hash for e in new_selector_map.values()}
+                if check_for_new_elements and not new_path_hashes.issubset(cached_path_hashes):
+                    # next action requires index but there are new elements on the page
+                    msg = f'Something new appeared after action {i} / {len(actions)}'
+                    logger.info(msg)
+                    results.append(ActionResult(extracted_content=msg, include_in_memory=True))
+                    break
+
+            # MCP tools do not touch the page, so a run of them needs no checks in between
+            batch = parallel_mcp_actions(actions, i) if parallel_mcp_actions else []
+            if len(batch) < 2:
+                batch = [action]
+
+            try:
+                await self._raise_if_stopped_or_paused()
+
+                if len(batch) > 1:
+                    logger.debug(f'Running {len(batch)} MCP actions concurrently')
+                    results.extend(await self._act_concurrently(batch))
+                else:
+                    results.append(await self._act(action))
+
+                i += len(batch)
+                logger.debug(f'Executed action {i} / {len(actions)}')
+                if any(result.is_done or result.error for result in results[-len(batch):]) or i == len(actions):
+                    break
+
+                await asyncio.sleep(self.browser_context.config.wait_between_actions)
+
+            except asyncio.CancelledError:
+                # Gracefully handle task cancellation
+                logger.info(f'Action {i + 1} was cancelled due to Ctrl+C')
+                if not results:
+                    # Add a result for the cancelled action
+                    results.append(ActionResult(error='The action was cancelled due to Ctrl+C', include_in_memory=True))
+                raise InterruptedError('Action cancelled by user')
+
+        return results
+
     @time_execution_async("--run (agent)")
     async def run(
             self, max_steps: int = 100, on_step_start: AgentHookFunc | None = None,
@@ -111,6 +483,12 @@ class BrowserUseAgent(Agent):
         )
         signal_handler.register()
 
+        # Instrumented code (browser context, controller, LLM callbacks) finds the profiler here
+        profiler_token = current_profiler.set(self.profiler)
+        llm_handler_token = llm_timing_handler.set(LLMTimingHandler() if self.profiler else None)
+        # LLM usage is accounted to this agent unless an enclosing agent already tagged the task
+        usage_token = usage_tags.set({"agent": "browser_use", "task_id": self.state.agent_id, **usage_tags.get()})
+
         try:
             self._log_agent_run()
 
@@ -186,30 +564,43 @@ class BrowserUseAgent(Agent):
         finally:
             # Unregister signal handlers before cleanup
             signal_handler.unregister()
-
+            current_profiler.reset(profiler_token)
+            llm_timing_handler.reset(llm_handler_token)
+            usage_tags.reset(usage_token)
+            if self.profiler and self.profiler.steps:
+                logger.info(f"Step timings: {self.profiler.format_summary()}")
+            if self.prompt_cache and self.prefix_monitor.breaks:
+                logger.info(f"Prompt prefix changed between steps {self.prefix_monitor.breaks} times")
+
+            # Script and GIF generation run on the artifact writer; callers that need the
+            # files await wait_for_artifacts() instead of blocking the event loop here
+            history = self._history_snapshot()
             if self.settings.save_playwright_script_path:
                 logger.info(
-                    f'Agent run finished. Attempting to save Playwright script to: {self.settings.save_playwright_script_path}'
+                    f'Agent run finished. Saving Playwright script to: {self.settings.save_playwright_script_path}'
+                )
+                # Extract sensitive data keys if sensitive_data is provided
+                keys = list(self.sensitive_data.keys()) if self.sensitive_data else None
+                self.pending_artifacts["playwright_script"] = self.artifact_writer.submit(
+                    "playwright_script",
+                    history.save_as_playwright_script,
+                    self.settings.save_playwright_script_path,
+                    sensitive_data_keys=keys,
+                    browser_config=self.browser.config,
+                    context_config=self.browser_context.config,
                 )
-                try:
-                    # Extract sensitive data keys if sensitive_data is provided
-                    keys = list(self.sensitive_data.keys()) if self.sensitive_data else None
-                    # Pass browser and context config to the saving method
-                    self.state.history.save_as_playwright_script(
-                        self.settings.save_playwright_script_path,
-                        sensitive_data_keys=keys,
-                        browser_config=self.browser.config,
-                        context_config=self.browser_context.config,
-                    )
-                except Exception as script_gen_err:
-                    # Log any error during script generation/saving
-                    logger.error(f'Failed to save Playwright script: {script_gen_err}', exc_info=True)
 
             await self.close()
 
-            if self.settings.generate_gif:
+            if self.recorder:
+                self.pending_artifacts["recording"] = asyncio.create_task(self.recorder.close(), name="recording")
+            elif self.settings.generate_gif:
+                # The GIF reads the offloaded screenshots back from disk
+                await self.wait_for_screenshots()
                 output_path: str = 'agent_history.gif'
                 if isinstance(self.settings.generate_gif, str):
                     output_path = self.settings.generate_gif
 
-                create_history_gif(task=self.task, history=self.state.history, output_path=output_path)
+                self.pending_artifacts["recording"] = self.artifact_writer.submit(
+                    "recording", self._write_history_gif, self.task, history, output_path
+                )
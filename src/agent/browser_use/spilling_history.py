@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Any, Iterator, Optional
+
+from browser_use.agent.views import AgentHistory, AgentHistoryList, AgentOutput
+from pydantic import PrivateAttr
+
+logger = logging.getLogger(__name__)
+
+
+class _HistoryTail(list):
+    """Newest history items; every appended item is first written to the owner's JSONL file."""
+
+    def __init__(self, owner: SpillingAgentHistoryList, max_items: int):
+        super().__init__()
+        self._owner = owner
+        self._max_items = max_items
+
+    def append(self, item: AgentHistory):
+        self._owner._record(item)
+        super().append(item)
+        if len(self) > self._max_items:
+            del self[: len(self) - self._max_items]
+
+    def extend(self, items):
+        for item in items:
+            self.append(item)
+
+
+class SpillingAgentHistoryList(AgentHistoryList):
+    """
+    Agent history with bounded memory.
+
+    Every step is appended to a JSONL file as soon as it is recorded and only the
+    newest ``max_in_memory`` steps stay in ``history``. Durations, token counts and
+    errors are kept as running aggregates, ``save_to_file`` and ``model_dump`` read
+    the full history back from the file and ``iter_items`` replays it as
+    ``AgentHistory`` objects. Other list helpers (``urls()``, ``model_actions()``,
+    ...) only see the in-memory tail.
+    """
+
+    _path: str = PrivateAttr(default="")
+    _num_steps: int = PrivateAttr(default=0)
+    _total_duration: float = PrivateAttr(default=0.0)
+    _input_tokens: list = PrivateAttr(default_factory=list)
+    _errors: list = PrivateAttr(default_factory=list)
+
+    @classmethod
+    def create(cls, path: str, max_in_memory: int = 20) -> SpillingAgentHistoryList:
+        history = cls(history=[])
+        history._path = os.path.abspath(path)
+        os.makedirs(os.path.dirname(history._path), exist_ok=True)
+        open(history._path, "w").close()
+        # Assigned after validation so pydantic keeps the list subclass
+        history.history = _HistoryTail(history, max(1, max_in_memory))
+        return history
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    def _record(self, item: AgentHistory):
+        line = json.dumps(item.model_dump(), ensure_ascii=False, default=str) + "\n"
+        with open(self._path, "a", encoding="utf-8") as f:
+            f.write(line)
+        self._num_steps += 1
+        if item.metadata:
+            self._total_duration += item.metadata.duration_seconds
+            self._input_tokens.append(item.metadata.input_tokens)
+        step_errors = [r.error for r in item.result if r.error]
+        self._errors.append(step_errors[0] if step_errors else None)
+
+    def frozen_copy(self) -> SpillingAgentHistoryList:
+        """Snapshot covering the steps recorded so far, safe to serialise from another thread."""
+        copy = SpillingAgentHistoryList(history=list(self.history))
+        copy._path = self._path
+        copy._num_steps = self._num_steps
+        copy._total_duration = self._total_duration
+        copy._input_tokens = list(self._input_tokens)
+        copy._errors = list(self._errors)
+        return copy
+
+    def iter_history(self) -> Iterator[str]:
+        """Yields the JSON line of every recorded step, oldest first."""
+        with open(self._path, "r", encoding="utf-8") as f:
+            for _, line in zip(range(self._num_steps), f):
+                yield line.rstrip("\n")
+
+    def iter_items(self, output_model: type[AgentOutput]) -> Iterator[AgentHistory]:
+        """Yields every recorded step as ``AgentHistory``, like ``AgentHistoryList.load_from_file``."""
+        for line in self.iter_history():
+            data = json.loads(line)
+            if isinstance(data.get("model_output"), dict):
+                data["model_output"] = output_model.model_validate(data["model_output"])
+            else:
+                data["model_output"] = None
+            yield AgentHistory.model_validate(data)
+
+    def number_of_steps(self) -> int:
+        return self._num_steps
+
+    def total_duration_seconds(self) -> float:
+        return self._total_duration
+
+    def total_input_tokens(self) -> int:
+        return sum(self._input_tokens)
+
+    def input_token_usage(self) -> list[int]:
+        return list(self._input_tokens)
+
+    def errors(self) -> list[Optional[str]]:
+        return list(self._errors)
+
+    def save_to_file(self, filepath: str | Path) -> None:
+        """Writes the full history in the same JSON format as ``AgentHistoryList``, one step at a time."""
+        Path(filepath).parent.mkdir(parents=True, exist_ok=True)
+        with open(filepath, "w", encoding="utf-8") as f:
+            f.write('{"history": [')
+            for i, line in enumerate(self.iter_history()):
+                if i:
+                    f.write(", ")
+                f.write(line)
+            f.write("]}")
+
+    def model_dump(self, **kwargs) -> dict[str, Any]:
+        """Full history read back from the JSONL file."""
+        return {"history": [json.loads(line) for line in self.iter_history()]}
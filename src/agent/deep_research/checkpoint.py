@@ -0,0 +1,167 @@
+import json
+import logging
+import os
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_FILENAME = "checkpoint.jsonl"
+
+
+class ResearchCheckpointStore:
+    """
+    Append-only JSONL checkpoint for a single deep research task.
+
+    The first record holds the research plan, every following record describes
+    one executed plan item (its new status, the search results it produced and
+    the cursor of the next item). Each record is a single line written with one
+    ``write`` + ``fsync``, so a save costs O(1) regardless of plan size and a crash
+    can at worst leave a truncated last line, which is skipped on load.
+    """
+
+    def __init__(self, output_dir: str):
+        self.output_dir = str(output_dir)
+        self.path = os.path.join(self.output_dir, CHECKPOINT_FILENAME)
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def _append(self, record: Dict[str, Any]):
+        line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def save_plan(
+            self,
+            topic: str,
+            plan: List[Dict[str, Any]],
+            search_results: Optional[List[Dict[str, Any]]] = None,
+            category_index: int = 0,
+            task_index: int = 0,
+    ):
+        """
+        Starts a new checkpoint with the given plan, atomically replacing any previous one.
+        Existing search results and cursor can be passed when migrating a resumed task.
+        """
+        record = {
+            "type": "plan",
+            "topic": topic,
+            "plan": plan,
+            "search_results": search_results or [],
+            "next_category_index": category_index,
+            "next_task_index": task_index,
+        }
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            logger.info(f"Research checkpoint initialised at {self.path}")
+        except Exception as e:
+            logger.error(f"Failed to save plan checkpoint to {self.path}: {e}")
+
+    def save_task(
+            self,
+            category_index: int,
+            task_index: int,
+            task: Dict[str, Any],
+            new_search_results: Optional[List[Dict[str, Any]]] = None,
+            next_category_index: Optional[int] = None,
+            next_task_index: Optional[int] = None,
+    ):
+        """Appends the outcome of one plan item together with the results it produced."""
+        record = {
+            "type": "task",
+            "category_index": category_index,
+            "task_index": task_index,
+            "task": {
+                "status": task.get("status"),
+                "queries": task.get("queries"),
+                "result_summary": task.get("result_summary"),
+            },
+            "search_results": new_search_results or [],
+            "next_category_index": category_index if next_category_index is None else next_category_index,
+            "next_task_index": task_index if next_task_index is None else next_task_index,
+        }
+        try:
+            self._append(record)
+        except Exception as e:
+            logger.error(f"Failed to append task checkpoint to {self.path}: {e}")
+
+    def load(self, repair: bool = True) -> Dict[str, Any]:
+        """
+        Replays the checkpoint and returns state updates for ``DeepResearchState``.
+        Returns an empty dict if there is no usable checkpoint. Undecodable or malformed
+        records are skipped; with ``repair``, undecodable lines after the last valid record
+        (a torn tail) are cut off so the file can be appended to again.
+        """
+        if not self.exists():
+            return {}
+
+        topic = None
+        plan: List[Dict[str, Any]] = []
+        search_results: List[Dict[str, Any]] = []
+        cursor = None
+
+        # Offset just past the last decodable record; only lines after it can be a torn tail
+        valid_size = 0
+        offset = 0
+        torn_tail = False
+        with open(self.path, "rb") as f:
+            for line_num, raw_line in enumerate(f):
+                offset += len(raw_line)
+                line = raw_line.strip()
+                if not line:
+                    if not torn_tail:
+                        valid_size = offset
+                    continue
+                try:
+                    record = json.loads(line.decode("utf-8"))
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    logger.warning(f"Skipping truncated checkpoint record at line {line_num + 1} in {self.path}")
+                    torn_tail = True
+                    continue
+                valid_size = offset
+                torn_tail = False
+
+                try:
+                    if record.get("type") == "plan":
+                        topic = record.get("topic")
+                        plan = record.get("plan") or []
+                        search_results = list(record.get("search_results", []))
+                        cursor = (record.get("next_category_index", 0), record.get("next_task_index", 0))
+                    elif record.get("type") == "task":
+                        cat_idx = record["category_index"]
+                        task_idx = record["task_index"]
+                        if cat_idx < len(plan) and task_idx < len(plan[cat_idx]["tasks"]):
+                            plan[cat_idx]["tasks"][task_idx].update(record.get("task", {}))
+                        search_results.extend(record.get("search_results", []))
+                        cursor = (record["next_category_index"], record["next_task_index"])
+                except (AttributeError, KeyError, TypeError) as e:
+                    logger.warning(f"Skipping malformed checkpoint record at line {line_num + 1} in {self.path}: {e!r}")
+
+        if repair and torn_tail:
+            # Drop a torn record left by a crash so the next append starts on a clean line
+            with open(self.path, "r+b") as f:
+                f.truncate(valid_size)
+
+        if not plan:
+            return {}
+
+        logger.info(
+            f"Loaded research checkpoint from {self.path}. "
+            f"Next task: Category {cursor[0]}, Task {cursor[1]} in category."
+        )
+        state_updates = {
+            "research_plan": plan,
+            "search_results": search_results,
+            "current_category_index": cursor[0],
+            "current_task_index_in_category": cursor[1],
+        }
+        if topic:
+            state_updates["topic"] = topic
+        return state_updates
@@ -1,4 +1,5 @@
 import asyncio
+import contextlib
 import json
 import logging
 import os
@@ -32,9 +33,20 @@ from pydantic import BaseModel, Field
 from browser_use.browser.context import BrowserContextConfig
 
 from src.agent.browser_use.browser_use_agent import BrowserUseAgent
+from src.agent.deep_research.checkpoint import ResearchCheckpointStore
+from src.agent.deep_research.plan_cache import PlanCache, get_model_key
+from src.agent.deep_research.progress import (
+    REPORT,
+    RUN_FINISHED,
+    RUN_STARTED,
+    ResearchProgressChannel,
+    render_plan_markdown,
+)
 from src.browser.custom_browser import CustomBrowser
 from src.controller.custom_controller import CustomController
+from src.utils.llm_scheduler import PRIORITY_BATCH, llm_priority_scope
 from src.utils.mcp_client import setup_mcp_client_and_tools
+from src.utils.usage_tracker import get_usage_tracker, tracked_node, usage_scope
 
 logger = logging.getLogger(__name__)
 
@@ -46,7 +58,6 @@ SEARCH_INFO_FILENAME = "search_info.json"
 _AGENT_STOP_FLAGS = {}
 _BROWSER_AGENT_INSTANCES = {}
 
-
 async def run_single_browser_task(
         task_query: str,
         task_id: str,
@@ -206,10 +217,12 @@ async def _run_browser_search_tool(
         browser_config: Dict[str, Any],
         stop_event: threading.Event,
         max_parallel_browsers: int = 1,
+        browser_slots: Optional[asyncio.Semaphore] = None,
 ) -> List[Dict[str, Any]]:
     """
     Internal function to execute parallel browser searches based on LLM-provided queries.
-    Handles concurrency and stop signals.
+    Handles concurrency and stop signals. ``browser_slots`` caps the browsers open at
+    once across every agent sharing it.
     """
 
     # Limit queries just in case LLM ignores the description
@@ -228,15 +241,18 @@ async def _run_browser_search_tool(
                     f"[Browser Tool {task_id}] Skipping task due to stop signal: {query}"
                 )
                 return {"query": query, "result": None, "status": "cancelled"}
-            # Pass necessary injected configs and the stop event
-            return await run_single_browser_task(
-                query,
-                task_id,
-                llm,  # Pass the main LLM (or a dedicated one if needed)
-                browser_config,
-                stop_event,
-                # use_vision could be added here if needed
-            )
+            async with browser_slots or contextlib.nullcontext():
+                if stop_event.is_set():
+                    return {"query": query, "result": None, "status": "cancelled"}
+                # Pass necessary injected configs and the stop event
+                return await run_single_browser_task(
+                    query,
+                    task_id,
+                    llm,  # Pass the main LLM (or a dedicated one if needed)
+                    browser_config,
+                    stop_event,
+                    # use_vision could be added here if needed
+                )
 
     tasks = [task_wrapper(query) for query in queries]
     search_results = await asyncio.gather(*tasks, return_exceptions=True)
@@ -274,6 +290,7 @@ def create_browser_search_tool(
         task_id: str,
         stop_event: threading.Event,
         max_parallel_browsers: int = 1,
+        browser_slots: Optional[asyncio.Semaphore] = None,
 ) -> StructuredTool:
     """Factory function to create the browser search tool with necessary dependencies."""
     # Use partial to bind the dependencies that aren't part of the LLM call arguments
@@ -286,6 +303,7 @@ def create_browser_search_tool(
         browser_config=browser_config,
         stop_event=stop_event,
         max_parallel_browsers=max_parallel_browsers,
+        browser_slots=browser_slots,
     )
 
     return StructuredTool.from_function(
@@ -330,12 +348,25 @@ class DeepResearchState(TypedDict):
     stop_requested: bool
     error_message: Optional[str]
     messages: List[BaseMessage]
+    plan_cache: Optional[PlanCache]
+    progress: Optional[ResearchProgressChannel]
 
 
 # --- Langgraph Nodes ---
 
 
 def _load_previous_state(task_id: str, output_dir: str) -> Dict[str, Any]:
+    checkpoint = ResearchCheckpointStore(output_dir)
+    if checkpoint.exists():
+        try:
+            state_updates = checkpoint.load()
+            if state_updates:
+                return state_updates
+            logger.warning(f"Checkpoint {checkpoint.path} holds no plan, falling back to {PLAN_FILENAME}.")
+        except Exception as e:
+            logger.error(f"Failed to load research checkpoint {checkpoint.path}: {e}", exc_info=True)
+
+    # Legacy resume: rebuild the state from research_plan.md and search_info.json
     state_updates = {}
     plan_file = os.path.join(output_dir, PLAN_FILENAME)
     search_file = os.path.join(output_dir, SEARCH_INFO_FILENAME)
@@ -418,30 +449,36 @@ def _load_previous_state(task_id: str, output_dir: str) -> Dict[str, Any]:
     return state_updates
 
 
+def _write_file_atomic(file_path: str, write_func):
+    """Writes via a temporary file and os.replace so readers never see a partial file."""
+    tmp_path = f"{file_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        write_func(f)
+    os.replace(tmp_path, file_path)
+
+
 def _save_plan_to_md(plan: List[ResearchCategoryItem], output_dir: str):
+    """
+    Renders the plan as markdown for display, once the plan is made and when the run
+    ends; progress in between goes to the checkpoint and the progress channel.
+    """
     plan_file = os.path.join(output_dir, PLAN_FILENAME)
+
     try:
-        with open(plan_file, "w", encoding="utf-8") as f:
-            f.write(f"# Research Plan\n\n")
-            for cat_idx, category in enumerate(plan):
-                f.write(f"## {cat_idx + 1}. {category['category_name']}\n\n")
-                for task_idx, task in enumerate(category['tasks']):
-                    marker = "- [x]" if task["status"] == "completed" else "- [ ]" if task[
-                                                                                          "status"] == "pending" else "- [-]"  # [-] for failed
-                    f.write(f"  {marker} {task['task_description']}\n")
-                f.write("\n")
+        _write_file_atomic(plan_file, lambda f: f.write(render_plan_markdown(plan)))
         logger.info(f"Hierarchical research plan saved to {plan_file}")
     except Exception as e:
         logger.error(f"Failed to save research plan to {plan_file}: {e}")
 
 
 def _save_search_results_to_json(results: List[Dict[str, Any]], output_dir: str):
-    """Appends or overwrites search results to a JSON file."""
+    """
+    Writes the full search results to a JSON file. Only called once the research loop
+    is over; per-task progress is appended to the checkpoint instead.
+    """
     search_file = os.path.join(output_dir, SEARCH_INFO_FILENAME)
     try:
-        # Simple overwrite for now, could be append
-        with open(search_file, "w", encoding="utf-8") as f:
-            json.dump(results, f, indent=2, ensure_ascii=False)
+        _write_file_atomic(search_file, lambda f: json.dump(results, f, indent=2, ensure_ascii=False))
         logger.info(f"Search results saved to {search_file}")
     except Exception as e:
         logger.error(f"Failed to save search results to {search_file}: {e}")
@@ -458,6 +495,58 @@ def _save_report_to_md(report: str, output_dir: Path):
         logger.error(f"Failed to save final report to {report_file}: {e}")
 
 
+def _build_plan_from_json(parsed_plan_from_llm: Any) -> List[ResearchCategoryItem]:
+    """Validates the JSON plan returned by the LLM and converts it to plan items."""
+    new_plan: List[ResearchCategoryItem] = []
+    for cat_idx, category_data in enumerate(parsed_plan_from_llm):
+        if not isinstance(category_data,
+                          dict) or "category_name" not in category_data or "tasks" not in category_data:
+            logger.warning(f"Skipping invalid category data: {category_data}")
+            continue
+
+        tasks: List[ResearchTaskItem] = []
+        for task_idx, task_desc in enumerate(category_data["tasks"]):
+            if isinstance(task_desc, str):
+                tasks.append(
+                    ResearchTaskItem(
+                        task_description=task_desc,
+                        status="pending",
+                        queries=None,
+                        result_summary=None,
+                    )
+                )
+            else:  # Sometimes LLM puts tasks as {"task": "description"}
+                if isinstance(task_desc, dict) and "task_description" in task_desc:
+                    tasks.append(
+                        ResearchTaskItem(
+                            task_description=task_desc["task_description"],
+                            status="pending",
+                            queries=None,
+                            result_summary=None,
+                        )
+                    )
+                elif isinstance(task_desc, dict) and "task" in task_desc:  # common LLM mistake
+                    tasks.append(
+                        ResearchTaskItem(
+                            task_description=task_desc["task"],
+                            status="pending",
+                            queries=None,
+                            result_summary=None,
+                        )
+                    )
+                else:
+                    logger.warning(
+                        f"Skipping invalid task data: {task_desc} in category {category_data['category_name']}")
+
+        new_plan.append(
+            ResearchCategoryItem(
+                category_name=category_data["category_name"],
+                tasks=tasks,
+            )
+        )
+    return new_plan
+
+
 async def planning_node(state: DeepResearchState) -> Dict[str, Any]:
     logger.info("--- Entering Planning Node ---")
     if state.get("stop_requested"):
@@ -468,14 +557,44 @@ async def planning_node(state: DeepResearchState) -> Dict[str, Any]:
     topic = state["topic"]
     existing_plan = state.get("research_plan")
     output_dir = state["output_dir"]
+    progress: Optional[ResearchProgressChannel] = state.get("progress")
 
     if existing_plan and (
             state.get("current_category_index", 0) > 0 or state.get("current_task_index_in_category", 0) > 0):
         logger.info("Resuming with existing plan.")
         _save_plan_to_md(existing_plan, output_dir)  # Ensure it's saved initially
+        if progress:
+            progress.publish_plan(existing_plan)
+        checkpoint = ResearchCheckpointStore(output_dir)
+        if not checkpoint.exists():
+            # Migrate a task resumed from research_plan.md to the structured checkpoint
+            checkpoint.save_plan(
+                topic,
+                existing_plan,
+                search_results=state.get("search_results", []),
+                category_index=state.get("current_category_index", 0),
+                task_index=state.get("current_task_index_in_category", 0),
+            )
         # current_category_index and current_task_index_in_category should be set by _load_previous_state
         return {"research_plan": existing_plan}
 
+    plan_cache: Optional[PlanCache] = state.get("plan_cache")
+    model_key = get_model_key(llm)
+    if plan_cache:
+        cached_plan = plan_cache.lookup(topic, model_key)
+        if cached_plan:
+            logger.info(f"Using cached research plan with {len(cached_plan)} categories, skipping LLM planning.")
+            _save_plan_to_md(cached_plan, output_dir)
+            if progress:
+                progress.publish_plan(cached_plan)
+            ResearchCheckpointStore(output_dir).save_plan(topic, cached_plan)
+            return {
+                "research_plan": cached_plan,
+                "current_category_index": 0,
+                "current_task_index_in_category": 0,
+                "search_results": [],
+            }
+
     logger.info(f"Generating new research plan for topic: {topic}")
 
     prompt_text = f"""You are a meticulous research assistant. Your goal is to create a hierarchical research plan to thoroughly investigate the topic: "{topic}".
@@ -536,53 +655,7 @@ Ensure the output is a valid JSON array.
         logger.debug(f"LLM response for plan: {raw_content}")
         parsed_plan_from_llm = json.loads(raw_content)
 
-        new_plan: List[ResearchCategoryItem] = []
-        for cat_idx, category_data in enumerate(parsed_plan_from_llm):
-            if not isinstance(category_data,
-                              dict) or "category_name" not in category_data or "tasks" not in category_data:
-                logger.warning(f"Skipping invalid category data: {category_data}")
-                continue
-
-            tasks: List[ResearchTaskItem] = []
-            for task_idx, task_desc in enumerate(category_data["tasks"]):
-                if isinstance(task_desc, str):
-                    tasks.append(
-                        ResearchTaskItem(
-                            task_description=task_desc,
-                            status="pending",
-                            queries=None,
-                            result_summary=None,
-                        )
-                    )
-                else:  # Sometimes LLM puts tasks as {"task": "description"}
-                    if isinstance(task_desc, dict) and "task_description" in task_desc:
-                        tasks.append(
-                            ResearchTaskItem(
-                                task_description=task_desc["task_description"],
-                                status="pending",
-                                queries=None,
-                                result_summary=None,
-                            )
-                        )
-                    elif isinstance(task_desc, dict) and "task" in task_desc:  # common LLM mistake
-                        tasks.append(
-                            ResearchTaskItem(
-                                task_description=task_desc["task"],
-                                status="pending",
-                                queries=None,
-                                result_summary=None,
-                            )
-                        )
-                    else:
-                        logger.warning(
-                            f"Skipping invalid task data: {task_desc} in category {category_data['category_name']}")
-
-            new_plan.append(
-                ResearchCategoryItem(
-                    category_name=category_data["category_name"],
-                    tasks=tasks,
-                )
-            )
+        new_plan = _build_plan_from_json(parsed_plan_from_llm)
 
         if not new_plan:
             logger.error("LLM failed to generate a valid plan structure from JSON.")
@@ -590,6 +663,11 @@ Ensure the output is a valid JSON array.
 
         logger.info(f"Generated research plan with {len(new_plan)} categories.")
         _save_plan_to_md(new_plan, output_dir)  # Save the hierarchical plan
+        if progress:
+            progress.publish_plan(new_plan)
+        ResearchCheckpointStore(output_dir).save_plan(topic, new_plan)
+        if plan_cache:
+            plan_cache.put(topic, model_key, new_plan, response.content)
 
         return {
             "research_plan": new_plan,
@@ -623,6 +701,8 @@ async def research_execution_node(state: DeepResearchState) -> Dict[str, Any]:
     tools = state["tools"]
     output_dir = str(state["output_dir"])
     task_id = state["task_id"]  # For _AGENT_STOP_FLAGS
+    checkpoint = ResearchCheckpointStore(output_dir)
+    progress: Optional[ResearchProgressChannel] = state.get("progress")
 
     # This check should ideally be handled by `should_continue`
     if not plan or cat_idx >= len(plan):
@@ -690,6 +770,7 @@ async def research_execution_node(state: DeepResearchState) -> Dict[str, Any]:
         tool_results = []
         executed_tool_names = []
         current_search_results = state.get("search_results", [])  # Get existing search results
+        new_search_results = []  # Results produced by this task only, appended to the checkpoint
 
         if not isinstance(ai_response, AIMessage) or not ai_response.tool_calls:
             logger.warning(
@@ -723,8 +804,13 @@ async def research_execution_node(state: DeepResearchState) -> Dict[str, Any]:
                     if stop_event and stop_event.is_set():
                         logger.info(f"Stop requested before executing tool: {tool_name}")
                         current_task["status"] = "pending"  # Or a new "stopped" status
-                        _save_plan_to_md(plan, output_dir)
-                        return {"stop_requested": True, "research_plan": plan, "current_category_index": cat_idx,
+                        # Nothing is checkpointed: the task runs again on resume, and its partial
+                        # results would then be appended a second time
+                        if progress:
+                            progress.publish_task(cat_idx, task_idx, current_task)
+                        return {"stop_requested": True, "research_plan": plan,
+                                "search_results": current_search_results + new_search_results,
+                                "current_category_index": cat_idx,
                                 "current_task_index_in_category": task_idx}
 
                     logger.info(f"Executing tool: {tool_name}")
@@ -732,11 +818,11 @@ async def research_execution_node(state: DeepResearchState) -> Dict[str, Any]:
                     logger.info(f"Tool '{tool_name}' executed successfully.")
 
                     if tool_name == "parallel_browser_search":
-                        current_search_results.extend(tool_output)  # tool_output is List[Dict]
+                        new_search_results.extend(tool_output)  # tool_output is List[Dict]
                     else:  # For other tools, we might need specific handling or just log
                         logger.info(f"Result from tool '{tool_name}': {str(tool_output)[:200]}...")
                         # Storing non-browser results might need a different structure or key in search_results
-                        current_search_results.append(
+                        new_search_results.append(
                             {"tool_name": tool_name, "args": tool_args, "output": str(tool_output),
                              "status": "completed"})
 
@@ -746,7 +832,7 @@ async def research_execution_node(state: DeepResearchState) -> Dict[str, Any]:
                     logger.error(f"Error executing tool '{tool_name}': {e}", exc_info=True)
                     tool_results.append(
                         ToolMessage(content=f"Error executing tool {tool_name}: {e}", tool_call_id=tool_call_id))
-                    current_search_results.append(
+                    new_search_results.append(
                         {"tool_name": tool_name, "args": tool_args, "status": "failed", "error": str(e)})
 
             # After processing all tool calls for this task
@@ -767,10 +853,6 @@ async def research_execution_node(state: DeepResearchState) -> Dict[str, Any]:
                 current_task["status"] = "failed"  # Or a more specific status
                 current_task["result_summary"] = "LLM prepared for tool call but provided no tools."
 
-        # Save progress
-        _save_plan_to_md(plan, output_dir)
-        _save_search_results_to_json(current_search_results, output_dir)
-
         # Determine next indices
         next_task_idx = task_idx + 1
         next_cat_idx = cat_idx
@@ -778,6 +860,12 @@ async def research_execution_node(state: DeepResearchState) -> Dict[str, Any]:
             next_cat_idx += 1
             next_task_idx = 0
 
+        # Save progress
+        current_search_results = current_search_results + new_search_results
+        checkpoint.save_task(cat_idx, task_idx, current_task, new_search_results, next_cat_idx, next_task_idx)
+        if progress:
+            progress.publish_task(cat_idx, task_idx, current_task)
+
         updated_messages = state["messages"] + current_task_message_history + [ai_response] + tool_results
 
         return {
@@ -792,13 +880,15 @@ async def research_execution_node(state: DeepResearchState) -> Dict[str, Any]:
         logger.error(f"Unhandled error during research execution for task '{current_task['task_description']}': {e}",
                      exc_info=True)
         current_task["status"] = "failed"
-        _save_plan_to_md(plan, output_dir)
         # Determine next indices even on error to attempt to move on
         next_task_idx = task_idx + 1
         next_cat_idx = cat_idx
         if next_task_idx >= len(current_category["tasks"]):
             next_cat_idx += 1
             next_task_idx = 0
+        checkpoint.save_task(cat_idx, task_idx, current_task, None, next_cat_idx, next_task_idx)
+        if progress:
+            progress.publish_task(cat_idx, task_idx, current_task)
         return {
             "research_plan": plan,
             "current_category_index": next_cat_idx,
@@ -820,11 +910,16 @@ async def synthesis_node(state: DeepResearchState) -> Dict[str, Any]:
     search_results = state.get("search_results", [])
     output_dir = state["output_dir"]
     plan = state["research_plan"]  # Include plan for context
+    progress: Optional[ResearchProgressChannel] = state.get("progress")
+
+    _save_search_results_to_json(search_results, output_dir)
 
     if not search_results:
         logger.warning("No search results found to synthesize report.")
         report = f"# Research Report: {topic}\n\nNo information was gathered during the research process."
         _save_report_to_md(report, output_dir)
+        if progress:
+            progress.publish(REPORT, report=report)
         return {"final_report": report}
 
     logger.info(
@@ -925,6 +1020,8 @@ async def synthesis_node(state: DeepResearchState) -> Dict[str, Any]:
 
         logger.info("Successfully synthesized the final report.")
         _save_report_to_md(final_report_md, output_dir)
+        if progress:
+            progress.publish(REPORT, report=final_report_md)
         return {"final_report": final_report_md}
 
     except Exception as e:
@@ -985,19 +1082,29 @@ class DeepResearchAgent:
             llm: Any,
             browser_config: Dict[str, Any],
             mcp_server_config: Optional[Dict[str, Any]] = None,
+            plan_cache: Optional[PlanCache] = None,
+            browser_slots: Optional[asyncio.Semaphore] = None,
     ):
         """
-        Initializes the DeepSearchAgent.
+        Initializes the DeepSearchAgent. Plan and progress updates of every run are
+        published on ``self.progress``; subscribe before calling ``run`` to get them all.
 
         Args:
             llm: The Langchain compatible language model instance.
             browser_config: Configuration dictionary for the BrowserUseAgent tool.
                             Example: {"headless": True, "window_width": 1280, ...}
             mcp_server_config: Optional configuration for the MCP client.
+            plan_cache: Optional cache of research plans. When set, repeated topics
+                        reuse a cached plan instead of calling the LLM for planning.
+            browser_slots: Optional semaphore limiting the browsers open at once, shared
+                           with other agents (e.g. those of a ResearchJobQueue).
         """
         self.llm = llm
         self.browser_config = browser_config
         self.mcp_server_config = mcp_server_config
+        self.plan_cache = plan_cache
+        self.browser_slots = browser_slots
+        self.progress = ResearchProgressChannel()
         self.mcp_client = None
         self.stopped = False
         self.graph = self._compile_graph()
@@ -1020,6 +1127,7 @@ class DeepResearchAgent:
             task_id=task_id,
             stop_event=stop_event,
             max_parallel_browsers=max_parallel_browsers,
+            browser_slots=self.browser_slots,
         )
         tools += [browser_use_tool]
         # Add MCP tools if config is provided
@@ -1052,9 +1160,10 @@ class DeepResearchAgent:
         workflow = StateGraph(DeepResearchState)
 
         # Add nodes
-        workflow.add_node("plan_research", planning_node)
-        workflow.add_node("execute_research", research_execution_node)
-        workflow.add_node("synthesize_report", synthesis_node)
+        # LLM usage is accounted per node
+        workflow.add_node("plan_research", tracked_node("plan_research", planning_node))
+        workflow.add_node("execute_research", tracked_node("execute_research", research_execution_node))
+        workflow.add_node("synthesize_report", tracked_node("synthesize_report", synthesis_node))
         workflow.add_node(
             "end_run", lambda state: logger.info("--- Reached End Run Node ---") or {}
         )  # Simple end node
@@ -1121,6 +1230,7 @@ class DeepResearchAgent:
 
         self.stop_event = threading.Event()
         _AGENT_STOP_FLAGS[self.current_task_id] = self.stop_event
+        self.progress.publish(RUN_STARTED, task_id=self.current_task_id, output_dir=output_dir)
         agent_tools = await self._setup_tools(
             self.current_task_id, self.stop_event, max_parallel_browsers
         )
@@ -1139,6 +1249,8 @@ class DeepResearchAgent:
             "current_task_index_in_category": 0,
             "stop_requested": False,
             "error_message": None,
+            "plan_cache": self.plan_cache,
+            "progress": self.progress,
         }
 
         if task_id:
@@ -1165,7 +1277,9 @@ class DeepResearchAgent:
         message = None
         try:
             logger.info(f"Invoking graph execution for task {self.current_task_id}...")
-            self.runner = asyncio.create_task(self.graph.ainvoke(initial_state))
+            # Research runs in the background, interactive browser agent runs get the LLM first
+            with usage_scope(agent="deep_research", task_id=self.current_task_id), llm_priority_scope(PRIORITY_BATCH):
+                self.runner = asyncio.create_task(self.graph.ainvoke(initial_state))
             final_state = await self.runner
             logger.info(f"Graph execution finished for task {self.current_task_id}.")
 
@@ -1205,14 +1319,33 @@ class DeepResearchAgent:
             self.stop_event = None
             self.current_task_id = None
             self.runner = None  # Mark runner as finished
-            if self.mcp_client:
-                await self.mcp_client.__aexit__(None, None, None)
+            # Releases the leased MCP servers; they stay up for the next run until idle
+            await self.close_mcp_client()
+            # research_plan.md is rendered when the plan is made and here, from the final plan;
+            # the checkpoint is only replayed when the graph did not return a state
+            try:
+                final_plan = (final_state or {}).get("research_plan")
+                if not final_plan:
+                    final_plan = ResearchCheckpointStore(output_dir).load(repair=False).get("research_plan")
+                if final_plan:
+                    _save_plan_to_md(final_plan, output_dir)
+            except Exception as e:
+                logger.warning(f"Could not write the research plan for task {task_id_to_clean}: {e}")
+            self.progress.publish(RUN_FINISHED, task_id=task_id_to_clean, status=status, message=message)
+            usage_tracker = get_usage_tracker()
+            usage = usage_tracker.totals(task_id_to_clean)
+            try:
+                usage_tracker.save(task_id_to_clean, os.path.join(output_dir, "usage.json"))
+                usage_tracker.discard(task_id_to_clean)
+            except OSError as e:
+                logger.warning(f"Could not save LLM usage for task {task_id_to_clean}: {e}")
 
             # Return a result dictionary including the status and the final state if available
             return {
                 "status": status,
                 "message": message,
                 "task_id": task_id_to_clean,  # Use the stored task_id
+                "usage": usage,
                 "final_state": final_state
                 if final_state
                 else {},  # Return the final state dict
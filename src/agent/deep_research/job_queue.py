@@ -0,0 +1,260 @@
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from langchain_core.rate_limiters import InMemoryRateLimiter
+from pydantic import BaseModel, Field
+
+from src.agent.deep_research.checkpoint import ResearchCheckpointStore
+from src.agent.deep_research.deep_research_agent import DeepResearchAgent
+from src.utils.llm_scheduler import llm_rate_limit_scope
+
+logger = logging.getLogger(__name__)
+
+JOBS_FILENAME = "jobs.json"
+
+# Job statuses. "completed"/"error"/"stopped"/"cancelled"/"finished_incomplete" are final.
+QUEUED = "queued"
+RUNNING = "running"
+CANCELLED = "cancelled"
+FINAL_STATUSES = {"completed", "error", "stopped", "cancelled", "finished_incomplete"}
+
+
+class ResearchJob(BaseModel):
+    job_id: str
+    topic: str
+    status: str = QUEUED
+    max_parallel_browsers: int = 1
+    created_at: float = Field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    message: Optional[str] = None
+    attempts: int = 0
+
+
+class ResearchJobQueue:
+    """
+    Runs many DeepResearchAgent jobs unattended with a fixed pool of workers.
+
+    Each job gets its own agent from ``agent_factory`` and uses its job_id as the
+    research task_id, so a job interrupted by a restart resumes from its checkpoint.
+    The job list is persisted to ``jobs.json`` in ``save_dir`` on every status change.
+    The agents of all workers share one browser limit and, optionally, one request
+    rate limit for the LLM calls of their jobs, applied on top of the provider's.
+    Agents outside the queue are not affected by either.
+    """
+
+    def __init__(
+            self,
+            agent_factory: Callable[[], DeepResearchAgent],
+            save_dir: str = "./tmp/deep_research",
+            num_workers: int = 2,
+            max_browsers: Optional[int] = None,
+            llm_requests_per_second: Optional[float] = None,
+    ):
+        self.agent_factory = agent_factory
+        self.save_dir = save_dir
+        self.num_workers = num_workers
+        self.max_browsers = max_browsers
+        self.llm_requests_per_second = llm_requests_per_second
+        self.jobs_file = os.path.join(save_dir, JOBS_FILENAME)
+
+        self.jobs: Dict[str, ResearchJob] = {}
+        self.running_agents: Dict[str, DeepResearchAgent] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._rate_limiter: Optional[InMemoryRateLimiter] = None
+        self._browser_slots: Optional[asyncio.Semaphore] = None
+        # Plan progress per job with the checkpoint (mtime, size) it was read from
+        self._progress_cache: Dict[str, Tuple[Tuple[float, int], Dict[str, int]]] = {}
+        self._shutting_down = False
+
+        os.makedirs(save_dir, exist_ok=True)
+        self._load_jobs()
+
+    # --- Persistence ---
+
+    def _load_jobs(self):
+        if not os.path.exists(self.jobs_file):
+            return
+        try:
+            with open(self.jobs_file, "r", encoding="utf-8") as f:
+                for job_data in json.load(f):
+                    job = ResearchJob(**job_data)
+                    if job.status == RUNNING:
+                        # Interrupted by a restart: run it again, resuming from its checkpoint
+                        job.status = QUEUED
+                    self.jobs[job.job_id] = job
+            logger.info(f"Loaded {len(self.jobs)} research jobs from {self.jobs_file}")
+        except Exception as e:
+            logger.error(f"Failed to load research jobs from {self.jobs_file}: {e}", exc_info=True)
+
+    def _save_jobs(self):
+        tmp_path = f"{self.jobs_file}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump([job.model_dump() for job in self.jobs.values()], f, indent=2, ensure_ascii=False)
+            os.replace(tmp_path, self.jobs_file)
+        except Exception as e:
+            logger.error(f"Failed to save research jobs to {self.jobs_file}: {e}")
+
+    def _update_job(self, job: ResearchJob, **changes):
+        for key, value in changes.items():
+            setattr(job, key, value)
+        self._save_jobs()
+
+    # --- Lifecycle ---
+
+    async def start(self):
+        """Starts the worker pool and re-enqueues persisted jobs that have not finished."""
+        if self._workers:
+            return
+        self._shutting_down = False
+        self._browser_slots = asyncio.Semaphore(self.max_browsers) if self.max_browsers else None
+        if self.llm_requests_per_second:
+            self._rate_limiter = InMemoryRateLimiter(
+                requests_per_second=self.llm_requests_per_second,
+                check_every_n_seconds=0.1,
+                max_bucket_size=max(1, int(self.llm_requests_per_second)),
+            )
+
+        self._queue = asyncio.Queue()
+        for job in sorted(self.jobs.values(), key=lambda j: j.created_at):
+            if job.status == QUEUED:
+                self._queue.put_nowait(job.job_id)
+
+        self._workers = [
+            asyncio.create_task(self._worker(i), name=f"research-worker-{i}") for i in range(self.num_workers)
+        ]
+        logger.info(f"Research job queue started with {self.num_workers} workers.")
+
+    async def shutdown(self):
+        """Stops all running jobs and the workers. Unfinished jobs stay queued for the next start."""
+        self._shutting_down = True
+        for job_id in list(self.running_agents):
+            await self.running_agents[job_id].stop()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        for job in self.jobs.values():
+            if job.status == RUNNING:
+                job.status = QUEUED
+        self._save_jobs()
+        logger.info("Research job queue shut down.")
+
+    # --- Public API ---
+
+    def submit(self, topic: str, max_parallel_browsers: int = 1) -> str:
+        """Adds a research topic to the queue and returns its job id."""
+        job = ResearchJob(job_id=str(uuid.uuid4()), topic=topic, max_parallel_browsers=max_parallel_browsers)
+        self.jobs[job.job_id] = job
+        self._save_jobs()
+        if self._queue is not None:
+            self._queue.put_nowait(job.job_id)
+        logger.info(f"Submitted research job {job.job_id}: {topic}")
+        return job.job_id
+
+    async def cancel(self, job_id: str) -> bool:
+        """Cancels a queued job or stops a running one. Returns False if the job is unknown or finished."""
+        job = self.jobs.get(job_id)
+        if not job or job.status in FINAL_STATUSES:
+            return False
+        if job.status == QUEUED:
+            self._update_job(job, status=CANCELLED, finished_at=time.time(), message="Cancelled before start.")
+        elif job_id in self.running_agents:
+            await self.running_agents[job_id].stop()
+        return True
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Returns the job status together with its plan progress."""
+        job = self.jobs.get(job_id)
+        if not job:
+            return None
+        return {**job.model_dump(), "progress": self._get_progress(job)}
+
+    def list_jobs(self, status: Optional[str] = None) -> List[Dict[str, Any]]:
+        return [
+            self.get_job(job.job_id)
+            for job in sorted(self.jobs.values(), key=lambda j: j.created_at)
+            if status is None or job.status == status
+        ]
+
+    def _get_progress(self, job: ResearchJob) -> Dict[str, int]:
+        progress = {"total_tasks": 0, "completed_tasks": 0, "failed_tasks": 0}
+        if job.status == QUEUED and not job.attempts:
+            return progress
+        store = ResearchCheckpointStore(os.path.join(self.save_dir, job.job_id))
+        try:
+            stat = os.stat(store.path)
+        except OSError:
+            return progress
+        # The checkpoint is append-only, so an unchanged mtime and size means unchanged progress
+        version = (stat.st_mtime, stat.st_size)
+        cached = self._progress_cache.get(job.job_id)
+        if cached and cached[0] == version:
+            return dict(cached[1])
+        try:
+            state = store.load(repair=False)
+        except Exception as e:
+            logger.debug(f"Could not read checkpoint of job {job.job_id}: {e}")
+            return progress
+        for category in state.get("research_plan", []):
+            for task in category["tasks"]:
+                progress["total_tasks"] += 1
+                if task["status"] == "completed":
+                    progress["completed_tasks"] += 1
+                elif task["status"] == "failed":
+                    progress["failed_tasks"] += 1
+        self._progress_cache[job.job_id] = (version, dict(progress))
+        return progress
+
+    # --- Workers ---
+
+    async def _worker(self, worker_idx: int):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                job = self.jobs.get(job_id)
+                if job and job.status == QUEUED:
+                    await self._run_job(job, worker_idx)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"[Worker {worker_idx}] Unhandled error in job {job_id}: {e}", exc_info=True)
+            finally:
+                self._queue.task_done()
+
+    async def _run_job(self, job: ResearchJob, worker_idx: int):
+        logger.info(f"[Worker {worker_idx}] Starting research job {job.job_id}: {job.topic}")
+        self._update_job(job, status=RUNNING, started_at=time.time(), attempts=job.attempts + 1)
+
+        agent = self.agent_factory()
+        agent.browser_slots = self._browser_slots
+        self.running_agents[job.job_id] = agent
+        try:
+            # The queue's rate applies on top of the provider limits of the (shared) model
+            with llm_rate_limit_scope(self._rate_limiter):
+                result = await agent.run(
+                    topic=job.topic,
+                    task_id=job.job_id,
+                    save_dir=self.save_dir,
+                    max_parallel_browsers=job.max_parallel_browsers,
+                )
+            if self._shutting_down:
+                # Interrupted by shutdown, not by the user: resume on the next start
+                self._update_job(job, status=QUEUED)
+                return
+            self._update_job(
+                job,
+                status=result.get("status", "error"),
+                message=result.get("message"),
+                finished_at=time.time(),
+            )
+            logger.info(f"[Worker {worker_idx}] Research job {job.job_id} finished with status {job.status}")
+        finally:
+            self.running_agents.pop(job.job_id, None)
@@ -0,0 +1,185 @@
+import copy
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_topic(topic: str) -> str:
+    """Lower-cases the topic, drops punctuation and collapses whitespace."""
+    topic = re.sub(r"[^\w\s]", " ", topic.lower())
+    return " ".join(topic.split())
+
+
+def get_model_key(llm: Any) -> str:
+    """Returns a stable identifier of the model behind a LangChain chat model."""
+    return str(getattr(llm, "model_name", None) or getattr(llm, "model", None) or llm.__class__.__name__)
+
+
+class PlanCache:
+    """
+    On-disk cache of validated research plans, keyed by normalised topic and model.
+
+    Every entry is stored as its own JSON file next to the raw LLM response it was
+    parsed from. Entries older than ``max_age_seconds`` are treated as missing.
+    With ``reuse_similar`` enabled, a plan generated for a sufficiently similar topic
+    (token Jaccard similarity >= ``similarity_threshold``) is reused as a skeleton.
+    """
+
+    def __init__(
+            self,
+            cache_dir: str = "./tmp/deep_research/plan_cache",
+            max_age_seconds: Optional[float] = 7 * 24 * 3600,
+            reuse_similar: bool = False,
+            similarity_threshold: float = 0.8,
+    ):
+        self.cache_dir = cache_dir
+        self.max_age_seconds = max_age_seconds
+        self.reuse_similar = reuse_similar
+        self.similarity_threshold = similarity_threshold
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _entry_path(self, topic: str, model: str) -> str:
+        key = hashlib.sha256(f"{model}\n{normalize_topic(topic)}".encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _read_entry(self, path: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"Ignoring unreadable plan cache entry {path}: {e}")
+            return None
+        if self.max_age_seconds is not None and time.time() - entry.get("created_at", 0) > self.max_age_seconds:
+            return None
+        return entry
+
+    def get(self, topic: str, model: str) -> Optional[List[Dict[str, Any]]]:
+        """Returns a fresh copy of the cached plan for this topic and model, or None."""
+        path = self._entry_path(topic, model)
+        if not os.path.exists(path):
+            return None
+        entry = self._read_entry(path)
+        if not entry:
+            return None
+        logger.info(f"Plan cache hit for topic '{topic}' ({model}).")
+        return _reset_plan(entry["plan"])
+
+    def get_similar(self, topic: str, model: str) -> Optional[List[Dict[str, Any]]]:
+        """
+        Returns the plan of the most similar cached topic for this model as a skeleton,
+        with the old topic text replaced by the new one, or None if nothing is close enough.
+        """
+        tokens = set(normalize_topic(topic).split())
+        if not tokens:
+            return None
+
+        best_entry, best_score = None, 0.0
+        for file_name in os.listdir(self.cache_dir):
+            if not file_name.endswith(".json"):
+                continue
+            entry = self._read_entry(os.path.join(self.cache_dir, file_name))
+            if not entry or entry.get("model") != model:
+                continue
+            cached_tokens = set(entry.get("normalized_topic", "").split())
+            union = tokens | cached_tokens
+            score = len(tokens & cached_tokens) / len(union) if union else 0.0
+            if score > best_score:
+                best_entry, best_score = entry, score
+
+        if not best_entry or best_score < self.similarity_threshold:
+            return None
+
+        logger.info(
+            f"Reusing plan skeleton of similar topic '{best_entry['topic']}' "
+            f"(similarity {best_score:.2f}) for '{topic}'."
+        )
+        plan = _reset_plan(best_entry["plan"])
+        old_topic = best_entry["topic"]
+        if old_topic and old_topic != topic:
+            pattern = re.compile(re.escape(old_topic), re.IGNORECASE)
+            for category in plan:
+                for task in category["tasks"]:
+                    task["task_description"] = pattern.sub(topic, task["task_description"])
+        return plan
+
+    def lookup(self, topic: str, model: str) -> Optional[List[Dict[str, Any]]]:
+        """Exact lookup, falling back to a similar topic's skeleton when enabled."""
+        plan = self.get(topic, model)
+        if plan is None and self.reuse_similar:
+            plan = self.get_similar(topic, model)
+        return plan
+
+    def put(self, topic: str, model: str, plan: List[Dict[str, Any]], raw_response: str):
+        """Stores a validated plan together with the raw LLM response it was parsed from."""
+        entry = {
+            "topic": topic,
+            "normalized_topic": normalize_topic(topic),
+            "model": model,
+            "created_at": time.time(),
+            "plan": plan,
+            "raw_response": raw_response,
+        }
+        path = self._entry_path(topic, model)
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(entry, f, indent=2, ensure_ascii=False)
+            os.replace(tmp_path, path)
+            logger.info(f"Cached research plan for topic '{topic}' ({model}).")
+        except Exception as e:
+            logger.error(f"Failed to write plan cache entry {path}: {e}")
+
+    def invalidate(self, topic: str, model: Optional[str] = None) -> int:
+        """
+        Removes the cached plan for a topic. If model is None, entries of all models
+        for this topic are removed. Returns the number of removed entries.
+        """
+        if model is not None:
+            paths = [self._entry_path(topic, model)]
+        else:
+            normalized = normalize_topic(topic)
+            paths = []
+            for file_name in os.listdir(self.cache_dir):
+                if not file_name.endswith(".json"):
+                    continue
+                path = os.path.join(self.cache_dir, file_name)
+                try:
+                    with open(path, "r", encoding="utf-8") as f:
+                        if json.load(f).get("normalized_topic") == normalized:
+                            paths.append(path)
+                except (OSError, json.JSONDecodeError):
+                    continue
+
+        removed = 0
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+                removed += 1
+        logger.info(f"Invalidated {removed} cached plan(s) for topic '{topic}'.")
+        return removed
+
+    def clear(self) -> int:
+        """Removes all cached plans. Returns the number of removed entries."""
+        removed = 0
+        for file_name in os.listdir(self.cache_dir):
+            if file_name.endswith(".json"):
+                os.remove(os.path.join(self.cache_dir, file_name))
+                removed += 1
+        return removed
+
+
+def _reset_plan(plan: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Returns a deep copy of the plan with every task back to pending."""
+    plan = copy.deepcopy(plan)
+    for category in plan:
+        for task in category["tasks"]:
+            task["status"] = "pending"
+            task["queries"] = None
+            task["result_summary"] = None
+    return plan
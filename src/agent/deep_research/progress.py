@@ -0,0 +1,63 @@
+import asyncio
+import copy
+import logging
+from typing import Any, Dict, List
+
+logger = logging.getLogger(__name__)
+
+# Event types published by DeepResearchAgent
+RUN_STARTED = "run_started"
+PLAN = "plan"
+TASK = "task"
+REPORT = "report"
+RUN_FINISHED = "run_finished"
+
+
+class ResearchProgressChannel:
+    """
+    In-process fan-out of plan and progress events of a ``DeepResearchAgent``.
+
+    The agent publishes the full plan once (``plan``) and afterwards only the plan
+    item that changed (``task``), so subscribers never have to re-read
+    ``research_plan.md``. Publishing never blocks the research graph; every
+    subscriber gets its own queue and receives events from the moment it subscribed.
+    """
+
+    def __init__(self):
+        self._subscribers: List[asyncio.Queue] = []
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue()
+        self._subscribers.append(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        if queue in self._subscribers:
+            self._subscribers.remove(queue)
+
+    def publish(self, event_type: str, **data: Any):
+        if not self._subscribers:
+            return
+        # Plan items are mutated in place by the graph, so subscribers get a snapshot
+        event = {"type": event_type, **copy.deepcopy(data)}
+        for queue in self._subscribers:
+            queue.put_nowait(event)
+
+    def publish_plan(self, plan: List[Dict[str, Any]]):
+        self.publish(PLAN, plan=plan)
+
+    def publish_task(self, category_index: int, task_index: int, task: Dict[str, Any]):
+        self.publish(TASK, category_index=category_index, task_index=task_index, task=task)
+
+
+def render_plan_markdown(plan: List[Dict[str, Any]]) -> str:
+    """Renders a hierarchical research plan as the markdown checklist shown in the UI."""
+    lines = ["# Research Plan\n"]
+    for cat_idx, category in enumerate(plan):
+        lines.append(f"## {cat_idx + 1}. {category['category_name']}\n")
+        for task in category["tasks"]:
+            marker = "- [x]" if task["status"] == "completed" else "- [ ]" if task[
+                                                                                  "status"] == "pending" else "- [-]"  # [-] for failed
+            lines.append(f"  {marker} {task['task_description']}")
+        lines.append("")
+    return "\n".join(lines) + "\n"
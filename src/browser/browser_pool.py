@@ -0,0 +1,65 @@
+import asyncio
+import logging
+from typing import Any, Dict, Optional, Tuple
+
+from .custom_browser import CustomBrowser, create_custom_browser
+
+logger = logging.getLogger(__name__)
+
+
+class BrowserPool:
+    """
+    Shares browser processes between WebUI sessions.
+
+    Sessions asking for the same browser settings get the same ``CustomBrowser`` and
+    open their own ``BrowserContext`` on it, so cookies, tabs and downloads stay
+    isolated while only one Chromium process runs per distinct configuration.
+    A browser is closed when its last session releases it.
+    """
+
+    def __init__(self):
+        self._browsers: Dict[Tuple, CustomBrowser] = {}
+        self._ref_counts: Dict[int, int] = {}
+        self._lock = asyncio.Lock()
+
+    @staticmethod
+    def _make_key(browser_kwargs: Dict[str, Any]) -> Tuple:
+        return tuple(sorted(browser_kwargs.items()))
+
+    async def acquire(self, **browser_kwargs) -> CustomBrowser:
+        """Returns a running browser for these ``create_custom_browser`` arguments, launching it if needed."""
+        key = self._make_key(browser_kwargs)
+        async with self._lock:
+            browser = self._browsers.get(key)
+            if browser is None:
+                logger.info("Launching new pooled browser instance.")
+                browser = create_custom_browser(**browser_kwargs)
+                # Launch under the lock so concurrent sessions do not start two processes
+                await browser.get_playwright_browser()
+                self._browsers[key] = browser
+            self._ref_counts[id(browser)] = self._ref_counts.get(id(browser), 0) + 1
+            return browser
+
+    async def release(self, browser: Optional[CustomBrowser]):
+        """Drops one reference to the browser and closes it once no session uses it."""
+        if browser is None:
+            return
+        async with self._lock:
+            count = self._ref_counts.get(id(browser), 0) - 1
+            if count > 0:
+                self._ref_counts[id(browser)] = count
+                return
+            self._ref_counts.pop(id(browser), None)
+            for key, pooled in list(self._browsers.items()):
+                if pooled is browser:
+                    del self._browsers[key]
+        logger.info("Closing pooled browser, no sessions left.")
+        await browser.close()
+
+    async def close(self):
+        async with self._lock:
+            browsers = list(self._browsers.values())
+            self._browsers.clear()
+            self._ref_counts.clear()
+        for browser in browsers:
+            await browser.close()
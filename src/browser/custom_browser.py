@@ -24,7 +24,11 @@ from browser_use.browser.chrome import (
 from browser_use.browser.context import BrowserContext, BrowserContextConfig
 from browser_use.browser.utils.screen_resolution import get_screen_resolution, get_window_adjustments
 from browser_use.utils import time_execution_async
+import os
 import socket
+from typing import Optional
+
+from browser_use.browser.browser import BrowserConfig
 
 from .custom_context import CustomBrowserContext
 
@@ -107,3 +111,42 @@ class CustomBrowser(Browser):
             handle_sigint=False,
         )
         return browser
+
+
+def create_custom_browser(
+        headless: bool = False,
+        disable_security: bool = False,
+        use_own_browser: bool = False,
+        browser_binary_path: Optional[str] = None,
+        browser_user_data_dir: Optional[str] = None,
+        window_w: int = 1280,
+        window_h: int = 1100,
+        cdp_url: Optional[str] = None,
+        wss_url: Optional[str] = None,
+) -> CustomBrowser:
+    """Builds a CustomBrowser from the browser settings used by the WebUI and the API server."""
+    extra_args = []
+    if use_own_browser:
+        browser_binary_path = os.getenv("BROWSER_PATH", None) or browser_binary_path
+        if browser_binary_path == "":
+            browser_binary_path = None
+        browser_user_data = browser_user_data_dir or os.getenv("BROWSER_USER_DATA", None)
+        if browser_user_data:
+            extra_args += [f"--user-data-dir={browser_user_data}"]
+    else:
+        browser_binary_path = None
+
+    return CustomBrowser(
+        config=BrowserConfig(
+            headless=headless,
+            disable_security=disable_security,
+            browser_binary_path=browser_binary_path,
+            extra_browser_args=extra_args,
+            wss_url=wss_url,
+            cdp_url=cdp_url,
+            new_context_config=BrowserContextConfig(
+                window_width=window_w,
+                window_height=window_h,
+            )
+        )
+    )
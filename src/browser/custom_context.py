@@ -8,6 +8,9 @@ from playwright.async_api import Browser as PlaywrightBrowser
 from playwright.async_api import BrowserContext as PlaywrightBrowserContext
 from typing import Optional
 from browser_use.browser.context import BrowserContextState
+from browser_use.browser.views import BrowserState
+
+from src.utils.step_profiler import profile_phase
 
 logger = logging.getLogger(__name__)
 
@@ -20,3 +23,11 @@ class CustomBrowserContext(BrowserContext):
             state: Optional[BrowserContextState] = None,
     ):
         super(CustomBrowserContext, self).__init__(browser=browser, config=config, state=state)
+
+    async def get_state(self, cache_clickable_elements_hashes: bool) -> BrowserState:
+        with profile_phase("get_state"):
+            return await super().get_state(cache_clickable_elements_hashes)
+
+    async def take_screenshot(self, full_page: bool = False) -> str:
+        with profile_phase("screenshot"):
+            return await super().take_screenshot(full_page)
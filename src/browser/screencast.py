@@ -0,0 +1,210 @@
+import asyncio
+import base64
+import hashlib
+import logging
+import time
+from typing import AsyncGenerator, Optional
+
+from browser_use.browser.context import BrowserContext
+
+logger = logging.getLogger(__name__)
+
+MJPEG_BOUNDARY = "frame"
+
+
+class BrowserScreencast:
+    """
+    Live view of the agent's current page using CDP ``Page.startScreencast``.
+
+    Chrome pushes JPEG frames only when the page repaints, so nothing is captured
+    while the page is idle. Frames arriving faster than ``max_fps`` and frames
+    identical to the previous one are dropped. With ``adaptive`` enabled, JPEG
+    quality and then resolution are lowered while viewers cannot keep up and
+    raised again once they do. Follows the agent when it switches tabs.
+    """
+
+    def __init__(
+            self,
+            browser_context: BrowserContext,
+            max_fps: float = 5.0,
+            quality: int = 60,
+            min_quality: int = 20,
+            max_width: int = 1280,
+            max_height: int = 1100,
+            adaptive: bool = True,
+    ):
+        self.browser_context = browser_context
+        self.max_fps = max_fps
+        self.quality = quality
+        self.max_quality = quality
+        self.min_quality = min_quality
+        self.max_width = max_width
+        self.max_height = max_height
+        self.adaptive = adaptive
+        self.scale = 1.0
+
+        self.frame: Optional[bytes] = None
+        self.frame_id = 0
+        self.frames_received = 0
+        self.frames_dropped = 0
+
+        self._frame_hash: Optional[bytes] = None
+        self._last_frame_time = 0.0
+        self._pending_frame: Optional[str] = None
+        self._new_frame = asyncio.Condition()
+        self._page = None
+        self._cdp_session = None
+        self._watch_task: Optional[asyncio.Task] = None
+        self._slow_viewers = 0
+        self._fast_viewers = 0
+
+    async def start(self):
+        if self._watch_task is None:
+            self._watch_task = asyncio.create_task(self._follow_agent_page())
+
+    async def stop(self):
+        if self._watch_task:
+            self._watch_task.cancel()
+            await asyncio.gather(self._watch_task, return_exceptions=True)
+            self._watch_task = None
+        await self._stop_cdp_screencast()
+        async with self._new_frame:
+            self._new_frame.notify_all()
+
+    @property
+    def running(self) -> bool:
+        return self._watch_task is not None
+
+    async def _follow_agent_page(self):
+        """Restarts the screencast whenever the agent moves to another tab."""
+        while True:
+            page = self.browser_context.agent_current_page
+            if page is not None and page is not self._page and not page.is_closed():
+                await self._start_cdp_screencast(page)
+            await asyncio.sleep(1.0)
+
+    async def _start_cdp_screencast(self, page):
+        await self._stop_cdp_screencast()
+        try:
+            self._cdp_session = await page.context.new_cdp_session(page)
+            self._cdp_session.on("Page.screencastFrame", self._on_frame)
+            await self._cdp_session.send("Page.startScreencast", {
+                "format": "jpeg",
+                "quality": self.quality,
+                "maxWidth": int(self.max_width * self.scale),
+                "maxHeight": int(self.max_height * self.scale),
+            })
+            self._page = page
+            logger.debug(f"Screencast started (quality={self.quality}, scale={self.scale}).")
+        except Exception as e:
+            logger.warning(f"Could not start screencast: {e}")
+            self._cdp_session = None
+            self._page = None
+
+    async def _stop_cdp_screencast(self):
+        cdp_session, self._cdp_session, self._page = self._cdp_session, None, None
+        if cdp_session:
+            try:
+                await cdp_session.send("Page.stopScreencast")
+                await cdp_session.detach()
+            except Exception as e:
+                logger.debug(f"Error stopping screencast: {e}")
+
+    def _on_frame(self, params: dict):
+        cdp_session = self._cdp_session
+        if cdp_session:
+            # Chrome sends the next frame only after the previous one is acknowledged
+            asyncio.create_task(self._ack(cdp_session, params["sessionId"]))
+        self.frames_received += 1
+
+        wait = 1.0 / self.max_fps - (time.monotonic() - self._last_frame_time)
+        if wait > 0:
+            # Over the frame-rate cap: keep only the newest frame and publish it once the
+            # interval has passed, so the final state of the page is never lost
+            if self._pending_frame is not None:
+                self.frames_dropped += 1
+            else:
+                asyncio.get_running_loop().call_later(wait, self._publish_pending)
+            self._pending_frame = params["data"]
+            return
+        self._publish(params["data"])
+
+    def _publish_pending(self):
+        data, self._pending_frame = self._pending_frame, None
+        if data is not None:
+            self._publish(data)
+
+    def _publish(self, data_b64: str):
+        data = base64.b64decode(data_b64)
+        frame_hash = hashlib.md5(data).digest()
+        if frame_hash == self._frame_hash:
+            self.frames_dropped += 1
+            return
+
+        self._last_frame_time = time.monotonic()
+        self._frame_hash = frame_hash
+        self.frame = data
+        self.frame_id += 1
+        asyncio.create_task(self._notify())
+
+    @staticmethod
+    async def _ack(cdp_session, session_id: int):
+        try:
+            await cdp_session.send("Page.screencastFrameAck", {"sessionId": session_id})
+        except Exception:
+            pass
+
+    async def _notify(self):
+        async with self._new_frame:
+            self._new_frame.notify_all()
+
+    async def _adapt_quality(self, skipped_frames: int):
+        """
+        Lowers quality, then resolution, after viewers repeatedly miss frames and
+        restores them in reverse order once viewers keep up again.
+        """
+        if skipped_frames:
+            self._slow_viewers += 1
+            self._fast_viewers = 0
+        else:
+            self._fast_viewers += 1
+            self._slow_viewers = 0
+
+        quality, scale = self.quality, self.scale
+        if self._slow_viewers >= 3:
+            if quality > self.min_quality:
+                quality = max(self.min_quality, quality - 10)
+            else:
+                scale = max(0.25, scale / 2)
+        elif self._fast_viewers >= 30:
+            if scale < 1.0:
+                scale = min(1.0, scale * 2)
+            else:
+                quality = min(self.max_quality, quality + 10)
+        if (quality, scale) != (self.quality, self.scale):
+            self._slow_viewers = self._fast_viewers = 0
+            self.quality, self.scale = quality, scale
+            if self._page is not None:
+                await self._start_cdp_screencast(self._page)
+
+    async def frames(self) -> AsyncGenerator[bytes, None]:
+        """Yields each new JPEG frame until the screencast is stopped."""
+        last_id = 0
+        while self.running:
+            async with self._new_frame:
+                await self._new_frame.wait_for(lambda: self.frame_id != last_id or not self.running)
+            if not self.running:
+                break
+            if self.adaptive and last_id:
+                await self._adapt_quality(self.frame_id - last_id - 1)
+            last_id = self.frame_id
+            yield self.frame
+
+    async def mjpeg_stream(self) -> AsyncGenerator[bytes, None]:
+        """Frames as a multipart/x-mixed-replace body that an <img> tag can display directly."""
+        async for frame in self.frames():
+            yield (
+                    f"--{MJPEG_BOUNDARY}\r\nContent-Type: image/jpeg\r\nContent-Length: {len(frame)}\r\n\r\n".encode()
+                    + frame
+                    + b"\r\n"
+            )
@@ -25,9 +25,11 @@ import inspect
 import asyncio
 import os
 from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.tools import ToolException
 from browser_use.agent.views import ActionModel, ActionResult
 
-from src.utils.mcp_client import create_tool_param_model, setup_mcp_client_and_tools
+from src.utils.mcp_client import create_tool_param_model, rank_mcp_tools, setup_mcp_client_and_tools, short_description
+from src.utils.step_profiler import profile_phase
 
 from browser_use.utils import time_execution_sync
 
@@ -35,6 +37,13 @@ logger = logging.getLogger(__name__)
 
 Context = TypeVar('Context')
 
+# Lazily exposed MCP tools loaded up front when they match the task
+MCP_TOOLS_PRESELECTED = 5
+
+
+class LoadMcpToolsAction(BaseModel):
+    tool_names: list[str]
+
 
 class CustomController(Controller):
     def __init__(self, exclude_actions: list[str] = [],
@@ -47,6 +56,9 @@ class CustomController(Controller):
         self.ask_assistant_callback = ask_assistant_callback
         self.mcp_client = None
         self.mcp_server_config = None
+        # Every tool of the connected MCP servers by action name; registered actions are a subset in lazy mode
+        self.mcp_tools: Dict[str, Any] = {}
+        self.lazy_mcp_tools = False
 
     def _register_custom_actions(self):
         """Register all custom browser actions"""
@@ -121,38 +133,89 @@ class CustomController(Controller):
         """Execute an action"""
 
         try:
-            for action_name, params in action.model_dump(exclude_unset=True).items():
-                if params is not None:
-                    if action_name.startswith("mcp"):
-                        # this is a mcp tool
-                        logger.debug(f"Invoke MCP tool: {action_name}")
-                        mcp_tool = self.registry.registry.actions.get(action_name).function
-                        result = await mcp_tool.ainvoke(params)
-                    else:
-                        result = await self.registry.execute_action(
-                            action_name,
-                            params,
-                            browser=browser_context,
-                            page_extraction_llm=page_extraction_llm,
-                            sensitive_data=sensitive_data,
-                            available_file_paths=available_file_paths,
-                            context=context,
-                        )
-
-                    if isinstance(result, str):
-                        return ActionResult(extracted_content=result)
-                    elif isinstance(result, ActionResult):
-                        return result
-                    elif result is None:
-                        return ActionResult()
-                    else:
-                        raise ValueError(f'Invalid action result type: {type(result)} of {result}')
-            return ActionResult()
+            with profile_phase("actions"):
+                for action_name, params in action.model_dump(exclude_unset=True).items():
+                    if params is not None:
+                        if action_name.startswith("mcp"):
+                            # this is a mcp tool
+                            logger.debug(f"Invoke MCP tool: {action_name}")
+                            result = await self._invoke_mcp_tool(action_name, params)
+                        else:
+                            result = await self.registry.execute_action(
+                                action_name,
+                                params,
+                                browser=browser_context,
+                                page_extraction_llm=page_extraction_llm,
+                                sensitive_data=sensitive_data,
+                                available_file_paths=available_file_paths,
+                                context=context,
+                            )
+
+                        if isinstance(result, str):
+                            return ActionResult(extracted_content=result)
+                        elif isinstance(result, ActionResult):
+                            return result
+                        elif result is None:
+                            return ActionResult()
+                        else:
+                            raise ValueError(f'Invalid action result type: {type(result)} of {result}')
+                return ActionResult()
         except Exception as e:
             raise e
 
-    async def setup_mcp_client(self, mcp_server_config: Optional[Dict[str, Any]] = None):
+    async def _invoke_mcp_tool(self, action_name: str, params: Dict[str, Any]) -> Union[str, ActionResult]:
+        mcp_tool = self.registry.registry.actions.get(action_name).function
+        try:
+            result = await mcp_tool.ainvoke(params)
+        except ToolException as e:
+            # Timeouts and tool errors are reported to the agent like a failed browser action
+            return ActionResult(error=f"{action_name} failed: {e}")
+        if isinstance(result, list):
+            # One string per text block of the tool's output
+            return "\n".join(str(part) for part in result)
+        return result
+
+    @staticmethod
+    def _action_name(action: ActionModel) -> Optional[str]:
+        return next((name for name, params in action.model_dump(exclude_unset=True).items() if params is not None),
+                    None)
+
+    def _read_only_mcp_tools(self, server_name: str) -> set[str]:
+        servers = (self.mcp_server_config or {}).get("mcpServers", self.mcp_server_config or {})
+        return set((servers.get(server_name) or {}).get("read_only_tools") or [])
+
+    def parallel_mcp_actions(self, actions: list[ActionModel], start: int = 0) -> list[ActionModel]:
+        """
+        The run of MCP actions from ``start`` that can execute concurrently. MCP
+        tools do not touch the page, so actions on different servers run together.
+        Several actions on one server only run together if all their tools are
+        listed in the server's ``read_only_tools`` config; otherwise the run ends
+        there, so calls with side effects keep their order.
+        """
+        run = []
+        server_actions: Dict[str, list[str]] = {}
+        for action in actions[start:]:
+            name = self._action_name(action)
+            if not name or not name.startswith("mcp.") or name not in self.mcp_tools:
+                break
+            _, server_name, tool_name = name.split(".", 2)
+            previous = server_actions.setdefault(server_name, [])
+            if previous:
+                read_only = self._read_only_mcp_tools(server_name)
+                if any(tool not in read_only for tool in [*previous, tool_name]):
+                    break
+            previous.append(tool_name)
+            run.append(action)
+        return run
+
+    async def setup_mcp_client(self, mcp_server_config: Optional[Dict[str, Any]] = None, lazy: bool = False):
+        """
+        Connects to the MCP servers and registers their tools. With ``lazy``, only
+        tool names and short descriptions are shown to the agent until it loads the
+        tools it needs (see ``register_mcp_tools``).
+        """
         self.mcp_server_config = mcp_server_config
+        self.lazy_mcp_tools = lazy
         if self.mcp_server_config:
             self.mcp_client = await setup_mcp_client_and_tools(self.mcp_server_config)
             self.register_mcp_tools()
@@ -160,23 +223,73 @@ class CustomController(Controller):
     def register_mcp_tools(self):
         """
         Register the MCP tools used by this controller.
+
+        Every registered tool's parameter schema is sent to the LLM at each step. In
+        lazy mode a single ``load_mcp_tools`` action lists the tools instead, and a
+        tool is registered once the agent loads it or ``select_mcp_tools`` picks it
+        for the task.
         """
-        if self.mcp_client:
-            for server_name in self.mcp_client.server_name_to_tools:
-                for tool in self.mcp_client.server_name_to_tools[server_name]:
-                    tool_name = f"mcp.{server_name}.{tool.name}"
-                    self.registry.registry.actions[tool_name] = RegisteredAction(
-                        name=tool_name,
-                        description=tool.description,
-                        function=tool,
-                        param_model=create_tool_param_model(tool),
-                    )
-                    logger.info(f"Add mcp tool: {tool_name}")
-                logger.debug(
-                    f"Registered {len(self.mcp_client.server_name_to_tools[server_name])} mcp tools for {server_name}")
-        else:
+        if not self.mcp_client:
             logger.warning(f"MCP client not started.")
+            return
+        # Sorted, so the action schema sent with every step is identical across sessions and provider
+        # prompt caches keep matching whatever order the servers list their tools in
+        self.mcp_tools = {
+            f"mcp.{server_name}.{tool.name}": tool
+            for server_name in sorted(self.mcp_client.server_name_to_tools)
+            for tool in sorted(self.mcp_client.server_name_to_tools[server_name], key=lambda t: t.name)
+        }
+        if self.lazy_mcp_tools:
+            self._register_mcp_tool_loader()
+            logger.info(f"Exposing {len(self.mcp_tools)} mcp tools on demand")
+        else:
+            self.materialize_mcp_tools(list(self.mcp_tools))
+
+    def materialize_mcp_tools(self, tool_names: list[str]) -> list[str]:
+        """Registers the named MCP tools as actions with their full parameter schema; returns the known names."""
+        loaded = []
+        for tool_name in tool_names:
+            tool = self.mcp_tools.get(tool_name)
+            if tool is None:
+                continue
+            if tool_name not in self.registry.registry.actions:
+                self.registry.registry.actions[tool_name] = RegisteredAction(
+                    name=tool_name,
+                    description=tool.description,
+                    function=tool,
+                    param_model=create_tool_param_model(tool),
+                )
+                logger.info(f"Add mcp tool: {tool_name}")
+            loaded.append(tool_name)
+        return loaded
+
+    def select_mcp_tools(self, task: str, limit: int = MCP_TOOLS_PRESELECTED) -> list[str]:
+        """In lazy mode, registers the MCP tools most relevant to ``task`` so the agent can use them right away."""
+        if not self.lazy_mcp_tools:
+            return []
+        return self.materialize_mcp_tools(rank_mcp_tools(task, self.mcp_tools)[:limit])
+
+    def _register_mcp_tool_loader(self):
+        catalog = "\n".join(f"- {name}: {short_description(tool.description)}" for name, tool in self.mcp_tools.items())
+
+        @self.registry.action(
+            "Load MCP tools by their exact names before using them; loaded tools become available as actions "
+            f"from the next step. Available MCP tools:\n{catalog}",
+            param_model=LoadMcpToolsAction,
+        )
+        async def load_mcp_tools(params: LoadMcpToolsAction):
+            loaded = self.materialize_mcp_tools(params.tool_names)
+            unknown = [name for name in params.tool_names if name not in loaded]
+            if not loaded:
+                return ActionResult(error=f"Unknown MCP tools: {', '.join(unknown)}")
+            # Raw tool calling only sees the actions described in the system prompt, so describe them here too
+            descriptions = "\n".join(self.registry.registry.actions[name].prompt_description() for name in loaded)
+            msg = f"Loaded MCP tools:\n{descriptions}"
+            if unknown:
+                msg += f"\nUnknown MCP tools: {', '.join(unknown)}"
+            return ActionResult(extracted_content=msg, include_in_memory=True)
 
     async def close_mcp_client(self):
         if self.mcp_client:
             await self.mcp_client.__aexit__(None, None, None)
+            self.mcp_client = None
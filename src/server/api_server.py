@@ -0,0 +1,234 @@
+import argparse
+import json
+import logging
+import os
+import secrets
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Optional
+
+from fastapi import Depends, FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field, field_validator
+
+from src.browser.screencast import MJPEG_BOUNDARY
+from src.server.task_runs import LLMFactory, TaskRunManager
+from src.utils.mcp_manager import get_mcp_manager
+
+logger = logging.getLogger(__name__)
+
+LOCAL_HOSTS = {"127.0.0.1", "localhost", "::1"}
+
+# Settings that write files, launch programs or attach to other browsers are configured
+# on the server (see ``create_app``) and rejected when a client sends them
+SERVER_ONLY_AGENT_SETTINGS = {"mcp_server_config"}
+SERVER_ONLY_BROWSER_SETTINGS = {
+    "browser_binary_path", "browser_user_data_dir", "use_own_browser", "cdp_url", "wss_url",
+    "save_agent_history_path", "save_recording_path", "save_trace_path", "save_download_path",
+}
+
+
+def _reject_server_only(settings: Dict[str, Any], server_only: set) -> Dict[str, Any]:
+    forbidden = sorted(server_only.intersection(settings))
+    if forbidden:
+        raise ValueError(f"{', '.join(forbidden)} can only be configured on the server")
+    return settings
+
+
+class _TaskSettings(BaseModel):
+    agent_settings: Dict[str, Any] = Field(default_factory=dict)
+    browser_settings: Dict[str, Any] = Field(default_factory=dict)
+
+    @field_validator("agent_settings")
+    @classmethod
+    def _check_agent_settings(cls, value: Dict[str, Any]) -> Dict[str, Any]:
+        return _reject_server_only(value, SERVER_ONLY_AGENT_SETTINGS)
+
+    @field_validator("browser_settings")
+    @classmethod
+    def _check_browser_settings(cls, value: Dict[str, Any]) -> Dict[str, Any]:
+        return _reject_server_only(value, SERVER_ONLY_BROWSER_SETTINGS)
+
+
+class BrowserUseTaskRequest(_TaskSettings):
+    task: str
+
+
+class DeepResearchTaskRequest(_TaskSettings):
+    topic: str
+    max_parallel_browsers: int = 1
+    # Resumes a task of this server, its directory lives under the server's output root
+    resume_task_id: Optional[str] = Field(default=None, pattern=r"^[A-Za-z0-9_-]{1,64}$")
+
+
+class HelpResponse(BaseModel):
+    response: str
+
+
+def create_app(
+        manager: Optional[TaskRunManager] = None,
+        llm_factory: Optional[LLMFactory] = None,
+        max_concurrent_runs: int = 4,
+        output_root: str = "./tmp/api",
+        browser_settings: Optional[Dict[str, Any]] = None,
+        mcp_server_config: Optional[Dict[str, Any]] = None,
+        api_token: Optional[str] = None,
+) -> FastAPI:
+    """
+    Creates the headless HTTP API. ``agent_settings`` and ``browser_settings`` use the
+    same keys as the WebUI tabs. Pass ``llm_factory`` to run agents against a stub LLM.
+
+    Everything a run writes goes below ``output_root``. ``browser_settings`` (e.g. the
+    browser binary or a CDP URL) and ``mcp_server_config`` apply to every run; clients
+    cannot set these themselves. With ``api_token``, every request needs the header
+    ``Authorization: Bearer <api_token>``.
+    """
+    manager = manager or TaskRunManager(llm_factory=llm_factory, max_concurrent_runs=max_concurrent_runs)
+    server_browser_settings = {
+        **(browser_settings or {}),
+        "save_agent_history_path": os.path.join(output_root, "agent_history"),
+        "save_download_path": os.path.join(output_root, "downloads"),
+    }
+
+    def check_token(request: Request):
+        if api_token is None:
+            return
+        expected = f"Bearer {api_token}"
+        if not secrets.compare_digest(request.headers.get("authorization", ""), expected):
+            raise HTTPException(status_code=401, detail="Missing or invalid API token")
+
+    def with_server_settings(request: Dict[str, Any]) -> Dict[str, Any]:
+        request["browser_settings"] = {**request["browser_settings"], **server_browser_settings}
+        request["agent_settings"] = {**request["agent_settings"], "mcp_server_config": mcp_server_config}
+        return request
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        yield
+        await manager.shutdown()
+
+    app = FastAPI(title="Browser Use WebUI API", lifespan=lifespan, dependencies=[Depends(check_token)])
+    app.state.manager = manager
+
+    def _get_run(task_id: str):
+        run = manager.get(task_id)
+        if not run:
+            raise HTTPException(status_code=404, detail=f"Task {task_id} not found")
+        return run
+
+    @app.post("/api/browser-use/tasks")
+    async def submit_browser_use_task(request: BrowserUseTaskRequest):
+        run = manager.submit("browser_use", with_server_settings(request.model_dump()))
+        return run.to_dict()
+
+    @app.post("/api/deep-research/tasks")
+    async def submit_deep_research_task(request: DeepResearchTaskRequest):
+        research_request = with_server_settings(request.model_dump())
+        research_request["save_dir"] = os.path.join(output_root, "deep_research")
+        research_request["mcp_server_config"] = mcp_server_config
+        run = manager.submit("deep_research", research_request)
+        return run.to_dict()
+
+    @app.get("/api/tasks")
+    async def list_tasks():
+        return [run.to_dict() for run in manager.runs.values()]
+
+    @app.get("/api/tasks/{task_id}")
+    async def get_task(task_id: str):
+        return _get_run(task_id).to_dict()
+
+    @app.get("/api/tasks/{task_id}/events")
+    async def stream_task_events(task_id: str, since: int = 0):
+        """Server-sent events: replays events from ``since`` and follows the run until it finishes."""
+        run = _get_run(task_id)
+
+        async def event_source():
+            async for event in run.stream_events(since=since):
+                yield f"id: {event['seq']}\nevent: {event['type']}\ndata: {json.dumps(event, default=str)}\n\n"
+
+        return StreamingResponse(event_source(), media_type="text/event-stream")
+
+    @app.get("/api/tasks/{task_id}/live")
+    async def live_view(task_id: str):
+        """MJPEG stream of the task's browser; an <img> tag can display it directly."""
+        _get_run(task_id)
+        screencast = await manager.get_screencast(task_id)
+        if not screencast:
+            raise HTTPException(status_code=409, detail=f"Task {task_id} has no running browser")
+        return StreamingResponse(
+            screencast.mjpeg_stream(),
+            media_type=f"multipart/x-mixed-replace; boundary={MJPEG_BOUNDARY}",
+        )
+
+    @app.get("/api/tasks/{task_id}/history")
+    async def get_task_history(task_id: str, include_screenshots: bool = False):
+        _get_run(task_id)
+        return manager.get_history(task_id, include_screenshots=include_screenshots)
+
+    @app.get("/api/tasks/{task_id}/timings")
+    async def get_task_timings(task_id: str):
+        """Per-step latency breakdown of a browser-use run with p50/p95 per phase."""
+        _get_run(task_id)
+        return manager.get_timings(task_id)
+
+    @app.get("/metrics", response_class=PlainTextResponse)
+    async def metrics():
+        text = manager.prometheus_metrics() + get_mcp_manager().prometheus_text()
+        return PlainTextResponse(text, media_type="text/plain; version=0.0.4")
+
+    @app.post("/api/tasks/{task_id}/stop")
+    async def stop_task(task_id: str):
+        _get_run(task_id)
+        if not await manager.stop(task_id):
+            raise HTTPException(status_code=409, detail=f"Task {task_id} has already finished")
+        return {"task_id": task_id, "stopping": True}
+
+    @app.post("/api/tasks/{task_id}/respond")
+    async def respond_to_task(task_id: str, body: HelpResponse):
+        if not _get_run(task_id).respond(body.response):
+            raise HTTPException(status_code=409, detail=f"Task {task_id} is not waiting for a response")
+        return {"task_id": task_id, "accepted": True}
+
+    @app.delete("/api/tasks/{task_id}")
+    async def delete_task(task_id: str):
+        _get_run(task_id)
+        if not manager.remove(task_id):
+            raise HTTPException(status_code=409, detail=f"Task {task_id} is still running")
+        return {"task_id": task_id, "deleted": True}
+
+    return app
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Headless API for browser-use and deep research agents")
+    parser.add_argument("--ip", type=str, default="127.0.0.1", help="IP address to bind to")
+    parser.add_argument("--port", type=int, default=7789, help="Port to listen on")
+    parser.add_argument("--max-concurrent-runs", type=int, default=4, help="Maximum number of runs executed at once")
+    parser.add_argument("--output-dir", type=str, default="./tmp/api", help="Directory all run artifacts are written to")
+    parser.add_argument("--browser-binary-path", type=str, default=None, help="Browser executable used by all runs")
+    parser.add_argument("--cdp-url", type=str, default=None, help="CDP URL of a browser all runs attach to")
+    parser.add_argument("--mcp-config", type=str, default=None, help="JSON file with the MCP servers of all runs")
+    parser.add_argument("--token", type=str, default=os.getenv("WEBUI_API_TOKEN"),
+                        help="Bearer token required by every request (default: $WEBUI_API_TOKEN)")
+    args = parser.parse_args()
+    if args.ip not in LOCAL_HOSTS and not args.token:
+        parser.error(f"--token (or WEBUI_API_TOKEN) is required when binding to {args.ip}")
+
+    mcp_server_config = None
+    if args.mcp_config:
+        with open(args.mcp_config, "r", encoding="utf-8") as f:
+            mcp_server_config = json.load(f)
+    browser_settings = {"browser_binary_path": args.browser_binary_path, "cdp_url": args.cdp_url}
+    app = create_app(
+        max_concurrent_runs=args.max_concurrent_runs,
+        output_root=args.output_dir,
+        browser_settings={key: value for key, value in browser_settings.items() if value},
+        mcp_server_config=mcp_server_config,
+        api_token=args.token,
+    )
+    uvicorn.run(app, host=args.ip, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,507 @@
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from collections import deque
+from typing import Any, AsyncGenerator, Callable, Deque, Dict, List, Optional, Set
+
+from browser_use.agent.views import AgentHistoryList, AgentOutput
+from browser_use.browser.context import BrowserContextConfig
+from browser_use.browser.views import BrowserState
+from langchain_core.language_models.chat_models import BaseChatModel
+
+from src.agent.browser_use.browser_use_agent import BrowserUseAgent
+from src.agent.deep_research.checkpoint import ResearchCheckpointStore
+from src.agent.deep_research.deep_research_agent import REPORT_FILENAME, DeepResearchAgent
+from src.agent.deep_research.plan_cache import PlanCache
+from src.agent.deep_research.progress import PLAN, TASK
+from src.browser.custom_browser import create_custom_browser
+from src.browser.screencast import BrowserScreencast
+from src.controller.custom_controller import CustomController
+from src.utils import llm_provider
+from src.utils.run_recorder import RunRecorder
+from src.utils.step_profiler import StepProfiler
+from src.utils.usage_tracker import get_usage_tracker
+from src.utils.screenshot_store import ScreenshotStore, load_screenshot
+
+logger = logging.getLogger(__name__)
+
+# Run statuses
+PENDING = "pending"
+RUNNING = "running"
+FINAL_STATUSES = {"completed", "error", "stopped", "cancelled", "finished_incomplete"}
+
+LLMFactory = Callable[[Dict[str, Any], str], Optional[BaseChatModel]]
+
+
+def default_llm_factory(agent_settings: Dict[str, Any], prefix: str = "") -> Optional[BaseChatModel]:
+    """
+    Builds an LLM from agent settings using the same keys as the Agent Settings tab.
+    ``prefix`` selects the planner settings ("planner_") instead of the main LLM ("").
+    """
+    provider = agent_settings.get(f"{prefix}llm_provider")
+    model_name = agent_settings.get(f"{prefix}llm_model_name")
+    if not provider or not model_name:
+        return None
+    return llm_provider.get_routed_llm_model(
+        provider=provider,
+        model_name=model_name,
+        temperature=agent_settings.get(f"{prefix}llm_temperature", 0.6),
+        base_url=agent_settings.get(f"{prefix}llm_base_url") or None,
+        api_key=agent_settings.get(f"{prefix}llm_api_key") or None,
+        num_ctx=agent_settings.get(f"{prefix}ollama_num_ctx", 16000) if provider == "ollama" else None,
+    )
+
+
+class TaskRun:
+    """
+    One browser-use or deep-research run driven through the API.
+
+    Every state change is recorded as a numbered event. Clients can replay the
+    events from any sequence number and then follow new ones live, so any number
+    of clients can watch the same run. Only the newest ``max_events`` events are
+    kept for replay; sequence numbers keep counting past the dropped ones.
+    """
+
+    def __init__(self, kind: str, request: Dict[str, Any], max_events: int = 1000):
+        self.task_id = str(uuid.uuid4())
+        self.kind = kind
+        self.request = request
+        self.status = PENDING
+        self.message: Optional[str] = None
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.events: Deque[Dict[str, Any]] = deque(maxlen=max_events)
+        self.num_events = 0
+        self.agent: Any = None
+        self.history_file: Optional[str] = None
+        self.output_dir: Optional[str] = None
+        self.runner: Optional[asyncio.Task] = None
+        self.screencast: Optional[BrowserScreencast] = None
+        self.help_response_event: Optional[asyncio.Event] = None
+        self.help_response: Optional[str] = None
+        self._subscribers: List[asyncio.Queue] = []
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINAL_STATUSES
+
+    def publish(self, event_type: str, data: Optional[Dict[str, Any]] = None):
+        event = {"seq": self.num_events, "type": event_type, "time": time.time(), "data": data or {}}
+        self.num_events += 1
+        self.events.append(event)
+        for queue in self._subscribers:
+            queue.put_nowait(event)
+
+    def set_status(self, status: str, message: Optional[str] = None):
+        if self.finished:
+            # A final status is never left again, e.g. by a runner that outlived its cancellation
+            logger.debug(f"Ignoring status {status} for finished run {self.task_id} ({self.status})")
+            return
+        self.status = status
+        self.message = message
+        if status in FINAL_STATUSES:
+            self.finished_at = time.time()
+        self.publish("status", {"status": status, "message": message})
+
+    async def stream_events(self, since: int = 0) -> AsyncGenerator[Dict[str, Any], None]:
+        """
+        Yields past events from ``since`` and then live events until the run finishes.
+        Replay starts at the oldest kept event if earlier ones were dropped.
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+        self._subscribers.append(queue)
+        try:
+            next_seq = since
+            for event in [event for event in self.events if event["seq"] >= since]:
+                yield event
+                next_seq = event["seq"] + 1
+            while not (self.finished and next_seq >= self.num_events):
+                event = await queue.get()
+                if event["seq"] < next_seq:
+                    continue
+                yield event
+                next_seq = event["seq"] + 1
+        finally:
+            self._subscribers.remove(queue)
+
+    async def ask_for_help(self, query: str, timeout: float = 3600.0) -> Dict[str, Any]:
+        """Publishes a help request and waits until a client answers it via ``respond``."""
+        self.help_response_event = asyncio.Event()
+        self.help_response = None
+        self.publish("ask_for_help", {"query": query})
+        try:
+            await asyncio.wait_for(self.help_response_event.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            self.publish("help_timeout", {"query": query})
+            return {"response": "Timeout: User did not respond."}
+        finally:
+            self.help_response_event = None
+        return {"response": self.help_response}
+
+    def release_help(self):
+        """Answers a pending help request on behalf of a stopped run so the agent is not left waiting."""
+        if self.help_response_event and not self.help_response_event.is_set():
+            self.help_response = "The task was stopped, do not wait for the user."
+            self.help_response_event.set()
+
+    def respond(self, response: str) -> bool:
+        if not self.help_response_event or self.help_response_event.is_set():
+            return False
+        self.help_response = response or "User provided no text response."
+        self.help_response_event.set()
+        return True
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "task_id": self.task_id,
+            "kind": self.kind,
+            "status": self.status,
+            "message": self.message,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "num_events": self.num_events,
+            "waiting_for_help": self.help_response_event is not None,
+            "usage": get_usage_tracker().totals(self.task_id),
+        }
+
+
+def _step_event_data(state: BrowserState, output: AgentOutput, step_num: int) -> Dict[str, Any]:
+    data = {"step": step_num - 1, "url": getattr(state, "url", None), "title": getattr(state, "title", None)}
+    if output:
+        data["current_state"] = output.current_state.model_dump(exclude_none=True)
+        data["action"] = [action.model_dump(exclude_none=True) for action in output.action]
+    return data
+
+
+def _done_event_data(history: AgentHistoryList) -> Dict[str, Any]:
+    errors = history.errors()
+    return {
+        "duration_seconds": history.total_duration_seconds(),
+        "total_input_tokens": history.total_input_tokens(),
+        "final_result": history.final_result(),
+        "errors": [error for error in errors if error] if errors else [],
+    }
+
+
+async def run_browser_use_task(run: TaskRun, llm_factory: LLMFactory):
+    """Runs a BrowserUseAgent task the same way the Run Agent tab does, publishing events to ``run``."""
+    task = run.request["task"]
+    agent_settings = run.request.get("agent_settings", {})
+    browser_settings = run.request.get("browser_settings", {})
+
+    save_agent_history_path = browser_settings.get("save_agent_history_path") or "./tmp/agent_history"
+    save_recording_path = browser_settings.get("save_recording_path") or None
+    save_trace_path = browser_settings.get("save_trace_path") or None
+    save_download_path = browser_settings.get("save_download_path") or "./tmp/downloads"
+    for path in [save_agent_history_path, save_recording_path, save_trace_path, save_download_path]:
+        if path:
+            os.makedirs(path, exist_ok=True)
+
+    window_w = int(browser_settings.get("window_w", 1280))
+    window_h = int(browser_settings.get("window_h", 1100))
+    tool_calling_str = agent_settings.get("tool_calling_method", "auto")
+    mcp_server_config = agent_settings.get("mcp_server_config") or None
+    if isinstance(mcp_server_config, str):
+        mcp_server_config = json.loads(mcp_server_config)
+
+    main_llm = llm_factory(agent_settings, "")
+    planner_llm = llm_factory(agent_settings, "planner_") if agent_settings.get("planner_llm_provider") else None
+
+    browser = None
+    browser_context = None
+    controller = None
+    try:
+        controller = CustomController(ask_assistant_callback=lambda query, _: run.ask_for_help(query))
+        await controller.setup_mcp_client(mcp_server_config, lazy=agent_settings.get("mcp_lazy_tools", False))
+
+        browser = create_custom_browser(
+            headless=browser_settings.get("headless", True),
+            disable_security=browser_settings.get("disable_security", False),
+            use_own_browser=browser_settings.get("use_own_browser", False),
+            browser_binary_path=browser_settings.get("browser_binary_path") or None,
+            browser_user_data_dir=browser_settings.get("browser_user_data_dir") or None,
+            window_w=window_w,
+            window_h=window_h,
+            cdp_url=browser_settings.get("cdp_url") or None,
+            wss_url=browser_settings.get("wss_url") or None,
+        )
+        browser_context = await browser.new_context(
+            config=BrowserContextConfig(
+                trace_path=save_trace_path,
+                save_recording_path=save_recording_path,
+                save_downloads_path=save_download_path,
+                window_height=window_h,
+                window_width=window_w,
+            )
+        )
+
+        history_dir = os.path.join(save_agent_history_path, run.task_id)
+        os.makedirs(history_dir, exist_ok=True)
+        run.output_dir = history_dir
+        run.history_file = os.path.join(history_dir, f"{run.task_id}.json")
+
+        async def step_callback(state: BrowserState, output: AgentOutput, step_num: int):
+            run.publish("step", _step_event_data(state, output, step_num))
+
+        def done_callback(history: AgentHistoryList):
+            run.publish("done", _done_event_data(history))
+
+        run.agent = BrowserUseAgent(
+            task=task,
+            llm=main_llm,
+            browser=browser,
+            browser_context=browser_context,
+            controller=controller,
+            register_new_step_callback=step_callback,
+            register_done_callback=done_callback,
+            use_vision=agent_settings.get("use_vision", True),
+            override_system_message=agent_settings.get("override_system_prompt") or None,
+            extend_system_message=agent_settings.get("extend_system_prompt") or None,
+            max_input_tokens=agent_settings.get("max_input_tokens", 128000),
+            max_actions_per_step=agent_settings.get("max_actions", 10),
+            tool_calling_method=tool_calling_str if tool_calling_str != "None" else None,
+            planner_llm=planner_llm,
+            use_vision_for_planner=agent_settings.get("planner_use_vision", False) if planner_llm else False,
+            source="api",
+            screenshot_store=ScreenshotStore(
+                os.path.join(history_dir, "screenshots"),
+                image_format=browser_settings.get("screenshot_format", "jpeg"),
+                quality=int(browser_settings.get("screenshot_quality", 80)),
+                max_full_screenshots=int(browser_settings.get("screenshot_retention", 0)) or None,
+            ),
+            history_spill_path=os.path.join(history_dir, "history.jsonl"),
+            max_history_in_memory=int(agent_settings.get("max_history_in_memory", 20)),
+            prompt_cache=agent_settings.get("prompt_cache", True),
+        )
+        run.agent.state.agent_id = run.task_id
+        run.agent.recorder = RunRecorder(
+            os.path.join(history_dir, f"{run.task_id}.gif"),
+            task,
+            video_format=browser_settings.get("recording_format", "gif"),
+            max_width=int(browser_settings.get("recording_max_width", 1280)),
+            frame_skip=int(browser_settings.get("recording_frame_skip", 0)),
+            drop_frames=bool(browser_settings.get("recording_drop_frames", False)),
+        )
+        run.agent.profiler = StepProfiler(run.task_id, os.path.join(history_dir, "step_timings.jsonl"))
+
+        run.set_status(RUNNING)
+        await run.agent.run(max_steps=agent_settings.get("max_steps", 100))
+        run.agent.save_history_in_background(run.history_file)
+        written = await run.agent.wait_for_artifacts()
+        run.publish("artifacts", {
+            "history_file": run.history_file if written.get("history") else None,
+            "recording": run.agent.recorder.output_path if written.get("recording") else None,
+            "recording_frames_dropped": run.agent.recorder.frames_dropped,
+        })
+        run.publish("timings", run.agent.profiler.summary())
+        await run.agent.artifact_writer.run(get_usage_tracker().save, run.task_id, os.path.join(history_dir, "usage.json"))
+        run.publish("usage", {"breakdown": get_usage_tracker().breakdown(run.task_id)})
+
+        if run.agent.state.stopped:
+            run.set_status("stopped", "Agent was stopped by request.")
+        else:
+            run.set_status("completed", run.agent.state.history.final_result())
+    finally:
+        if run.screencast:
+            await run.screencast.stop()
+        if browser_context:
+            await browser_context.close()
+        if browser:
+            await browser.close()
+        if controller:
+            await controller.close_mcp_client()
+
+
+def _forward_research_progress(run: TaskRun, event: Dict[str, Any]):
+    if event["type"] in (PLAN, TASK):
+        data = dict(event)
+        run.publish(data.pop("type"), data)
+
+
+async def run_deep_research_task(run: TaskRun, llm_factory: LLMFactory):
+    """Runs a DeepResearchAgent task, publishing its status, plan progress and final report to ``run``."""
+    topic = run.request["topic"]
+    agent_settings = run.request.get("agent_settings", {})
+    browser_settings = run.request.get("browser_settings", {})
+    save_dir = run.request.get("save_dir") or "./tmp/deep_research"
+    mcp_server_config = run.request.get("mcp_server_config") or None
+    if isinstance(mcp_server_config, str):
+        mcp_server_config = json.loads(mcp_server_config)
+
+    llm = llm_factory(agent_settings, "")
+    if not llm:
+        raise ValueError("LLM Initialization failed. Please check agent_settings.")
+
+    browser_config = {
+        "headless": browser_settings.get("headless", True),
+        "disable_security": browser_settings.get("disable_security", False),
+        "browser_binary_path": browser_settings.get("browser_binary_path"),
+        "user_data_dir": browser_settings.get("browser_user_data_dir"),
+        "window_width": int(browser_settings.get("window_w", 1280)),
+        "window_height": int(browser_settings.get("window_h", 1100)),
+    }
+    run.agent = DeepResearchAgent(
+        llm=llm,
+        browser_config=browser_config,
+        mcp_server_config=mcp_server_config,
+        plan_cache=PlanCache(os.path.join(save_dir, "plan_cache")),
+    )
+    research_task_id = run.request.get("resume_task_id") or run.task_id
+    run.output_dir = os.path.join(save_dir, research_task_id)
+
+    progress = run.agent.progress.subscribe()
+
+    async def forward_progress():
+        while True:
+            _forward_research_progress(run, await progress.get())
+
+    forwarder = asyncio.create_task(forward_progress())
+    run.set_status(RUNNING)
+    try:
+        result = await run.agent.run(
+            topic=topic,
+            task_id=research_task_id,
+            save_dir=save_dir,
+            max_parallel_browsers=int(run.request.get("max_parallel_browsers", 1)),
+        )
+    finally:
+        forwarder.cancel()
+        run.agent.progress.unsubscribe(progress)
+        while not progress.empty():
+            _forward_research_progress(run, progress.get_nowait())
+    final_report = (result.get("final_state") or {}).get("final_report")
+    run.publish("done", {
+        "research_task_id": result.get("task_id"),
+        "report_file": os.path.join(run.output_dir, REPORT_FILENAME) if final_report else None,
+        "final_report": final_report,
+        "usage": result.get("usage") or {},
+    })
+    run.set_status(result.get("status", "error"), result.get("message"))
+
+
+class TaskRunManager:
+    """Keeps track of all API runs and limits how many of them execute at once."""
+
+    def __init__(self, llm_factory: Optional[LLMFactory] = None, max_concurrent_runs: int = 4):
+        self.llm_factory = llm_factory or default_llm_factory
+        self.runs: Dict[str, TaskRun] = {}
+        self._semaphore = asyncio.Semaphore(max_concurrent_runs)
+        # Runners outlive removed runs while they still close their browser
+        self._runners: Set[asyncio.Task] = set()
+
+    def submit(self, kind: str, request: Dict[str, Any]) -> TaskRun:
+        run_func = {"browser_use": run_browser_use_task, "deep_research": run_deep_research_task}[kind]
+        run = TaskRun(kind, request)
+        self.runs[run.task_id] = run
+        run.runner = asyncio.create_task(self._execute(run, run_func))
+        self._runners.add(run.runner)
+        run.runner.add_done_callback(self._runners.discard)
+        return run
+
+    async def _execute(self, run: TaskRun, run_func):
+        try:
+            async with self._semaphore:
+                await run_func(run, self.llm_factory)
+        except asyncio.CancelledError:
+            if run.agent is None:
+                run.set_status("cancelled", "Run was cancelled before it started.")
+            else:
+                run.set_status("cancelled", "Run was cancelled.")
+        except Exception as e:
+            logger.error(f"Error during API run {run.task_id}: {e}", exc_info=True)
+            run.set_status("error", f"{type(e).__name__}: {e}")
+        if not run.finished:
+            run.set_status("finished_incomplete")
+
+    def get(self, task_id: str) -> Optional[TaskRun]:
+        return self.runs.get(task_id)
+
+    async def stop(self, task_id: str) -> bool:
+        run = self.runs.get(task_id)
+        if not run or run.finished:
+            return False
+        run.release_help()
+        if run.agent is None:
+            # Still waiting for a slot or setting up the browser, LLM or MCP servers
+            run.runner.cancel()
+        elif run.kind == "deep_research":
+            await run.agent.stop()
+        else:
+            run.agent.state.stopped = True
+            run.agent.state.paused = False
+        return True
+
+    async def get_screencast(self, task_id: str) -> Optional[BrowserScreencast]:
+        """Returns the live view of a running browser-use task, starting it for the first viewer."""
+        run = self.runs.get(task_id)
+        if not run or run.finished or run.kind != "browser_use" or not run.agent:
+            return None
+        if run.screencast is None:
+            browser_settings = run.request.get("browser_settings", {})
+            run.screencast = BrowserScreencast(
+                run.agent.browser_context,
+                max_width=int(browser_settings.get("window_w", 1280)),
+                max_height=int(browser_settings.get("window_h", 1100)),
+            )
+            await run.screencast.start()
+        return run.screencast
+
+    def remove(self, task_id: str) -> bool:
+        run = self.runs.get(task_id)
+        if not run or not run.finished:
+            return False
+        del self.runs[task_id]
+        get_usage_tracker().discard(task_id)
+        return True
+
+    def get_history(self, task_id: str, include_screenshots: bool = False) -> Optional[Dict[str, Any]]:
+        run = self.runs.get(task_id)
+        if not run:
+            return None
+        if run.kind == "deep_research":
+            history = {}
+            if run.output_dir:
+                history = ResearchCheckpointStore(run.output_dir).load(repair=False)
+                report_file = os.path.join(run.output_dir, REPORT_FILENAME)
+                if os.path.exists(report_file):
+                    with open(report_file, "r", encoding="utf-8") as f:
+                        history["final_report"] = f.read()
+            return {"task_id": task_id, "history": history}
+
+        if not run.agent:
+            return {"task_id": task_id, "history": []}
+        history = run.agent.state.history.model_dump()
+        for item in history.get("history", []):
+            if item.get("state"):
+                screenshot = item["state"]["screenshot"]
+                item["state"]["screenshot"] = load_screenshot(screenshot) if include_screenshots else None
+        return {"task_id": task_id, "history": history}
+
+    def get_timings(self, task_id: str) -> Optional[Dict[str, Any]]:
+        run = self.runs.get(task_id)
+        if not run:
+            return None
+        profiler = getattr(run.agent, "profiler", None)
+        if not profiler:
+            return {"task_id": task_id, "summary": {}, "steps": []}
+        return {"task_id": task_id, "summary": profiler.summary(), "steps": profiler.steps}
+
+    def prometheus_metrics(self) -> str:
+        """Per-phase step latency quantiles of all known browser-use runs in Prometheus text format."""
+        lines = [
+            "# HELP agent_step_phase_seconds Latency of one phase of a browser-use agent step.",
+            "# TYPE agent_step_phase_seconds summary",
+        ]
+        for run in self.runs.values():
+            profiler = getattr(run.agent, "profiler", None)
+            if profiler:
+                lines.append(profiler.prometheus_text().rstrip("\n"))
+        return "\n".join(line for line in lines if line) + "\n"
+
+    async def shutdown(self):
+        for task_id in list(self.runs):
+            await self.stop(task_id)
+        await asyncio.gather(*self._runners, return_exceptions=True)
@@ -0,0 +1,54 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ArtifactWriter:
+    """
+    Writes run artefacts (history JSON, GIF, Playwright script) on a thread pool so
+    their serialisation and image compositing never block the event loop.
+
+    At most ``max_pending`` jobs are queued or running at once; further submissions
+    wait for a free slot, so a burst of finishing runs cannot pile up unbounded work.
+    """
+
+    def __init__(self, max_workers: int = 2, max_pending: int = 8):
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="artifact-writer")
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    async def run(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """Runs ``func`` on the pool once a slot is free and returns its result."""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_pending)
+        async with self._slots:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, partial(func, *args, **kwargs))
+
+    def submit(self, name: str, func: Callable[..., Any], *args, **kwargs) -> asyncio.Task:
+        """Schedules ``func`` without waiting for it; failures are logged when the task finishes."""
+        task = asyncio.create_task(self.run(func, *args, **kwargs), name=name)
+        task.add_done_callback(_log_failure)
+        return task
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+
+def _log_failure(task: asyncio.Task):
+    if not task.cancelled() and task.exception():
+        logger.error(f"Failed to write {task.get_name()}: {task.exception()}", exc_info=task.exception())
+
+
+_default_writer: Optional[ArtifactWriter] = None
+
+
+def get_artifact_writer() -> ArtifactWriter:
+    """Process-wide writer shared by all agents."""
+    global _default_writer
+    if _default_writer is None:
+        _default_writer = ArtifactWriter()
+    return _default_writer
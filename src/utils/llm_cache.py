@@ -0,0 +1,133 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+import warnings
+from typing import Any, Optional
+
+from langchain_core._api import LangChainBetaWarning
+from langchain_core.caches import RETURN_VAL_TYPE, BaseCache
+from langchain_core.load import dumps, loads
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseCache(BaseCache):
+    """
+    On-disk LLM response cache with a TTL and size-bounded LRU eviction.
+
+    Entries are keyed by a hash of LangChain's llm string (model, sampling
+    parameters and bound tool schemas) and the serialised messages. Cached
+    responses are returned without token usage, so usage accounting only counts
+    calls that reached the provider.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 256 * 1024 * 1024, ttl_seconds: Optional[float] = 7 * 24 * 3600):
+        self.path = os.path.abspath(path)
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+            "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)")
+        self._conn.commit()
+
+    @staticmethod
+    def _key(prompt: str, llm_string: str) -> str:
+        return hashlib.sha256(f"{llm_string}\x00{prompt}".encode("utf-8")).hexdigest()
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        key = self._key(prompt, llm_string)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            value, created_at = row
+            if self.ttl_seconds and now - created_at > self.ttl_seconds:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", LangChainBetaWarning)
+                generations = loads(value)
+        except Exception as e:
+            logger.warning(f"Dropping unreadable LLM cache entry: {e}")
+            return None
+        for generation in generations:
+            message = getattr(generation, "message", None)
+            if message is not None and hasattr(message, "usage_metadata"):
+                message.usage_metadata = None
+        return generations
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        value = dumps(list(return_val))
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (self._key(prompt, llm_string), value, len(value), now, now),
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now: float):
+        if self.ttl_seconds:
+            self._conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,))
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Least recently used entries go first until the store fits again
+        freed = 0
+        stale = []
+        for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY accessed_at"):
+            if total - freed <= self.max_bytes:
+                break
+            stale.append((key,))
+            freed += size
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", stale)
+
+    def clear(self, **kwargs: Any) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+
+_default_cache: Optional[ResponseCache] = None
+
+
+def get_response_cache() -> ResponseCache:
+    """Process-wide cache, configured with ``LLM_RESPONSE_CACHE_DIR/_MAX_MB/_TTL_HOURS``."""
+    global _default_cache
+    if _default_cache is None:
+        ttl_hours = float(os.getenv("LLM_RESPONSE_CACHE_TTL_HOURS", "168"))
+        _default_cache = ResponseCache(
+            os.path.join(os.getenv("LLM_RESPONSE_CACHE_DIR", "./tmp/llm_cache"), "responses.sqlite"),
+            max_bytes=int(float(os.getenv("LLM_RESPONSE_CACHE_MAX_MB", "256")) * 1024 * 1024),
+            ttl_seconds=ttl_hours * 3600 if ttl_hours > 0 else None,
+        )
+    return _default_cache
+
+
+def should_cache(temperature: Optional[float], mode: Optional[str] = None) -> bool:
+    """
+    Whether responses of a model with ``temperature`` are cached. ``mode`` (or the
+    ``LLM_RESPONSE_CACHE`` env var) is ``off`` (default), ``on`` for deterministic
+    calls only (temperature 0), or ``force`` to cache regardless of temperature.
+    """
+    mode = (mode or os.getenv("LLM_RESPONSE_CACHE", "off")).lower()
+    if mode == "force":
+        return True
+    if mode in ("on", "true", "1"):
+        return not temperature
+    return False
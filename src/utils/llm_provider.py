@@ -1,4 +1,3 @@
-from openai import OpenAI
 import pdb
 from langchain_openai import ChatOpenAI
 from langchain_core.globals import get_llm_cache
@@ -7,10 +6,22 @@ from langchain_core.language_models.base import (
     LangSmithParams,
     LanguageModelInput,
 )
+import asyncio
+import hashlib
+import json
+import logging
 import os
+import threading
+import weakref
+from collections import OrderedDict
+
+import httpx
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
 from langchain_core.load import dumpd, dumps
 from langchain_core.messages import (
     AIMessage,
+    AIMessageChunk,
     SystemMessage,
     AnyMessage,
     BaseMessage,
@@ -34,11 +45,14 @@ from langchain_core.tools import BaseTool
 from typing import (
     TYPE_CHECKING,
     Any,
+    AsyncIterator,
     Callable,
+    Iterator,
+    Dict,
     Literal,
     Optional,
     Union,
-    cast, List,
+    cast, List, Tuple,
 )
 from langchain_anthropic import ChatAnthropic
 from langchain_mistralai import ChatMistralAI
@@ -50,112 +64,361 @@ from langchain_aws import ChatBedrock
 from pydantic import SecretStr
 
 from src.utils import config
+from src.utils.llm_cache import get_response_cache, should_cache
+from src.utils.llm_router import LLMRouter, RoutingChatModel
+from src.utils.llm_scheduler import get_rate_limiter, schedule_llm
+from src.utils.usage_tracker import track_usage
+
+logger = logging.getLogger(__name__)
+
+
+THINK_OPEN = "<think>"
+THINK_CLOSE = "</think>"
+
+
+def _with_reasoning(message: BaseMessage, reasoning_content: str, content: str) -> BaseMessage:
+    additional_kwargs = dict(message.additional_kwargs)
+    if reasoning_content:
+        additional_kwargs["reasoning_content"] = reasoning_content
+    return message.model_copy(update={"content": content, "additional_kwargs": additional_kwargs})
 
 
 class DeepSeekR1ChatOpenAI(ChatOpenAI):
+    """
+    DeepSeek R1 over its OpenAI-compatible API. The reasoning trace is returned in
+    ``additional_kwargs["reasoning_content"]`` of the message, and of each chunk as
+    the tokens arrive when streaming, with the answer as content. Calls take
+    ChatOpenAI's path, so callbacks, rate limiting and the response cache apply and
+    streams report their token usage.
+    """
 
-    def __init__(self, *args: Any, **kwargs: Any) -> None:
-        super().__init__(*args, **kwargs)
-        self.client = OpenAI(
-            base_url=kwargs.get("base_url"),
-            api_key=kwargs.get("api_key")
-        )
+    stream_usage: bool = True
 
-    async def ainvoke(
+    def _convert_chunk_to_generation_chunk(
             self,
-            input: LanguageModelInput,
-            config: Optional[RunnableConfig] = None,
-            *,
-            stop: Optional[list[str]] = None,
-            **kwargs: Any,
-    ) -> AIMessage:
-        message_history = []
-        for input_ in input:
-            if isinstance(input_, SystemMessage):
-                message_history.append({"role": "system", "content": input_.content})
-            elif isinstance(input_, AIMessage):
-                message_history.append({"role": "assistant", "content": input_.content})
-            else:
-                message_history.append({"role": "user", "content": input_.content})
-
-        response = self.client.chat.completions.create(
-            model=self.model_name,
-            messages=message_history
-        )
+            chunk: dict,
+            default_chunk_class: type,
+            base_generation_info: Optional[Dict],
+    ) -> Optional[ChatGenerationChunk]:
+        generation_chunk = super()._convert_chunk_to_generation_chunk(chunk, default_chunk_class, base_generation_info)
+        choices = chunk.get("choices") or []
+        reasoning_content = (choices[0].get("delta") or {}).get("reasoning_content") if choices else None
+        if generation_chunk is not None and reasoning_content:
+            generation_chunk.message.additional_kwargs["reasoning_content"] = reasoning_content
+        return generation_chunk
 
-        reasoning_content = response.choices[0].message.reasoning_content
-        content = response.choices[0].message.content
-        return AIMessage(content=content, reasoning_content=reasoning_content)
+    def _create_chat_result(self, response: Any, generation_info: Optional[Dict] = None) -> ChatResult:
+        result = super()._create_chat_result(response, generation_info)
+        response_dict = response if isinstance(response, dict) else response.model_dump()
+        for generation, choice in zip(result.generations, response_dict.get("choices") or []):
+            reasoning_content = (choice.get("message") or {}).get("reasoning_content")
+            if reasoning_content:
+                generation.message.additional_kwargs["reasoning_content"] = reasoning_content
+        return result
 
-    def invoke(
-            self,
-            input: LanguageModelInput,
-            config: Optional[RunnableConfig] = None,
-            *,
-            stop: Optional[list[str]] = None,
-            **kwargs: Any,
-    ) -> AIMessage:
-        message_history = []
-        for input_ in input:
-            if isinstance(input_, SystemMessage):
-                message_history.append({"role": "system", "content": input_.content})
-            elif isinstance(input_, AIMessage):
-                message_history.append({"role": "assistant", "content": input_.content})
-            else:
-                message_history.append({"role": "user", "content": input_.content})
-
-        response = self.client.chat.completions.create(
-            model=self.model_name,
-            messages=message_history
-        )
 
-        reasoning_content = response.choices[0].message.reasoning_content
-        content = response.choices[0].message.content
-        return AIMessage(content=content, reasoning_content=reasoning_content)
+class ThinkTagSplitter:
+    """
+    Splits streamed text of the form ``<think>reasoning</think>answer`` into its
+    reasoning and answer parts, chunk by chunk. Text that does not start with
+    ``<think>`` is all answer.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._mode: Optional[str] = None  # None until known, then "reasoning" or "answer"
+
+    def feed(self, text: str) -> Tuple[str, str]:
+        """Returns the (reasoning, answer) text that is certain after ``text``."""
+        self._buffer += text
+        if self._mode is None:
+            head = self._buffer.lstrip()
+            if len(head) < len(THINK_OPEN) and THINK_OPEN.startswith(head):
+                return "", ""
+            self._mode = "reasoning" if head.startswith(THINK_OPEN) else "answer"
+        if self._mode == "answer":
+            answer, self._buffer = self._buffer, ""
+            return "", answer
+        end = self._buffer.find(THINK_CLOSE)
+        if end >= 0:
+            reasoning, answer = self._buffer[:end], self._buffer[end + len(THINK_CLOSE):]
+            self._buffer = ""
+            self._mode = "answer"
+            return reasoning.replace(THINK_OPEN, ""), answer
+        # Hold back a tail that may be the start of a tag split across chunks
+        keep = max((k for tag in (THINK_OPEN, THINK_CLOSE) for k in range(1, len(tag))
+                    if self._buffer.endswith(tag[:k])), default=0)
+        reasoning = self._buffer[:len(self._buffer) - keep]
+        self._buffer = self._buffer[len(self._buffer) - keep:]
+        return reasoning.replace(THINK_OPEN, ""), ""
+
+    def flush(self) -> Tuple[str, str]:
+        rest, self._buffer = self._buffer, ""
+        if self._mode == "reasoning":
+            return rest.replace(THINK_OPEN, ""), ""
+        return "", rest
+
+
+def _split_reasoning_chunk(chunk: ChatGenerationChunk, reasoning_content: str, content: str) -> ChatGenerationChunk:
+    return ChatGenerationChunk(
+        message=_with_reasoning(chunk.message, reasoning_content, content),
+        generation_info=chunk.generation_info,
+    )
+
+
+def _split_reasoning_result(result: ChatResult) -> ChatResult:
+    generations = []
+    for generation in result.generations:
+        splitter = ThinkTagSplitter()
+        reasoning_content, content = splitter.feed(str(generation.message.content))
+        rest_reasoning, rest_content = splitter.flush()
+        content += rest_content
+        if "**JSON Response:**" in content:
+            content = content.split("**JSON Response:**")[-1]
+        generations.append(ChatGeneration(
+            message=_with_reasoning(generation.message, reasoning_content + rest_reasoning, content),
+            generation_info=generation.generation_info,
+        ))
+    return ChatResult(generations=generations, llm_output=result.llm_output)
 
 
 class DeepSeekR1ChatOllama(ChatOllama):
+    """
+    DeepSeek R1 served by Ollama. The ``<think>`` block is split from the answer,
+    also chunk by chunk while streaming, in the same message format as
+    ``DeepSeekR1ChatOpenAI``.
+    """
 
-    async def ainvoke(
+    async def _astream(
             self,
-            input: LanguageModelInput,
-            config: Optional[RunnableConfig] = None,
-            *,
-            stop: Optional[list[str]] = None,
+            messages: List[BaseMessage],
+            stop: Optional[List[str]] = None,
+            run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
             **kwargs: Any,
-    ) -> AIMessage:
-        org_ai_message = await super().ainvoke(input=input)
-        org_content = org_ai_message.content
-        reasoning_content = org_content.split("</think>")[0].replace("<think>", "")
-        content = org_content.split("</think>")[1]
-        if "**JSON Response:**" in content:
-            content = content.split("**JSON Response:**")[-1]
-        return AIMessage(content=content, reasoning_content=reasoning_content)
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        splitter = ThinkTagSplitter()
+        async for chunk in super()._astream(messages, stop, run_manager, **kwargs):
+            yield _split_reasoning_chunk(chunk, *splitter.feed(chunk.text))
+        reasoning_content, content = splitter.flush()
+        if reasoning_content or content:
+            yield _split_reasoning_chunk(ChatGenerationChunk(message=AIMessageChunk(content="")),
+                                         reasoning_content, content)
 
-    def invoke(
+    def _stream(
             self,
-            input: LanguageModelInput,
-            config: Optional[RunnableConfig] = None,
-            *,
-            stop: Optional[list[str]] = None,
+            messages: List[BaseMessage],
+            stop: Optional[List[str]] = None,
+            run_manager: Optional[CallbackManagerForLLMRun] = None,
             **kwargs: Any,
-    ) -> AIMessage:
-        org_ai_message = super().invoke(input=input)
-        org_content = org_ai_message.content
-        reasoning_content = org_content.split("</think>")[0].replace("<think>", "")
-        content = org_content.split("</think>")[1]
-        if "**JSON Response:**" in content:
-            content = content.split("**JSON Response:**")[-1]
-        return AIMessage(content=content, reasoning_content=reasoning_content)
+    ) -> Iterator[ChatGenerationChunk]:
+        splitter = ThinkTagSplitter()
+        for chunk in super()._stream(messages, stop, run_manager, **kwargs):
+            yield _split_reasoning_chunk(chunk, *splitter.feed(chunk.text))
+        reasoning_content, content = splitter.flush()
+        if reasoning_content or content:
+            yield _split_reasoning_chunk(ChatGenerationChunk(message=AIMessageChunk(content="")),
+                                         reasoning_content, content)
+
+    async def _agenerate(
+            self,
+            messages: List[BaseMessage],
+            stop: Optional[List[str]] = None,
+            run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+            **kwargs: Any,
+    ) -> ChatResult:
+        return _split_reasoning_result(await super()._agenerate(messages, stop, run_manager, **kwargs))
+
+    def _generate(
+            self,
+            messages: List[BaseMessage],
+            stop: Optional[List[str]] = None,
+            run_manager: Optional[CallbackManagerForLLMRun] = None,
+            **kwargs: Any,
+    ) -> ChatResult:
+        return _split_reasoning_result(super()._generate(messages, stop, run_manager, **kwargs))
+
+
+_http_client: Optional[httpx.Client] = None
+# An httpx.AsyncClient is bound to the event loop it first runs on, so each loop gets its own
+_async_http_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _running_loop() -> Optional[asyncio.AbstractEventLoop]:
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+def _http_settings() -> Dict[str, Any]:
+    try:
+        import h2  # noqa: F401
+        http2 = True
+    except ImportError:
+        http2 = False
+    return {
+        "http2": http2,
+        "limits": httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=60),
+        # Same as the OpenAI SDK's default, which a custom client would otherwise replace with no timeout at all
+        "timeout": httpx.Timeout(
+            float(os.getenv("LLM_HTTP_TIMEOUT", "600")),
+            connect=float(os.getenv("LLM_HTTP_CONNECT_TIMEOUT", "5")),
+        ),
+    }
+
+
+def _shared_http_clients() -> Dict[str, Any]:
+    """
+    Keep-alive HTTP clients shared by all OpenAI-compatible models, so connections
+    and TLS sessions to a provider are reused across models. HTTP/2 is used when
+    the optional ``h2`` package is installed. Requests time out after
+    ``LLM_HTTP_TIMEOUT`` seconds (``LLM_HTTP_CONNECT_TIMEOUT`` to connect); the
+    timeout is also returned for the model, which otherwise passes its own ``None``
+    to the SDK. The async client is the running event loop's; outside a loop the
+    SDK makes its own.
+    """
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.Client(**_http_settings())
+    clients: Dict[str, Any] = {"http_client": _http_client, "timeout": _http_client.timeout}
+    loop = _running_loop()
+    if loop is not None:
+        if loop not in _async_http_clients:
+            _async_http_clients[loop] = httpx.AsyncClient(**_http_settings())
+        clients["http_async_client"] = _async_http_clients[loop]
+    return clients
+
+
+# Models are reused for identical settings, bounded to the most recently used ones
+MAX_CACHED_LLM_CLIENTS = 16
+# Values are the model and the event loop its async HTTP client belongs to
+_llm_clients: "OrderedDict[tuple, Tuple[BaseChatModel, Optional[weakref.ref]]]" = OrderedDict()
+_llm_clients_lock = threading.Lock()
+
+
+def _client_key(provider: str, kwargs: Dict[str, Any]) -> tuple:
+    api_key = kwargs.get("api_key") or os.getenv(f"{provider.upper()}_API_KEY", "")
+    key_fingerprint = hashlib.sha256(str(api_key).encode()).hexdigest()[:16] if api_key else ""
+    settings = tuple(sorted((k, repr(v)) for k, v in kwargs.items() if k != "api_key"))
+    return provider, key_fingerprint, settings
+
+
+def clear_llm_client_cache():
+    with _llm_clients_lock:
+        _llm_clients.clear()
 
 
 def get_llm_model(provider: str, **kwargs):
     """
-    Get LLM model
+    Get LLM model. Token usage and latency of every call are recorded by the
+    process-wide usage tracker (see src/utils/usage_tracker.py).
+
+    Calls with the same provider, model, base URL, API key and sampling settings
+    return the same instance, so its HTTP connection pool survives across runs.
+    All models of a provider and API key share one rate limiter (see src/utils/llm_scheduler.py).
+
+    ``response_cache`` ("off", "on" or "force", default from ``LLM_RESPONSE_CACHE``) enables
+    the on-disk response cache; "on" only caches models with temperature 0.
     :param provider: LLM provider
     :param kwargs:
     :return:
     """
+    key = _client_key(provider, kwargs)
+    loop = _running_loop()
+    # Models hold the async HTTP client of the loop they were made on, so they are reused within that loop only
+    cache_key = (key, id(loop) if loop is not None else None)
+    with _llm_clients_lock:
+        cached = _llm_clients.get(cache_key)
+        if cached is not None and (cached[1] is None or cached[1]() is loop):
+            _llm_clients.move_to_end(cache_key)
+            return cached[0]
+    response_cache = kwargs.pop("response_cache", None)
+    llm = _create_llm_model(provider, **kwargs)
+    if should_cache(kwargs.get("temperature", 0.0), response_cache):
+        llm.cache = get_response_cache()
+    schedule_llm(llm, get_rate_limiter(provider, key[1]))
+    track_usage(llm)
+    with _llm_clients_lock:
+        _llm_clients[cache_key] = (llm, weakref.ref(loop) if loop is not None else None)
+        _llm_clients.move_to_end(cache_key)
+        while len(_llm_clients) > MAX_CACHED_LLM_CLIENTS:
+            _llm_clients.popitem(last=False)
+    return llm
+
+
+# Routers are bounded like the clients they route between
+MAX_CACHED_LLM_ROUTERS = MAX_CACHED_LLM_CLIENTS
+_routers: "OrderedDict[tuple, LLMRouter]" = OrderedDict()
+_routers_lock = threading.Lock()
+# Path, modification time and contents of the last routing config read
+_routing_config_cache: Tuple[Optional[str], Optional[float], Dict[str, Any]] = (None, None, {})
+
+
+def _read_routing_config(path: str = "config.json") -> Dict[str, Any]:
+    """Routing settings from ``path``, re-read only when the file changes."""
+    global _routing_config_cache
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return {}
+    cached_path, cached_mtime, config = _routing_config_cache
+    if cached_path == path and cached_mtime == mtime:
+        return config
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            config = json.load(f)
+    except (OSError, ValueError):
+        config = {}
+    _routing_config_cache = (path, mtime, config)
+    return config
+
+
+def _get_router(key: tuple, names: List[str], hedge: bool) -> LLMRouter:
+    with _routers_lock:
+        router = _routers.get(key)
+        if router is None:
+            router = _routers[key] = LLMRouter(names, hedge=hedge)
+        _routers.move_to_end(key)
+        while len(_routers) > MAX_CACHED_LLM_ROUTERS:
+            _routers.popitem(last=False)
+        return router
+
+
+def get_routed_llm_model(provider: str, **kwargs):
+    """
+    Like ``get_llm_model``, failing over to the endpoints listed under ``LLM_FALLBACKS``
+    in config.json, e.g. ``[{"provider": "ollama", "model_name": "qwen2.5:7b"}]``.
+    Fallbacks inherit the temperature of the primary model unless they set their own.
+    ``LLM_HEDGE`` races slow calls against the next endpoint. Without fallbacks the
+    primary model is returned as is.
+    """
+    routing_config = _read_routing_config()
+    primary = get_llm_model(provider, **kwargs)
+    endpoints, names = [primary], [f"{provider}:{kwargs.get('model_name')}"]
+    for fallback in routing_config.get("LLM_FALLBACKS") or []:
+        settings = {"temperature": kwargs.get("temperature", 0.0), **fallback}
+        fallback_provider = settings.pop("provider")
+        try:
+            endpoints.append(get_llm_model(fallback_provider, **settings))
+            names.append(f"{fallback_provider}:{settings.get('model_name')}")
+        except Exception as e:
+            logger.warning(f"Skipping LLM fallback {fallback_provider}:{settings.get('model_name')}: {e}")
+    if len(endpoints) == 1:
+        return primary
+
+    hedge = bool(routing_config.get("LLM_HEDGE", False))
+    # Routers are shared so endpoint statistics carry over between runs
+    router_key = (tuple(names), tuple(id(endpoint) for endpoint in endpoints), hedge)
+    return RoutingChatModel(
+        endpoints=endpoints,
+        router=_get_router(router_key, names, hedge),
+        model_name=getattr(primary, "model_name", None) or getattr(primary, "model", None),
+    )
+
+
+def _create_llm_model(provider: str, **kwargs):
     if provider not in ["ollama", "bedrock"]:
         env_var = f"{provider.upper()}_API_KEY"
         api_key = kwargs.get("api_key", "") or os.getenv(env_var, "")
@@ -200,6 +463,7 @@ def get_llm_model(provider: str, **kwargs):
             base_url = kwargs.get("base_url")
 
         return ChatOpenAI(
+            **_shared_http_clients(),
             model=kwargs.get("model_name", "gpt-4o"),
             temperature=kwargs.get("temperature", 0.0),
             base_url=base_url,
@@ -213,6 +477,7 @@ def get_llm_model(provider: str, **kwargs):
 
         if kwargs.get("model_name", "deepseek-chat") == "deepseek-reasoner":
             return DeepSeekR1ChatOpenAI(
+                **_shared_http_clients(),
                 model=kwargs.get("model_name", "deepseek-reasoner"),
                 temperature=kwargs.get("temperature", 0.0),
                 base_url=base_url,
@@ -220,6 +485,7 @@ def get_llm_model(provider: str, **kwargs):
             )
         else:
             return ChatOpenAI(
+                **_shared_http_clients(),
                 model=kwargs.get("model_name", "deepseek-chat"),
                 temperature=kwargs.get("temperature", 0.0),
                 base_url=base_url,
@@ -259,6 +525,7 @@ def get_llm_model(provider: str, **kwargs):
             base_url = kwargs.get("base_url")
         api_version = kwargs.get("api_version", "") or os.getenv("AZURE_OPENAI_API_VERSION", "2025-01-01-preview")
         return AzureChatOpenAI(
+            **_shared_http_clients(),
             model=kwargs.get("model_name", "gpt-4o"),
             temperature=kwargs.get("temperature", 0.0),
             api_version=api_version,
@@ -272,6 +539,7 @@ def get_llm_model(provider: str, **kwargs):
             base_url = kwargs.get("base_url")
 
         return ChatOpenAI(
+            **_shared_http_clients(),
             model=kwargs.get("model_name", "qwen-plus"),
             temperature=kwargs.get("temperature", 0.0),
             base_url=base_url,
@@ -296,6 +564,7 @@ def get_llm_model(provider: str, **kwargs):
         )
     elif provider == "moonshot":
         return ChatOpenAI(
+            **_shared_http_clients(),
             model=kwargs.get("model_name", "moonshot-v1-32k-vision-preview"),
             temperature=kwargs.get("temperature", 0.0),
             base_url=os.getenv("MOONSHOT_ENDPOINT"),
@@ -303,6 +572,7 @@ def get_llm_model(provider: str, **kwargs):
         )
     elif provider == "unbound":
         return ChatOpenAI(
+            **_shared_http_clients(),
             model=kwargs.get("model_name", "gpt-4o-mini"),
             temperature=kwargs.get("temperature", 0.0),
             base_url=os.getenv("UNBOUND_ENDPOINT", "https://api.getunbound.ai"),
@@ -318,6 +588,7 @@ def get_llm_model(provider: str, **kwargs):
         else:
             base_url = kwargs.get("base_url")
         return ChatOpenAI(
+            **_shared_http_clients(),
             api_key=api_key,
             base_url=base_url,
             model_name=kwargs.get("model_name", "Qwen/QwQ-32B"),
@@ -333,6 +604,7 @@ def get_llm_model(provider: str, **kwargs):
         else:
             base_url = kwargs.get("base_url")
         return ChatOpenAI(
+            **_shared_http_clients(),
             api_key=api_key,
             base_url=base_url,
             model_name=kwargs.get("model_name", "Qwen/QwQ-32B"),
@@ -0,0 +1,210 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional, Sequence
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.runnables import Runnable, RunnableConfig
+
+from src.utils.step_profiler import percentile
+
+logger = logging.getLogger(__name__)
+
+
+class EndpointStats:
+    """Rolling latency and error rate of one endpoint."""
+
+    def __init__(self, name: str, window: int = 50):
+        self.name = name
+        self.latencies: deque = deque(maxlen=window)
+        self.outcomes: deque = deque(maxlen=window)
+        self.cooldown_until = 0.0
+
+    def record(self, latency: float, ok: bool):
+        self.outcomes.append(ok)
+        if ok:
+            self.latencies.append(latency)
+
+    def error_rate(self) -> float:
+        return self.outcomes.count(False) / len(self.outcomes) if self.outcomes else 0.0
+
+    def p95(self) -> Optional[float]:
+        return percentile(list(self.latencies), 0.95) if len(self.latencies) >= 5 else None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"endpoint": self.name, "calls": len(self.outcomes), "error_rate": self.error_rate(), "p95": self.p95()}
+
+
+class LLMRouter:
+    """
+    Fails over between an ordered list of endpoints and optionally hedges slow calls.
+
+    Endpoints are tried in configured order; one that fails
+    ``failure_threshold`` of its recent calls is put on a cooldown and moved to
+    the back. With ``hedge`` on, a call that has not answered after the
+    endpoint's p95 latency (``hedge_min_delay`` until enough samples exist) is
+    raced against the next endpoint and the first answer wins.
+    """
+
+    def __init__(
+            self,
+            names: Sequence[str],
+            hedge: bool = False,
+            hedge_min_delay: float = 10.0,
+            failure_threshold: float = 0.5,
+            cooldown: float = 60.0,
+    ):
+        self.stats = [EndpointStats(name) for name in names]
+        self.hedge = hedge
+        self.hedge_min_delay = hedge_min_delay
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+
+    def order(self) -> List[int]:
+        now = time.monotonic()
+        healthy = [i for i, stats in enumerate(self.stats) if stats.cooldown_until <= now]
+        cooling = sorted((i for i in range(len(self.stats)) if i not in healthy),
+                         key=lambda i: self.stats[i].cooldown_until)
+        return healthy + cooling
+
+    def _hedge_delay(self, index: int) -> float:
+        p95 = self.stats[index].p95()
+        return max(p95, 1.0) if p95 is not None else self.hedge_min_delay
+
+    def _record(self, index: int, latency: float, error: Optional[BaseException] = None):
+        stats = self.stats[index]
+        stats.record(latency, error is None)
+        if error is not None:
+            logger.warning(f"LLM endpoint {stats.name} failed: {type(error).__name__}: {error}")
+            if len(stats.outcomes) >= 2 and stats.error_rate() >= self.failure_threshold:
+                stats.cooldown_until = time.monotonic() + self.cooldown
+                logger.warning(f"LLM endpoint {stats.name} is failing, routing around it for {self.cooldown:.0f}s")
+
+    def invoke(self, runnables: Sequence[Runnable], input: Any, config: Optional[RunnableConfig] = None,
+               **kwargs: Any) -> Any:
+        last_error: Optional[BaseException] = None
+        for index in self.order():
+            start = time.monotonic()
+            try:
+                result = runnables[index].invoke(input, config, **kwargs)
+            except Exception as e:
+                self._record(index, time.monotonic() - start, e)
+                last_error = e
+                continue
+            self._record(index, time.monotonic() - start)
+            return result
+        raise last_error
+
+    async def _call(self, index: int, runnable: Runnable, input: Any, config: Optional[RunnableConfig], **kwargs):
+        start = time.monotonic()
+        try:
+            result = await runnable.ainvoke(input, config, **kwargs)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self._record(index, time.monotonic() - start, e)
+            raise
+        self._record(index, time.monotonic() - start)
+        return result
+
+    async def ainvoke(self, runnables: Sequence[Runnable], input: Any, config: Optional[RunnableConfig] = None,
+                      **kwargs: Any) -> Any:
+        order = self.order()
+        pending: Dict[asyncio.Task, int] = {}
+        next_position = 0
+        last_error: Optional[BaseException] = None
+
+        def launch():
+            nonlocal next_position
+            index = order[next_position]
+            next_position += 1
+            pending[asyncio.create_task(self._call(index, runnables[index], input, config, **kwargs))] = index
+
+        launch()
+        try:
+            while pending:
+                timeout = None
+                if self.hedge and len(pending) == 1 and next_position < len(order):
+                    timeout = self._hedge_delay(next(iter(pending.values())))
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    logger.info(f"Hedging slow LLM call to {self.stats[order[next_position - 1]].name} "
+                                f"with {self.stats[order[next_position]].name}")
+                    launch()
+                    continue
+                for task in done:
+                    pending.pop(task)
+                    if task.exception() is None:
+                        return task.result()
+                    last_error = task.exception()
+                if not pending and next_position < len(order):
+                    launch()
+            raise last_error
+        finally:
+            for task in pending:
+                task.cancel()
+
+
+class RoutedRunnable(Runnable):
+    """A runnable derived from every endpoint (bound tools, structured output) behind the same router."""
+
+    def __init__(self, router: LLMRouter, runnables: List[Runnable]):
+        self.router = router
+        self.runnables = runnables
+
+    def invoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        return self.router.invoke(self.runnables, input, config, **kwargs)
+
+    async def ainvoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        return await self.router.ainvoke(self.runnables, input, config, **kwargs)
+
+
+class RoutingChatModel(BaseChatModel):
+    """
+    Chat model over an ordered list of provider models with failover and hedging.
+
+    ``bind_tools`` and ``with_structured_output`` are applied to every endpoint,
+    so agents use the router like any single model. ``model_name`` is the
+    primary endpoint's, which browser-use uses to pick its output format.
+    """
+
+    endpoints: List[BaseChatModel]
+    router: Any
+    model_name: Optional[str] = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "routing"
+
+    @property
+    def primary(self) -> BaseChatModel:
+        return self.endpoints[0]
+
+    def invoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> BaseMessage:
+        # The endpoint calls are the traced runs; the router adds no run of its own
+        return self.router.invoke(self.endpoints, input, config, **kwargs)
+
+    async def ainvoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> BaseMessage:
+        return await self.router.ainvoke(self.endpoints, input, config, **kwargs)
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        message = self.router.invoke(self.endpoints, messages, stop=stop, **kwargs)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        message = await self.router.ainvoke(self.endpoints, messages, stop=stop, **kwargs)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def bind_tools(self, tools: Sequence[Any], **kwargs: Any) -> Runnable:
+        return RoutedRunnable(self.router, [endpoint.bind_tools(tools, **kwargs) for endpoint in self.endpoints])
+
+    def with_structured_output(self, schema: Any, **kwargs: Any) -> Runnable:
+        return RoutedRunnable(
+            self.router, [endpoint.with_structured_output(schema, **kwargs) for endpoint in self.endpoints]
+        )
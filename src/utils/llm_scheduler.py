@@ -0,0 +1,242 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.rate_limiters import BaseRateLimiter
+
+from src.utils.step_profiler import current_profiler
+from src.utils.usage_tracker import extract_token_usage
+
+logger = logging.getLogger(__name__)
+
+# Lower values are served first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 10
+
+llm_priority: ContextVar[int] = ContextVar("llm_priority", default=PRIORITY_INTERACTIVE)
+# Extra limit on the calls made in a scope, on top of their provider's, e.g. a research queue's own rate
+llm_scope_limiter: ContextVar[Optional[BaseRateLimiter]] = ContextVar("llm_scope_limiter", default=None)
+
+
+@contextmanager
+def llm_priority_scope(priority: int):
+    """Runs LLM calls made inside the block with ``priority``."""
+    token = llm_priority.set(priority)
+    try:
+        yield
+    finally:
+        llm_priority.reset(token)
+
+
+@contextmanager
+def llm_rate_limit_scope(limiter: Optional[BaseRateLimiter]):
+    """Makes LLM calls inside the block also wait for ``limiter``, without changing the shared models."""
+    token = llm_scope_limiter.set(limiter)
+    try:
+        yield
+    finally:
+        llm_scope_limiter.reset(token)
+
+
+def _is_rate_limit_error(error: BaseException) -> bool:
+    if getattr(error, "status_code", None) == 429:
+        return True
+    message = str(error).lower()
+    return "429" in message or "rate limit" in message or "too many requests" in message
+
+
+class ProviderRateLimiter(BaseRateLimiter):
+    """
+    Token-bucket scheduler shared by every model that talks to one provider with one API key.
+
+    Requests per minute are taken from the request bucket before each call; tokens
+    per minute are debited from the token bucket once a call reports its usage, so a
+    burst of large prompts delays the following calls instead of failing them.
+    Waiting calls are served by priority (interactive before batch), FIFO within a
+    priority. After a 429 the limiter pauses all calls with jittered exponential
+    backoff. Calls inside ``llm_rate_limit_scope`` first wait for that scope's limiter.
+    """
+
+    def __init__(
+            self,
+            name: str,
+            requests_per_minute: Optional[float] = None,
+            tokens_per_minute: Optional[float] = None,
+            max_backoff: float = 60.0,
+    ):
+        self.name = name
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_backoff = max_backoff
+        now = time.monotonic()
+        self._requests = float(requests_per_minute or 0)
+        self._tokens = float(tokens_per_minute or 0)
+        self._refilled_at = now
+        self._blocked_until = 0.0
+        self._backoff = 0.0
+        self._lock = threading.Lock()
+        self._seq = itertools.count()
+        self._waiters: List[Tuple[int, int]] = []
+        self._changed: Optional[asyncio.Event] = None
+
+    def _refill(self, now: float):
+        elapsed = now - self._refilled_at
+        self._refilled_at = now
+        if self.requests_per_minute:
+            self._requests = min(self.requests_per_minute, self._requests + elapsed * self.requests_per_minute / 60)
+        if self.tokens_per_minute:
+            self._tokens = min(self.tokens_per_minute, self._tokens + elapsed * self.tokens_per_minute / 60)
+
+    def _try_consume(self) -> float:
+        """Takes one request slot and returns 0, or returns the seconds until one may be available."""
+        now = time.monotonic()
+        self._refill(now)
+        waits = [self._blocked_until - now]
+        if self.requests_per_minute and self._requests < 1:
+            waits.append((1 - self._requests) * 60 / self.requests_per_minute)
+        if self.tokens_per_minute and self._tokens <= 0:
+            waits.append((1 - self._tokens) * 60 / self.tokens_per_minute)
+        wait = max(waits)
+        if wait > 0:
+            return wait
+        if self.requests_per_minute:
+            self._requests -= 1
+        return 0.0
+
+    def _notify(self):
+        if self._changed:
+            self._changed.set()
+            self._changed = asyncio.Event()
+
+    def acquire(self, *, blocking: bool = True) -> bool:
+        scope_limiter = llm_scope_limiter.get()
+        if scope_limiter is not None and not scope_limiter.acquire(blocking=blocking):
+            return False
+        # Synchronous calls are not queued by priority; they wait for a free slot directly
+        while True:
+            with self._lock:
+                wait = self._try_consume()
+            if wait == 0:
+                return True
+            if not blocking:
+                return False
+            time.sleep(min(wait, 1.0))
+
+    async def aacquire(self, *, blocking: bool = True) -> bool:
+        start = time.monotonic()
+        scope_limiter = llm_scope_limiter.get()
+        if scope_limiter is not None and not await scope_limiter.aacquire(blocking=blocking):
+            return False
+        if self._changed is None:
+            self._changed = asyncio.Event()
+        entry = (llm_priority.get(), next(self._seq))
+        heapq.heappush(self._waiters, entry)
+        try:
+            while True:
+                changed = self._changed
+                wait = None
+                if self._waiters[0] == entry:
+                    with self._lock:
+                        wait = self._try_consume()
+                    if wait == 0:
+                        break
+                if not blocking:
+                    return False
+                try:
+                    await asyncio.wait_for(changed.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self._waiters.remove(entry)
+            heapq.heapify(self._waiters)
+            self._notify()
+        waited = time.monotonic() - start
+        profiler = current_profiler.get()
+        if profiler:
+            profiler.add_rate_limit_wait(waited)
+        if waited > 1:
+            logger.debug(f"LLM call to {self.name} waited {waited:.1f}s for its rate limit slot")
+        return True
+
+    def record_tokens(self, tokens: int):
+        if self.tokens_per_minute and tokens:
+            with self._lock:
+                self._refill(time.monotonic())
+                self._tokens -= tokens
+
+    def record_success(self):
+        self._backoff = 0.0
+
+    def record_rate_limited(self):
+        """Pauses all calls to the provider with jittered exponential backoff."""
+        with self._lock:
+            self._backoff = min(self.max_backoff, self._backoff * 2 if self._backoff else 1.0)
+            delay = random.uniform(self._backoff / 2, self._backoff)
+            self._blocked_until = max(self._blocked_until, time.monotonic() + delay)
+        logger.warning(f"Rate limited by {self.name}, pausing LLM calls for {delay:.1f}s")
+
+
+class RateLimitFeedbackHandler(BaseCallbackHandler):
+    """Reports token usage and 429 errors of a model's calls back to its rate limiter."""
+
+    run_inline = True
+
+    def __init__(self, limiter: ProviderRateLimiter):
+        self.limiter = limiter
+
+    def on_llm_end(self, response, *, run_id: UUID, **kwargs: Any):
+        usage = extract_token_usage(response)
+        self.limiter.record_tokens(usage["input_tokens"] + usage["output_tokens"])
+        self.limiter.record_success()
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        if _is_rate_limit_error(error):
+            self.limiter.record_rate_limited()
+
+
+_limiters: Dict[Tuple[str, str], ProviderRateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def _env_limit(provider: str, suffix: str) -> Optional[float]:
+    value = os.getenv(f"{provider.upper()}_{suffix}", "")
+    return float(value) if value else None
+
+
+def get_rate_limiter(provider: str, key_fingerprint: str = "") -> ProviderRateLimiter:
+    """
+    Process-wide limiter of a provider/API key. Limits come from ``<PROVIDER>_RPM``
+    and ``<PROVIDER>_TPM``; without them calls are only prioritised and backed off.
+    """
+    key = (provider, key_fingerprint)
+    with _limiters_lock:
+        if key not in _limiters:
+            _limiters[key] = ProviderRateLimiter(
+                f"{provider}:{key_fingerprint[:8]}" if key_fingerprint else provider,
+                requests_per_minute=_env_limit(provider, "RPM"),
+                tokens_per_minute=_env_limit(provider, "TPM"),
+            )
+        return _limiters[key]
+
+
+def schedule_llm(llm, limiter: ProviderRateLimiter):
+    """Puts ``llm`` behind ``limiter`` in place."""
+    llm.rate_limiter = limiter
+    handler = RateLimitFeedbackHandler(limiter)
+    if llm.callbacks is None:
+        llm.callbacks = [handler]
+    elif isinstance(llm.callbacks, list):
+        llm.callbacks.append(handler)
+    else:
+        llm.callbacks.add_handler(handler, inherit=False)
+    return llm
@@ -1,5 +1,8 @@
+import hashlib
 import inspect
+import json
 import logging
+import re
 import uuid
 from datetime import date, datetime, time
 from enum import Enum
@@ -7,43 +10,88 @@ from typing import Any, Dict, List, Optional, Set, Type, Union, get_type_hints
 
 from browser_use.controller.registry.views import ActionModel
 from langchain.tools import BaseTool
-from langchain_mcp_adapters.client import MultiServerMCPClient
 from pydantic import BaseModel, Field, create_model
 from pydantic.v1 import BaseModel, Field
 
+from src.utils.mcp_manager import MCPToolLease, get_mcp_manager
+
 logger = logging.getLogger(__name__)
 
 
-async def setup_mcp_client_and_tools(mcp_server_config: Dict[str, Any]) -> Optional[MultiServerMCPClient]:
+async def setup_mcp_client_and_tools(mcp_server_config: Dict[str, Any]) -> Optional[MCPToolLease]:
     """
-    Initializes the MultiServerMCPClient, connects to servers, fetches tools,
-    filters them, and returns a flat list of usable tools and the client instance.
+    Leases the servers of ``mcp_server_config`` from the process-wide MCP
+    connection manager, which starts them on first use and keeps them running
+    between tasks (see src/utils/mcp_manager.py).
 
     Returns:
-        A tuple containing:
-        - list[BaseTool]: The filtered list of usable LangChain tools.
-        - MultiServerMCPClient | None: The initialized and started client instance, or None on failure.
+        A lease exposing ``server_name_to_tools`` and ``get_tools()`` like
+        ``MultiServerMCPClient``; exiting it releases the servers. None if no
+        server could be connected.
     """
 
-    logger.info("Initializing MultiServerMCPClient...")
+    logger.info("Leasing MCP servers...")
 
     if not mcp_server_config:
         logger.error("No MCP server configuration provided.")
         return None
 
     try:
-        if "mcpServers" in mcp_server_config:
-            mcp_server_config = mcp_server_config["mcpServers"]
-        client = MultiServerMCPClient(mcp_server_config)
-        await client.__aenter__()
-        return client
+        return await get_mcp_manager().lease(mcp_server_config)
 
     except Exception as e:
         logger.error(f"Failed to setup MCP client or fetch tools: {e}", exc_info=True)
         return None
 
 
+# Param models of MCP tools by schema hash, so reconnecting or re-registering a server does not rebuild them
+_param_model_cache: Dict[str, Type[BaseModel]] = {}
+
+
+def _tool_schema_key(tool: BaseTool) -> Optional[str]:
+    if not isinstance(tool.args_schema, dict):
+        return None
+    # Generated class and enum names derive from the tool name, so it is part of the key
+    schema = json.dumps({"name": tool.name, "schema": tool.args_schema}, sort_keys=True, default=str)
+    return hashlib.sha256(schema.encode("utf-8")).hexdigest()
+
+
 def create_tool_param_model(tool: BaseTool) -> Type[BaseModel]:
+    """Creates a Pydantic model from a LangChain tool's schema, reusing the model of an identical schema"""
+    key = _tool_schema_key(tool)
+    if key is None:
+        return _build_tool_param_model(tool)
+    if key not in _param_model_cache:
+        _param_model_cache[key] = _build_tool_param_model(tool)
+    return _param_model_cache[key]
+
+
+def short_description(description: Optional[str], limit: int = 100) -> str:
+    """First sentence of a tool description, cut to ``limit`` characters."""
+    text = " ".join((description or "").split())
+    sentence = re.split(r"(?<=[.!?])\s", text, maxsplit=1)[0]
+    return sentence if len(sentence) <= limit else sentence[:limit - 3].rstrip() + "..."
+
+
+def _words(text: str) -> Set[str]:
+    return {word for word in re.findall(r"[a-z0-9]+", text.lower()) if len(word) > 2}
+
+
+def rank_mcp_tools(task: str, tools: Dict[str, BaseTool]) -> List[str]:
+    """
+    Names of the tools that share words with ``task``, most relevant first. Matches
+    in the tool name count double those in its description.
+    """
+    task_words = _words(task)
+    scores = {}
+    for name, tool in tools.items():
+        score = 2 * len(task_words & _words(name)) + len(task_words & _words(tool.description or ""))
+        if score:
+            scores[name] = score
+    return sorted(scores, key=lambda name: (-scores[name], name))
+
+
+def _build_tool_param_model(tool: BaseTool) -> Type[BaseModel]:
     """Creates a Pydantic model from a LangChain tool's schema"""
 
     # Get tool schema information
@@ -0,0 +1,450 @@
+import asyncio
+import contextvars
+import hashlib
+import json
+import logging
+import os
+import time
+import weakref
+from collections import deque
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.tools import BaseTool, StructuredTool, ToolException
+from langchain_mcp_adapters.client import MultiServerMCPClient
+from mcp.types import CallToolResult, TextContent
+
+from src.utils.step_profiler import percentile
+
+logger = logging.getLogger(__name__)
+
+# Server config keys read by the manager rather than the MCP client
+_MANAGER_KEYS = ("max_concurrency", "timeout", "tool_timeouts", "max_result_chars", "read_only_tools")
+# Seconds between pings while a tool call is running
+_LIVENESS_INTERVAL = 5.0
+
+
+class MCPToolTimeout(ToolException):
+    """An MCP tool call ran past its timeout and was cancelled."""
+
+
+def truncate_output(texts: Sequence[str], max_chars: int) -> Tuple[str, int]:
+    """
+    Joins ``texts`` keeping at most ``max_chars`` characters: the first two thirds
+    and the last third, with a marker in between. Only the kept slices are copied,
+    so a huge result is never joined in full. Returns the text and the number of
+    characters dropped.
+    """
+    total = sum(len(text) for text in texts) + max(0, len(texts) - 1)
+    omitted = total - max_chars
+    if omitted <= 0:
+        return "\n".join(texts), 0
+    head_budget = max_chars * 2 // 3
+    tail_budget = max_chars - head_budget
+    head: List[str] = []
+    for text in texts:
+        if head_budget <= 0:
+            break
+        head.append(text[:head_budget])
+        head_budget -= len(head[-1]) + 1
+    tail: List[str] = []
+    for text in reversed(texts):
+        if tail_budget <= 0:
+            break
+        tail.append(text[max(0, len(text) - tail_budget):])
+        tail_budget -= len(tail[-1]) + 1
+    marker = f"\n[... {omitted} characters of tool output omitted ...]\n"
+    return "\n".join(head) + marker + "\n".join(reversed(tail)), omitted
+
+
+def convert_call_tool_result(result: CallToolResult, max_chars: Optional[int] = None):
+    """
+    Like ``langchain_mcp_adapters``' conversion (text as content, other blocks as
+    artifacts), with the text cut down to ``max_chars``. Returns the content, the
+    artifacts and the number of characters dropped.
+    """
+    texts = [block.text for block in result.content if isinstance(block, TextContent)]
+    artifacts = [block for block in result.content if not isinstance(block, TextContent)] or None
+    omitted = 0
+    if max_chars:
+        content, omitted = truncate_output(texts, max_chars)
+    if not omitted:
+        content = texts[0] if len(texts) == 1 else texts
+    if result.isError:
+        raise ToolException(content)
+    return content, artifacts, omitted
+
+
+class ToolCallStats:
+    """Call counts and rolling latency of one MCP tool."""
+
+    def __init__(self, window: int = 200):
+        self.latencies: deque = deque(maxlen=window)
+        self.calls = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.truncated = 0
+
+    def record(self, latency: float, outcome: str = "ok", truncated: bool = False):
+        self.calls += 1
+        self.latencies.append(latency)
+        if outcome == "timeout":
+            self.timeouts += 1
+        elif outcome != "ok":
+            self.errors += 1
+        if truncated:
+            self.truncated += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        latencies = list(self.latencies)
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "truncated": self.truncated,
+            "p50": percentile(latencies, 0.5) if latencies else None,
+            "p95": percentile(latencies, 0.95) if latencies else None,
+        }
+
+
+def _fingerprint(connection: Dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps(connection, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class MCPServerConnection:
+    """
+    One MCP server kept alive across agent runs.
+
+    The session is opened and closed by a dedicated owner task, since the MCP
+    transports must be exited by the task that entered them. Agents get tools
+    bound to this connection rather than to a session, so they keep working after
+    a reconnect; calls are limited to ``max_concurrency`` at a time. A call cut
+    short by a lost connection fails after the reconnect instead of being
+    replayed, since the server may already have run it.
+
+    Calls are cancelled after ``timeout`` seconds (``tool_timeouts`` overrides it
+    per tool) and their text output is cut to ``max_result_chars``; all three can
+    be set in the server's config.
+    """
+
+    def __init__(self, name: str, connection: Dict[str, Any], max_concurrency: int,
+                 timeout: Optional[float] = None, max_result_chars: Optional[int] = None):
+        self.name = name
+        self.connection = {k: v for k, v in connection.items() if k not in _MANAGER_KEYS}
+        self.refs = 0
+        self.idle_since: Optional[float] = None
+        self.tools: List[BaseTool] = []
+        self.timeout = connection.get("timeout", timeout)
+        self.tool_timeouts: Dict[str, float] = dict(connection.get("tool_timeouts") or {})
+        self.max_result_chars = connection.get("max_result_chars", max_result_chars)
+        self.tool_stats: Dict[str, ToolCallStats] = {}
+        self._semaphore = asyncio.Semaphore(int(connection.get("max_concurrency", max_concurrency)))
+        self._lock = asyncio.Lock()
+        self._session = None
+        self._owner: Optional[asyncio.Task] = None
+        self._closing: Optional[asyncio.Event] = None
+
+    @property
+    def connected(self) -> bool:
+        return self._session is not None and self._owner is not None and not self._owner.done()
+
+    async def _run(self, ready: asyncio.Future):
+        client = MultiServerMCPClient({self.name: self.connection})
+        try:
+            async with client:
+                self._session = client.sessions[self.name]
+                if not ready.done():
+                    ready.set_result(client.server_name_to_tools[self.name])
+                await self._closing.wait()
+        except Exception as e:
+            if not ready.done():
+                ready.set_exception(e)
+            else:
+                logger.warning(f"MCP server {self.name} connection ended: {e}")
+        finally:
+            self._session = None
+
+    async def _start(self) -> List[BaseTool]:
+        self._closing = asyncio.Event()
+        ready = asyncio.get_running_loop().create_future()
+        # A fresh context, so the owner task does not hold on to the contextvars of the run that started it
+        self._owner = asyncio.create_task(self._run(ready), name=f"mcp-server:{self.name}",
+                                          context=contextvars.Context())
+        return await ready
+
+    async def _stop(self):
+        owner, self._owner = self._owner, None
+        if owner is None:
+            return
+        self._closing.set()
+        try:
+            await asyncio.wait_for(owner, timeout=10)
+        except Exception as e:
+            logger.warning(f"MCP server {self.name} did not shut down cleanly: {e}")
+
+    async def open(self):
+        """Connects if not connected yet; the first connection also builds the tools handed to agents."""
+        async with self._lock:
+            if self.connected:
+                return
+            await self._stop()
+            server_tools = await self._start()
+            if not self.tools:
+                self.tools = [self._bind_tool(tool) for tool in server_tools]
+            logger.info(f"Connected to MCP server {self.name} ({len(self.tools)} tools)")
+
+    async def close(self):
+        async with self._lock:
+            await self._stop()
+            logger.info(f"Closed MCP server {self.name}")
+
+    async def reconnect(self):
+        async with self._lock:
+            await self._stop()
+            logger.warning(f"Reconnecting to MCP server {self.name}")
+            await self._start()
+
+    async def check_health(self, timeout: float = 10.0) -> bool:
+        """Pings the server; a server that does not answer is reconnected."""
+        if self.connected:
+            try:
+                await asyncio.wait_for(self._session.send_ping(), timeout=timeout)
+                return True
+            except Exception as e:
+                logger.warning(f"MCP server {self.name} failed its health check: {type(e).__name__}: {e}")
+        try:
+            await self.reconnect()
+        except Exception as e:
+            logger.error(f"Failed to reconnect to MCP server {self.name}: {e}")
+        return False
+
+    def timeout_for(self, tool_name: str) -> Optional[float]:
+        timeout = self.tool_timeouts.get(tool_name, self.timeout)
+        return float(timeout) if timeout else None
+
+    async def _call_watched(self, tool_name: str, arguments: Dict[str, Any], timeout: Optional[float]):
+        # A call to a server that died never returns, so long calls make sure the server still answers pings.
+        # A timed out call is only abandoned here: servers on mcp 1.6 drop the whole session when told a
+        # request was cancelled, so no cancellation notification is sent
+        session = self._session
+        deadline = time.monotonic() + timeout if timeout else None
+        call = asyncio.ensure_future(session.call_tool(tool_name, arguments))
+        try:
+            while True:
+                wait = _LIVENESS_INTERVAL if deadline is None else min(_LIVENESS_INTERVAL, deadline - time.monotonic())
+                done, _ = await asyncio.wait({call}, timeout=max(0.0, wait))
+                if done:
+                    return call.result()
+                if deadline is not None and time.monotonic() >= deadline:
+                    raise MCPToolTimeout(
+                        f"MCP tool {tool_name} on server {self.name} timed out after {timeout:g}s and was cancelled"
+                    )
+                await asyncio.wait_for(session.send_ping(), timeout=_LIVENESS_INTERVAL)
+        finally:
+            call.cancel()
+
+    async def call_tool(self, tool_name: str, arguments: Dict[str, Any]):
+        stats = self.tool_stats.setdefault(tool_name, ToolCallStats())
+        async with self._semaphore:
+            if not self.connected:
+                await self.open()
+            start = time.monotonic()
+            try:
+                result = await self._call_watched(tool_name, arguments, self.timeout_for(tool_name))
+            except asyncio.CancelledError:
+                raise
+            except MCPToolTimeout:
+                stats.record(time.monotonic() - start, "timeout")
+                raise
+            except Exception as e:
+                stats.record(time.monotonic() - start, "error")
+                if await self.check_health():
+                    raise
+                # The call may have run before the connection died, so it is not replayed
+                raise ToolException(
+                    f"Lost the connection to MCP server {self.name} during {tool_name} "
+                    f"({type(e).__name__}); reconnected, the call can be retried"
+                ) from e
+        latency = time.monotonic() - start
+        try:
+            content, artifacts, omitted = convert_call_tool_result(result, self.max_result_chars)
+        except ToolException:
+            stats.record(latency, "error")
+            raise
+        stats.record(latency, truncated=bool(omitted))
+        if omitted:
+            logger.info(f"Truncated {omitted} characters of output from MCP tool {self.name}.{tool_name}")
+        logger.debug(f"MCP tool {self.name}.{tool_name} took {latency:.2f}s")
+        return content, artifacts
+
+    def _bind_tool(self, tool: BaseTool) -> BaseTool:
+        async def call_tool(**arguments: Any):
+            return await self.call_tool(tool.name, arguments)
+
+        return StructuredTool(
+            name=tool.name,
+            description=tool.description,
+            args_schema=tool.args_schema,
+            coroutine=call_tool,
+            response_format="content_and_artifact",
+        )
+
+
+class MCPToolLease:
+    """
+    The tools of one MCP config, held by one agent or controller. Mirrors the parts
+    of ``MultiServerMCPClient`` the callers use; exiting it releases the servers
+    instead of stopping them.
+    """
+
+    def __init__(self, manager: "MCPConnectionManager", connections: Dict[str, MCPServerConnection]):
+        self._manager = manager
+        self._connections = connections
+        self.server_name_to_tools: Dict[str, List[BaseTool]] = {
+            name: connection.tools for name, connection in connections.items()
+        }
+
+    def get_tools(self) -> List[BaseTool]:
+        return [tool for tools in self.server_name_to_tools.values() for tool in tools]
+
+    async def close(self):
+        connections, self._connections = self._connections, {}
+        for connection in connections.values():
+            self._manager.release(connection)
+
+    async def __aenter__(self) -> "MCPToolLease":
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+
+class MCPConnectionManager:
+    """
+    Process-wide pool of MCP server connections.
+
+    Agents lease the servers of their config; a server is shared by every lease
+    with the same name and connection settings, and is shut down once it has had
+    no lease for ``idle_timeout`` seconds. A background task pings connected
+    servers every ``health_interval`` seconds and reconnects those that stopped
+    answering.
+    """
+
+    def __init__(self, idle_timeout: float = 300.0, health_interval: float = 30.0, max_concurrency: int = 4,
+                 tool_timeout: Optional[float] = 120.0, max_result_chars: Optional[int] = 20000):
+        self.idle_timeout = idle_timeout
+        self.health_interval = health_interval
+        self.max_concurrency = max_concurrency
+        self.tool_timeout = tool_timeout
+        self.max_result_chars = max_result_chars
+        self._connections: Dict[Tuple[str, str], MCPServerConnection] = {}
+        self._monitor: Optional[asyncio.Task] = None
+
+    async def lease(self, mcp_server_config: Dict[str, Any]) -> Optional[MCPToolLease]:
+        """Leases the servers of ``mcp_server_config``; servers that fail to connect are left out."""
+        servers = mcp_server_config.get("mcpServers", mcp_server_config)
+        leased: Dict[str, MCPServerConnection] = {}
+        for name, connection in servers.items():
+            key = (name, _fingerprint(connection))
+            if key not in self._connections:
+                self._connections[key] = MCPServerConnection(
+                    name, connection, self.max_concurrency, self.tool_timeout, self.max_result_chars
+                )
+            server = self._connections[key]
+            server.refs += 1
+            server.idle_since = None
+            try:
+                await server.open()
+            except Exception as e:
+                logger.error(f"Failed to connect to MCP server {name}: {e}", exc_info=True)
+                self.release(server)
+                continue
+            leased[name] = server
+        if not leased:
+            return None
+        if self._monitor is None or self._monitor.done():
+            self._monitor = asyncio.create_task(self._monitor_loop(), name="mcp-monitor",
+                                                context=contextvars.Context())
+        return MCPToolLease(self, leased)
+
+    def release(self, server: MCPServerConnection):
+        server.refs = max(0, server.refs - 1)
+        if server.refs == 0:
+            server.idle_since = time.monotonic()
+
+    async def _close_idle(self, max_idle: float):
+        now = time.monotonic()
+        for key, server in list(self._connections.items()):
+            if server.refs == 0 and server.idle_since is not None and now - server.idle_since >= max_idle:
+                del self._connections[key]
+                await server.close()
+
+    async def _monitor_loop(self):
+        while self._connections:
+            await asyncio.sleep(max(1.0, min(self.health_interval, self.idle_timeout)))
+            await self._close_idle(self.idle_timeout)
+            for server in list(self._connections.values()):
+                if server.refs and server.tools:
+                    await server.check_health()
+
+    async def close_all(self):
+        if self._monitor:
+            self._monitor.cancel()
+        for server in list(self._connections.values()):
+            await server.close()
+        self._connections.clear()
+
+    def stats(self) -> List[Dict[str, Any]]:
+        return [
+            {"server": server.name, "connected": server.connected, "leases": server.refs, "tools": len(server.tools)}
+            for server in self._connections.values()
+        ]
+
+    def tool_stats(self) -> List[Dict[str, Any]]:
+        return [
+            {"server": server.name, "tool": tool_name, **stats.to_dict()}
+            for server in self._connections.values()
+            for tool_name, stats in sorted(server.tool_stats.items())
+        ]
+
+    def prometheus_text(self) -> str:
+        """Per-tool call counts and latency quantiles in Prometheus text format."""
+        lines = [
+            "# HELP mcp_tool_call_seconds Latency of MCP tool calls.",
+            "# TYPE mcp_tool_call_seconds summary",
+        ]
+        counters = []
+        for stats in self.tool_stats():
+            labels = f'server="{stats["server"]}",tool="{stats["tool"]}"'
+            if stats["calls"]:
+                lines.append(f'mcp_tool_call_seconds{{{labels},quantile="0.5"}} {stats["p50"]:.6f}')
+                lines.append(f'mcp_tool_call_seconds{{{labels},quantile="0.95"}} {stats["p95"]:.6f}')
+            lines.append(f"mcp_tool_call_seconds_count{{{labels}}} {stats['calls']}")
+            for outcome in ("errors", "timeouts", "truncated"):
+                counters.append(f'mcp_tool_calls_total{{{labels},outcome="{outcome}"}} {stats[outcome]}')
+        lines += ["# HELP mcp_tool_calls_total MCP tool calls that failed, timed out or had their output cut.",
+                  "# TYPE mcp_tool_calls_total counter", *counters]
+        return "\n".join(lines) + "\n"
+
+
+# Sessions belong to the event loop that opened them, so each loop gets its own manager
+_managers: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, MCPConnectionManager]" = weakref.WeakKeyDictionary()
+
+
+def get_mcp_manager() -> MCPConnectionManager:
+    """
+    Manager of the running event loop, configured with ``MCP_IDLE_TIMEOUT``,
+    ``MCP_HEALTH_INTERVAL`` (seconds) and ``MCP_MAX_CONCURRENCY`` (calls per server),
+    ``MCP_TOOL_TIMEOUT`` (seconds per call) and ``MCP_MAX_RESULT_CHARS``. A server's
+    config can override the last three with ``max_concurrency``, ``timeout`` (and
+    ``tool_timeouts``) and ``max_result_chars``; 0 disables a timeout or limit.
+    """
+    loop = asyncio.get_running_loop()
+    if loop not in _managers:
+        _managers[loop] = MCPConnectionManager(
+            idle_timeout=float(os.getenv("MCP_IDLE_TIMEOUT", "300")),
+            health_interval=float(os.getenv("MCP_HEALTH_INTERVAL", "30")),
+            max_concurrency=int(os.getenv("MCP_MAX_CONCURRENCY", "4")),
+            tool_timeout=float(os.getenv("MCP_TOOL_TIMEOUT", "120")),
+            max_result_chars=int(os.getenv("MCP_MAX_RESULT_CHARS", "20000")),
+        )
+    return _managers[loop]
@@ -0,0 +1,90 @@
+import hashlib
+import json
+import logging
+from typing import List, Optional, Sequence
+
+from langchain_anthropic import ChatAnthropic
+from langchain_core.messages import BaseMessage, ToolMessage, message_to_dict
+
+from src.utils.llm_router import RoutingChatModel
+
+logger = logging.getLogger(__name__)
+
+CACHE_CONTROL = {"type": "ephemeral"}
+
+
+def supports_cache_control(llm) -> bool:
+    """
+    Whether ``llm`` takes explicit cache breakpoints (Anthropic ``cache_control``).
+    OpenAI and DeepSeek cache matching prompt prefixes automatically and reject the
+    extra field, so a router qualifies only if every endpoint does.
+    """
+    if isinstance(llm, RoutingChatModel):
+        return all(supports_cache_control(endpoint) for endpoint in llm.endpoints)
+    return isinstance(llm, ChatAnthropic)
+
+
+def _can_carry_breakpoint(message: BaseMessage) -> bool:
+    if isinstance(message, ToolMessage):
+        # Becomes a nested tool_result block; keep breakpoints on top-level content
+        return False
+    if isinstance(message.content, str):
+        return bool(message.content)
+    return any(isinstance(block, dict) and block.get("type") == "text" and block.get("text")
+               for block in message.content)
+
+
+def _with_cache_control(message: BaseMessage) -> BaseMessage:
+    if isinstance(message.content, str):
+        content = [{"type": "text", "text": message.content, "cache_control": CACHE_CONTROL}]
+    else:
+        content = [dict(block) if isinstance(block, dict) else block for block in message.content]
+        last_text = max(i for i, block in enumerate(content) if isinstance(block, dict) and block.get("type") == "text")
+        content[last_text]["cache_control"] = CACHE_CONTROL
+    return message.model_copy(update={"content": content})
+
+
+def with_cache_breakpoints(messages: Sequence[BaseMessage], positions: Sequence[int]) -> List[BaseMessage]:
+    """
+    Copy of ``messages`` with a cache breakpoint at or just before each position.
+    Tool calls and tool results cannot carry one, so the breakpoint moves back to
+    the nearest message with text. The originals, which the agent keeps in its
+    history, are left untouched.
+    """
+    marked = list(messages)
+    for position in sorted(set(positions)):
+        index = min(position, len(marked) - 1)
+        while index >= 0 and not _can_carry_breakpoint(marked[index]):
+            index -= 1
+        if index >= 0:
+            marked[index] = _with_cache_control(marked[index])
+    return marked
+
+
+class PrefixMonitor:
+    """
+    Checks that each request repeats the previous one's messages byte for byte
+    before appending new ones, which is what provider-side prefix caches need.
+    """
+
+    def __init__(self):
+        self._previous: List[str] = []
+        self.breaks = 0
+
+    @staticmethod
+    def _digest(message: BaseMessage) -> str:
+        return hashlib.sha256(json.dumps(message_to_dict(message), sort_keys=True, default=str).encode()).hexdigest()
+
+    def check(self, prefix: Sequence[BaseMessage]) -> Optional[int]:
+        """Records ``prefix`` and returns the index where it diverged from the previous one, if it did."""
+        digests = [self._digest(message) for message in prefix]
+        diverged = None
+        for index, previous in enumerate(self._previous):
+            if index >= len(digests) or digests[index] != previous:
+                diverged = index
+                break
+        self._previous = digests
+        if diverged is not None:
+            self.breaks += 1
+            logger.debug(f"Prompt prefix changed at message {diverged}; the provider cache is reused only up to it")
+        return diverged
@@ -0,0 +1,244 @@
+import asyncio
+import base64
+import io
+import logging
+import os
+import shutil
+import subprocess
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Deque, Optional, Tuple
+
+from PIL import GifImagePlugin, Image, ImageFont
+from browser_use.agent.gif import _add_overlay_to_image, _create_task_frame
+
+logger = logging.getLogger(__name__)
+
+RECORDING_FORMATS = ["gif", "webm"]
+
+_FONT_NAMES = ["Microsoft YaHei", "SimHei", "Noto Sans CJK SC", "WenQuanYi Micro Hei", "Helvetica", "Arial",
+               "DejaVuSans", "Verdana"]
+
+
+def _load_font(size: int):
+    for font_name in _FONT_NAMES:
+        try:
+            return ImageFont.truetype(font_name, size)
+        except OSError:
+            continue
+    return ImageFont.load_default()
+
+
+class GifFrameWriter:
+    """Appends frames to a GIF file one at a time, each with its own colour table."""
+
+    def __init__(self, output_path: str, duration: int):
+        self.output_path = output_path
+        self.duration = duration
+        self._file = None
+
+    def write(self, image: Image.Image):
+        frame = image.convert("RGB").convert("P", palette=Image.Palette.ADAPTIVE)
+        if self._file is None:
+            self._file = open(self.output_path, "wb")
+            header, _ = GifImagePlugin.getheader(frame, info={"loop": 0})
+            for chunk in header:
+                self._file.write(chunk)
+        for chunk in GifImagePlugin.getdata(frame, duration=self.duration, include_color_table=True):
+            self._file.write(chunk)
+
+    def close(self):
+        if self._file:
+            self._file.write(b";")  # GIF trailer
+            self._file.close()
+            self._file = None
+
+
+class FfmpegFrameWriter:
+    """Pipes frames as PNG into an ``ffmpeg`` subprocess that encodes a WebM video."""
+
+    def __init__(self, output_path: str, duration: int):
+        self.output_path = output_path
+        self.duration = duration
+        self._process: Optional[subprocess.Popen] = None
+
+    def write(self, image: Image.Image):
+        if self._process is None:
+            self._process = subprocess.Popen(
+                [
+                    "ffmpeg", "-y", "-loglevel", "error",
+                    "-f", "image2pipe", "-framerate", f"1000/{self.duration}", "-i", "-",
+                    "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2",
+                    "-c:v", "libvpx-vp9", "-b:v", "0", "-crf", "40", "-deadline", "realtime",
+                    "-pix_fmt", "yuv420p",
+                    self.output_path,
+                ],
+                stdin=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+            )
+        image.convert("RGB").save(self._process.stdin, format="PNG", compress_level=1)
+
+    def close(self):
+        if self._process:
+            process, self._process = self._process, None
+            _, stderr = process.communicate()
+            if process.returncode != 0:
+                raise RuntimeError(f"ffmpeg exited with {process.returncode}: {stderr.decode(errors='replace')}")
+
+
+class RunRecorder:
+    """
+    Encodes the recording of an agent run while it happens.
+
+    Each recorded step's screenshot gets its goal overlay and is appended to the
+    encoder on a background thread right away, so only the frame being encoded is
+    held in memory and finishing the run only has to flush the encoder. Frames are
+    scaled down to ``max_width``/``max_height``; with ``frame_skip`` set, only every
+    ``frame_skip + 1``-th step is recorded (the final step always is).
+
+    ``add_step`` never blocks. When more than ``max_pending_frames`` steps wait for
+    the encoder, ``wait_for_capacity`` holds the agent back until it has caught up,
+    so every step is recorded and the buffered screenshots stay bounded. With
+    ``drop_frames`` the oldest waiting step is dropped instead and counted in
+    ``frames_dropped``.
+    """
+
+    def __init__(
+            self,
+            output_path: str,
+            task: str,
+            video_format: str = "gif",
+            max_width: int = 1280,
+            max_height: Optional[int] = None,
+            frame_skip: int = 0,
+            duration: int = 3000,
+            show_goals: bool = True,
+            show_task: bool = True,
+            max_pending_frames: int = 2,
+            drop_frames: bool = False,
+    ):
+        if video_format not in RECORDING_FORMATS:
+            raise ValueError(f"Unsupported recording format: {video_format}")
+        if video_format == "webm" and not shutil.which("ffmpeg"):
+            logger.warning("ffmpeg not found, recording as GIF instead of WebM.")
+            video_format = "gif"
+        self.output_path = os.path.splitext(output_path)[0] + f".{video_format}"
+        self.task = task
+        self.video_format = video_format
+        self.max_width = max_width
+        self.max_height = max_height
+        self.frame_skip = max(0, int(frame_skip))
+        self.show_goals = show_goals
+        self.show_task = show_task
+        self.max_pending_frames = max(1, int(max_pending_frames))
+        self.drop_frames = drop_frames
+        self.frames_written = 0
+        self.frames_dropped = 0
+
+        writer_cls = FfmpegFrameWriter if video_format == "webm" else GifFrameWriter
+        self._writer = writer_cls(self.output_path, duration)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="run-recorder")
+        self._frame_size = None
+        self._fonts = None
+        self._failed = False
+        self._closed = False
+        self._pending: Deque[Tuple[int, str, Optional[str]]] = deque()
+        self._lock = threading.Lock()
+        self._frame_taken = threading.Condition(self._lock)
+        self._draining = False
+
+    def add_step(self, step_number: int, screenshot_b64: Optional[str], goal: Optional[str] = None,
+                 is_done: bool = False):
+        """Queues a step for encoding; returns immediately."""
+        if self._closed or self._failed or not screenshot_b64:
+            return
+        if not is_done and (step_number - 1) % (self.frame_skip + 1) != 0:
+            return
+        with self._lock:
+            if self.drop_frames and len(self._pending) >= self.max_pending_frames:
+                dropped_step = self._pending.popleft()[0]
+                self.frames_dropped += 1
+                logger.debug(f"Recorder is behind, dropping the frame of step {dropped_step}")
+            self._pending.append((step_number, screenshot_b64, goal))
+            if self._draining:
+                return
+            self._draining = True
+        self._executor.submit(self._drain)
+
+    def _has_capacity(self) -> bool:
+        return len(self._pending) <= self.max_pending_frames
+
+    def _wait_until_capacity(self):
+        with self._frame_taken:
+            self._frame_taken.wait_for(self._has_capacity)
+
+    async def wait_for_capacity(self):
+        """Returns once at most ``max_pending_frames`` steps wait for the encoder."""
+        with self._lock:
+            if self._has_capacity():
+                return
+        await asyncio.to_thread(self._wait_until_capacity)
+
+    def _drain(self):
+        while True:
+            with self._lock:
+                if not self._pending:
+                    self._draining = False
+                    return
+                step = self._pending.popleft()
+                self._frame_taken.notify_all()
+            self._encode_step(*step)
+
+    def _encode_step(self, step_number: int, screenshot_b64: str, goal: Optional[str]):
+        if self._failed:
+            return
+        try:
+            if self._fonts is None:
+                self._fonts = (_load_font(40), _load_font(56))
+            regular_font, title_font = self._fonts
+            if self.frames_written == 0 and self.show_task and self.task:
+                self._write_frame(_create_task_frame(self.task, screenshot_b64, title_font, regular_font))
+
+            image = Image.open(io.BytesIO(base64.b64decode(screenshot_b64)))
+            if self.show_goals and goal:
+                image = _add_overlay_to_image(
+                    image=image,
+                    step_number=step_number,
+                    goal_text=goal,
+                    regular_font=regular_font,
+                    title_font=title_font,
+                    margin=40,
+                )
+            self._write_frame(image)
+        except Exception as e:
+            self._failed = True
+            logger.error(f"Recording failed at step {step_number}, no further frames are recorded: {e}",
+                         exc_info=True)
+
+    def _write_frame(self, image: Image.Image):
+        image = image.convert("RGB")
+        image.thumbnail((self.max_width, self.max_height or self.max_width * 4))
+        if self._frame_size is None:
+            self._frame_size = image.size
+        elif image.size != self._frame_size:
+            # Animated formats need a constant canvas; pad or crop to the first frame
+            canvas = Image.new("RGB", self._frame_size)
+            canvas.paste(image, (0, 0))
+            image = canvas
+        self._writer.write(image)
+        self.frames_written += 1
+
+    def _finish(self) -> Optional[str]:
+        self._executor.shutdown(wait=True)
+        self._writer.close()
+        if self.frames_dropped:
+            logger.info(f"Recording skipped {self.frames_dropped} frames the encoder could not keep up with")
+        if self._failed:
+            raise RuntimeError(f"Recording to {self.output_path} failed")
+        return self.output_path if self.frames_written else None
+
+    async def close(self) -> Optional[str]:
+        """Waits for queued frames, finalises the file and returns its path (None if nothing was recorded)."""
+        self._closed = True
+        return await asyncio.to_thread(self._finish)
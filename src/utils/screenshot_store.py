@@ -0,0 +1,129 @@
+import asyncio
+import base64
+import io
+import logging
+import os
+import threading
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Deque, Optional, Tuple
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = {"jpeg": "jpg", "webp": "webp", "png": "png"}
+
+
+@dataclass
+class ScreenshotRef:
+    path: str
+    thumbnail_path: str
+
+
+class ScreenshotStore:
+    """
+    Writes step screenshots of one agent run to disk so only file paths stay in memory.
+
+    Every screenshot is re-encoded as JPEG/WebP/PNG with the given quality and gets a
+    small thumbnail for the UI. With ``max_full_screenshots`` set, only the newest
+    full-size files are kept; older steps keep their thumbnail.
+    """
+
+    def __init__(
+            self,
+            output_dir: str,
+            image_format: str = "jpeg",
+            quality: int = 80,
+            thumbnail_width: int = 320,
+            max_full_screenshots: Optional[int] = None,
+    ):
+        if image_format not in IMAGE_EXTENSIONS:
+            raise ValueError(f"Unsupported screenshot format: {image_format}")
+        self.output_dir = os.path.abspath(output_dir)
+        self.image_format = image_format
+        self.quality = quality
+        self.thumbnail_width = thumbnail_width
+        self.max_full_screenshots = max_full_screenshots or None
+        os.makedirs(self.output_dir, exist_ok=True)
+
+        self._count = 0
+        self._full_paths: Deque[str] = deque()
+        # Recently saved screenshots, so the step callback and the agent history share one file
+        self._recent: "OrderedDict[int, ScreenshotRef]" = OrderedDict()
+        # Reservations happen on the event loop while writes run on worker threads
+        self._lock = threading.Lock()
+
+    def save(self, step_num: int, screenshot_b64: str) -> ScreenshotRef:
+        """Writes the screenshot and its thumbnail. Saving the same data twice returns the first reference."""
+        ref, is_new = self.reserve(step_num, screenshot_b64)
+        if is_new:
+            self.write(ref, screenshot_b64)
+        return ref
+
+    def reserve(self, step_num: int, screenshot_b64: str) -> Tuple[ScreenshotRef, bool]:
+        """
+        Assigns the file paths for a screenshot without encoding it, so callers on the event
+        loop can hand ``write`` to a worker thread. The flag is False if the data was saved before.
+        """
+        key = hash(screenshot_b64)
+        with self._lock:
+            if key in self._recent:
+                return self._recent[key], False
+            self._count += 1
+            ext = IMAGE_EXTENSIONS[self.image_format]
+            path = os.path.join(self.output_dir, f"{self._count:04d}_step_{step_num}.{ext}")
+            ref = ScreenshotRef(path=path, thumbnail_path=thumbnail_path_for(path))
+            self._recent[key] = ref
+            while len(self._recent) > 8:
+                self._recent.popitem(last=False)
+        return ref, True
+
+    def write(self, ref: ScreenshotRef, screenshot_b64: str):
+        """Encodes the screenshot and its thumbnail to the paths of a reserved reference."""
+        image = Image.open(io.BytesIO(base64.b64decode(screenshot_b64)))
+        if self.image_format == "jpeg" and image.mode != "RGB":
+            image = image.convert("RGB")
+        image.save(ref.path, format=self.image_format.upper(), quality=self.quality)
+
+        thumbnail = image.copy()
+        thumbnail.thumbnail((self.thumbnail_width, self.thumbnail_width * 4))
+        thumbnail.save(ref.thumbnail_path, format=self.image_format.upper(), quality=min(self.quality, 70))
+
+        with self._lock:
+            self._full_paths.append(ref.path)
+            self._apply_retention()
+
+    async def asave(self, step_num: int, screenshot_b64: str) -> ScreenshotRef:
+        """Same as ``save`` but encodes in a worker thread."""
+        return await asyncio.to_thread(self.save, step_num, screenshot_b64)
+
+    def _apply_retention(self):
+        if not self.max_full_screenshots:
+            return
+        while len(self._full_paths) > self.max_full_screenshots:
+            old_path = self._full_paths.popleft()
+            try:
+                os.remove(old_path)
+            except OSError as e:
+                logger.debug(f"Could not remove old screenshot {old_path}: {e}")
+
+
+def thumbnail_path_for(path: str) -> str:
+    root, ext = os.path.splitext(path)
+    return f"{root}_thumb{ext}"
+
+
+def load_screenshot(screenshot: Optional[str]) -> Optional[str]:
+    """
+    Returns base64 image data for a screenshot history value. Paths written by a
+    ``ScreenshotStore`` are read from disk, falling back to the thumbnail if the
+    full-size file was removed by retention. Base64 values are returned unchanged.
+    """
+    if not screenshot or len(screenshot) >= 4096 or not os.path.isabs(screenshot):
+        return screenshot
+    for path in (screenshot, thumbnail_path_for(screenshot)):
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                return base64.b64encode(f.read()).decode("utf-8")
+    return None
@@ -0,0 +1,287 @@
+import inspect
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.tracers.context import register_configure_hook
+
+from src.utils.usage_tracker import extract_token_usage
+
+logger = logging.getLogger(__name__)
+
+# Phases reported per step. dom_extraction is get_state minus the screenshot it takes.
+PHASES = [
+    "step_total",
+    "get_state",
+    "dom_extraction",
+    "screenshot",
+    "llm_queue",
+    "llm_ttft",
+    "llm_total",
+    "actions",
+    "callbacks",
+]
+
+# Nested phases whose time stays part of the enclosing phase; any other nested phase is taken out of it
+PHASE_PARTS = {"get_state": {"screenshot"}}
+
+# Profiler of the agent run executing in the current task; instrumented code looks it up here
+current_profiler: ContextVar[Optional["StepProfiler"]] = ContextVar("current_step_profiler", default=None)
+# Phases open in the current task, innermost last
+_open_phases: ContextVar[Tuple[str, ...]] = ContextVar("open_step_phases", default=())
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class StepProfiler:
+    """
+    Per-step latency breakdown of one agent run.
+
+    Instrumented code calls ``profile_phase(name)`` (or ``add``) while a step is
+    open; each finished step is written as one JSON line to ``jsonl_path`` and kept
+    for the per-run p50/p95 ``summary``.
+
+    Phases are exclusive: time spent in a phase nested in another one (e.g. an LLM
+    call made by an action) only counts for the inner phase, see ``PHASE_PARTS`` for
+    the exceptions. Blocks of one phase that overlap, such as concurrent action
+    batches, count their combined wall time once.
+    """
+
+    def __init__(self, run_id: str, jsonl_path: Optional[str] = None):
+        self.run_id = run_id
+        self.jsonl_path = jsonl_path
+        self.steps: List[Dict[str, Any]] = []
+        self._step: Optional[Dict[str, Any]] = None
+        self._step_start = 0.0
+        self._llm_request_start: Optional[float] = None
+        # Seconds LLM calls of this run have waited for their rate limiter, see add_rate_limit_wait
+        self.rate_limit_wait = 0.0
+        # Open phases: number of blocks running, when the first one started, seconds spent in nested phases
+        self._open: Dict[str, List[float]] = {}
+        if jsonl_path:
+            os.makedirs(os.path.dirname(os.path.abspath(jsonl_path)), exist_ok=True)
+
+    def start_step(self, step_number: int):
+        self._step = {"step": step_number, "timings": {}}
+        self._step_start = time.perf_counter()
+
+    def add(self, phase: str, seconds: float):
+        if self._step is not None:
+            timings = self._step["timings"]
+            timings[phase] = timings.get(phase, 0.0) + seconds
+
+    def enter_phase(self, phase: str):
+        record = self._open.get(phase)
+        if record is None:
+            self._open[phase] = [1, time.perf_counter(), 0.0]
+        else:
+            record[0] += 1
+
+    def exit_phase(self, phase: str):
+        record = self._open[phase]
+        record[0] -= 1
+        if record[0] == 0:
+            del self._open[phase]
+            self.add(phase, max(0.0, time.perf_counter() - record[1] - record[2]))
+
+    def exclude_nested(self, outer: str, inner: str, seconds: float):
+        """Takes time spent in ``inner`` out of the enclosing ``outer`` phase, unless it is a part of it."""
+        record = self._open.get(outer)
+        if record and inner != outer and inner not in PHASE_PARTS.get(outer, ()):
+            record[2] += seconds
+
+    def add_tokens(self, input_tokens: int, cached_tokens: int):
+        """Counts prompt tokens of the current step's LLM calls and how many were served from the provider cache."""
+        if self._step is not None:
+            tokens = self._step.setdefault("tokens", {"input": 0, "cached": 0})
+            tokens["input"] += input_tokens
+            tokens["cached"] += cached_tokens
+
+    def add_rate_limit_wait(self, seconds: float):
+        """
+        Counts a rate limiter wait as ``llm_queue``. LangChain waits for the limiter
+        after the call has started, so ``LLMTimingHandler`` takes it out of the call's
+        own timings.
+        """
+        self.rate_limit_wait += seconds
+        self.add("llm_queue", seconds)
+
+    def mark_llm_request(self):
+        """Marks the moment the agent asks for the next action; the LLM callback measures queueing from here."""
+        self._llm_request_start = time.perf_counter()
+
+    def pop_llm_request_start(self) -> Optional[float]:
+        start, self._llm_request_start = self._llm_request_start, None
+        return start
+
+    def end_step(self) -> Optional[Dict[str, Any]]:
+        if self._step is None:
+            return None
+        step, self._step = self._step, None
+        timings = step["timings"]
+        timings["step_total"] = time.perf_counter() - self._step_start
+        if "get_state" in timings:
+            timings["dom_extraction"] = max(0.0, timings["get_state"] - timings.get("screenshot", 0.0))
+        event = {"run_id": self.run_id, "time": time.time(), **step}
+        self.steps.append(event)
+        if self.jsonl_path:
+            try:
+                with open(self.jsonl_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(event) + "\n")
+            except OSError as e:
+                logger.warning(f"Could not write step timings to {self.jsonl_path}: {e}")
+        return event
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """p50/p95/total seconds per phase over all finished steps."""
+        result = {}
+        for phase in PHASES:
+            values = [step["timings"][phase] for step in self.steps if phase in step["timings"]]
+            if values:
+                result[phase] = {
+                    "count": len(values),
+                    "p50": percentile(values, 0.5),
+                    "p95": percentile(values, 0.95),
+                    "total": sum(values),
+                }
+        return result
+
+    def cache_summary(self) -> Dict[str, float]:
+        """Prompt tokens over all finished steps and the share read from the provider's prompt cache."""
+        input_tokens = sum(step.get("tokens", {}).get("input", 0) for step in self.steps)
+        cached_tokens = sum(step.get("tokens", {}).get("cached", 0) for step in self.steps)
+        return {
+            "input_tokens": input_tokens,
+            "cached_tokens": cached_tokens,
+            "cached_ratio": cached_tokens / input_tokens if input_tokens else 0.0,
+        }
+
+    def prometheus_text(self) -> str:
+        lines = []
+        for phase, stats in self.summary().items():
+            labels = f'run_id="{self.run_id}",phase="{phase}"'
+            lines.append(f'agent_step_phase_seconds{{{labels},quantile="0.5"}} {stats["p50"]:.6f}')
+            lines.append(f'agent_step_phase_seconds{{{labels},quantile="0.95"}} {stats["p95"]:.6f}')
+            lines.append(f'agent_step_phase_seconds_sum{{{labels}}} {stats["total"]:.6f}')
+            lines.append(f'agent_step_phase_seconds_count{{{labels}}} {stats["count"]}')
+        cache = self.cache_summary()
+        if cache["input_tokens"]:
+            lines.append(f'agent_prompt_cached_tokens_ratio{{run_id="{self.run_id}"}} {cache["cached_ratio"]:.6f}')
+        return "\n".join(lines) + "\n" if lines else ""
+
+    def format_summary(self) -> str:
+        text = ", ".join(
+            f"{phase} p50={stats['p50']:.2f}s p95={stats['p95']:.2f}s" for phase, stats in self.summary().items()
+        )
+        cache = self.cache_summary()
+        if cache["input_tokens"]:
+            text += f", prompt cache {cache['cached_ratio']:.0%} of {int(cache['input_tokens'])} input tokens"
+        return text
+
+
+@contextmanager
+def profile_phase(phase: str):
+    """Adds the time spent in the block to ``phase`` of the current step, if a run is being profiled."""
+    profiler = current_profiler.get()
+    if profiler is None:
+        yield
+        return
+    enclosing = _open_phases.get()
+    token = _open_phases.set(enclosing + (phase,))
+    start = time.perf_counter()
+    profiler.enter_phase(phase)
+    try:
+        yield
+    finally:
+        _open_phases.reset(token)
+        profiler.exit_phase(phase)
+        if enclosing:
+            profiler.exclude_nested(enclosing[-1], phase, time.perf_counter() - start)
+
+
+def profile_callback(callback):
+    """Wraps a sync or async agent callback so its time counts as the ``callbacks`` phase."""
+    if inspect.iscoroutinefunction(callback):
+        async def async_wrapper(*args, **kwargs):
+            with profile_phase("callbacks"):
+                return await callback(*args, **kwargs)
+
+        return async_wrapper
+
+    def wrapper(*args, **kwargs):
+        with profile_phase("callbacks"):
+            return callback(*args, **kwargs)
+
+    return wrapper
+
+
+class LLMTimingHandler(BaseCallbackHandler):
+    """Measures queueing, time to first token and total time of chat model calls, and their prompt cache hits."""
+
+    run_inline = True
+
+    def __init__(self):
+        self._starts: Dict[UUID, float] = {}
+        self._first_token: Dict[UUID, float] = {}
+        # The profiler's rate limit wait when each call started
+        self._waits: Dict[UUID, float] = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, **kwargs: Any):
+        now = time.perf_counter()
+        self._starts[run_id] = now
+        profiler = current_profiler.get()
+        if profiler:
+            self._waits[run_id] = profiler.rate_limit_wait
+        request_start = profiler.pop_llm_request_start() if profiler else None
+        if request_start is not None:
+            profiler.add("llm_queue", now - request_start)
+
+    def _elapsed(self, run_id: UUID, profiler: StepProfiler) -> float:
+        # Time since the call started, less what it spent waiting for its rate limiter (counted as llm_queue)
+        throttled = profiler.rate_limit_wait - self._waits.get(run_id, profiler.rate_limit_wait)
+        return max(0.0, time.perf_counter() - self._starts[run_id] - throttled)
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs: Any):
+        if run_id in self._starts and run_id not in self._first_token:
+            self._first_token[run_id] = time.perf_counter()
+            profiler = current_profiler.get()
+            if profiler:
+                profiler.add("llm_ttft", self._elapsed(run_id, profiler))
+
+    def on_llm_end(self, response, *, run_id: UUID, **kwargs: Any):
+        profiler = current_profiler.get()
+        if profiler and run_id in self._starts:
+            usage = extract_token_usage(response)
+            profiler.add_tokens(usage["input_tokens"], usage["cached_tokens"])
+        self._finish(run_id)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        self._finish(run_id)
+
+    def _finish(self, run_id: UUID):
+        profiler = current_profiler.get()
+        if run_id in self._starts and profiler:
+            elapsed = self._elapsed(run_id, profiler)
+            profiler.add("llm_total", elapsed)
+            enclosing = _open_phases.get()
+            if enclosing:
+                # e.g. the extraction LLM called by an action
+                profiler.exclude_nested(enclosing[-1], "llm_total", elapsed)
+        self._starts.pop(run_id, None)
+        self._first_token.pop(run_id, None)
+        self._waits.pop(run_id, None)
+
+
+# Attached to every LangChain run while a profiled agent run sets it in its context
+llm_timing_handler: ContextVar[Optional[LLMTimingHandler]] = ContextVar("llm_timing_handler", default=None)
+register_configure_hook(llm_timing_handler, inheritable=True)
@@ -0,0 +1,329 @@
+"""
+Local OpenAI-compatible chat completions server for offline tests and benchmarks.
+
+Responses come from, in order:
+
+1. a recording (JSONL, keyed by a hash of model, messages and tools), filled by
+   running once with ``--upstream`` pointing at a real provider;
+2. a script of rules, each matching a substring of the request's messages and
+   answering with its ``responses`` indexed by the number of assistant turns in
+   the request (less the rule's ``first_turn``, for prompts that start with
+   example turns), so concurrent agents each follow the script from the start;
+3. a default ``done`` answer.
+
+A response entry is ``{"content": "..."}``, ``{"json": {...}}`` (returned as a
+tool call when the request forces one, e.g. structured output, else as JSON text),
+``{"tool_call": {"name": ..., "arguments": {...}}}``, optionally with
+``"reasoning"`` streamed as ``reasoning_content`` first. Latency before the first
+token and tokens per second are configurable.
+
+    python -m src.utils.stub_llm_server --port 8765 --script tests/fixtures/benchmark/stub_script.json
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import re
+import socket
+import threading
+import time
+import uuid
+from collections import Counter
+from typing import Any, AsyncGenerator, Dict, List, Optional
+
+import httpx
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+DEFAULT_RESPONSE = {
+    "json": {
+        "current_state": {
+            "evaluation_previous_goal": "Unknown",
+            "memory": "Answered by the stub LLM server.",
+            "next_goal": "Finish the task",
+        },
+        "action": [{"done": {"text": "Stub LLM server response.", "success": True}}],
+    }
+}
+
+_TOKEN_PATTERN = re.compile(r"\S+\s*|\s+")
+
+
+def _message_text(message: Dict[str, Any]) -> str:
+    content = message.get("content") or ""
+    if isinstance(content, list):
+        return " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return str(content)
+
+
+def _tokens(text: str) -> List[str]:
+    return _TOKEN_PATTERN.findall(text) or [text]
+
+
+class StubLLM:
+    """Response selection, pacing and call statistics of the stub server."""
+
+    def __init__(
+            self,
+            rules: Optional[List[Dict[str, Any]]] = None,
+            recording_path: Optional[str] = None,
+            upstream_url: Optional[str] = None,
+            upstream_api_key: Optional[str] = None,
+            latency: float = 0.0,
+            tokens_per_second: Optional[float] = None,
+    ):
+        self.rules = rules or []
+        self.recording_path = recording_path
+        self.upstream_url = upstream_url.rstrip("/") if upstream_url else None
+        self.upstream_api_key = upstream_api_key
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.recordings: Dict[str, Dict[str, Any]] = {}
+        self.stats: Counter = Counter()
+        if recording_path:
+            try:
+                with open(recording_path, "r", encoding="utf-8") as f:
+                    for line in f:
+                        if line.strip():
+                            entry = json.loads(line)
+                            self.recordings[entry["key"]] = entry["message"]
+            except FileNotFoundError:
+                pass
+
+    @staticmethod
+    def request_key(body: Dict[str, Any]) -> str:
+        relevant = {key: body.get(key) for key in ("model", "messages", "tools")}
+        return hashlib.sha256(json.dumps(relevant, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+    def _scripted(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        messages = body.get("messages", [])
+        text = "\n".join(_message_text(message) for message in messages)
+        turn = sum(1 for message in messages if message.get("role") == "assistant")
+        for rule in self.rules:
+            if rule.get("match", "") in text:
+                responses = rule["responses"]
+                self.stats[f"rule:{rule.get('name', rule.get('match', ''))}"] += 1
+                index = max(turn - rule.get("first_turn", 0), 0)
+                return responses[min(index, len(responses) - 1)]
+        self.stats["rule:default"] += 1
+        return DEFAULT_RESPONSE
+
+    @staticmethod
+    def _to_message(entry: Dict[str, Any], body: Dict[str, Any]) -> Dict[str, Any]:
+        message: Dict[str, Any] = {"role": "assistant", "content": None}
+        if entry.get("reasoning"):
+            message["reasoning_content"] = entry["reasoning"]
+        tool_call = entry.get("tool_call")
+        if "json" in entry:
+            forced = body.get("tool_choice")
+            if isinstance(forced, dict) and forced.get("function"):
+                tool_call = {"name": forced["function"]["name"], "arguments": entry["json"]}
+            else:
+                message["content"] = json.dumps(entry["json"])
+        if tool_call:
+            arguments = tool_call.get("arguments", {})
+            message["tool_calls"] = [{
+                "id": f"call_{uuid.uuid4().hex[:12]}",
+                "type": "function",
+                "function": {
+                    "name": tool_call["name"],
+                    "arguments": arguments if isinstance(arguments, str) else json.dumps(arguments),
+                },
+            }]
+        elif message["content"] is None:
+            message["content"] = entry.get("content", "")
+        return message
+
+    async def _from_upstream(self, body: Dict[str, Any], key: str) -> Dict[str, Any]:
+        upstream_body = {k: v for k, v in body.items() if k not in ("stream", "stream_options")}
+        async with httpx.AsyncClient(timeout=600) as client:
+            response = await client.post(
+                f"{self.upstream_url}/chat/completions",
+                json=upstream_body,
+                headers={"Authorization": f"Bearer {self.upstream_api_key or ''}"},
+            )
+            response.raise_for_status()
+        message = response.json()["choices"][0]["message"]
+        self.recordings[key] = message
+        if self.recording_path:
+            with open(self.recording_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"key": key, "message": message}) + "\n")
+        return message
+
+    async def respond(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        key = self.request_key(body)
+        self.stats["calls"] += 1
+        if key in self.recordings:
+            self.stats["recorded"] += 1
+            return self.recordings[key]
+        if self.upstream_url:
+            self.stats["upstream"] += 1
+            return await self._from_upstream(body, key)
+        return self._to_message(self._scripted(body), body)
+
+    def usage(self, body: Dict[str, Any], message: Dict[str, Any]) -> Dict[str, int]:
+        prompt = "\n".join(_message_text(m) for m in body.get("messages", []))
+        completion = (message.get("content") or "") + "".join(
+            call["function"]["arguments"] for call in message.get("tool_calls") or []
+        )
+        usage = {"prompt_tokens": len(prompt) // 4 + 1, "completion_tokens": len(_tokens(completion))}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        self.stats["prompt_tokens"] += usage["prompt_tokens"]
+        self.stats["completion_tokens"] += usage["completion_tokens"]
+        return usage
+
+    async def pace(self, tokens: int):
+        if self.tokens_per_second:
+            await asyncio.sleep(tokens / self.tokens_per_second)
+
+
+def create_app(stub: StubLLM) -> FastAPI:
+    app = FastAPI(title="Stub LLM")
+
+    @app.get("/v1/models")
+    async def list_models():
+        return {"object": "list", "data": [{"id": "stub-model", "object": "model", "owned_by": "stub"}]}
+
+    @app.get("/stats")
+    async def get_stats():
+        return dict(stub.stats)
+
+    @app.post("/stats/reset")
+    async def reset_stats():
+        stub.stats.clear()
+        return {"reset": True}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        message = await stub.respond(body)
+        usage = stub.usage(body, message)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:16]}"
+        created = int(time.time())
+        model = body.get("model", "stub-model")
+        await asyncio.sleep(stub.latency)
+        finish_reason = "tool_calls" if message.get("tool_calls") else "stop"
+
+        if not body.get("stream"):
+            await stub.pace(usage["completion_tokens"])
+            return JSONResponse({
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+                "usage": usage,
+            })
+
+        stub.stats["streamed"] += 1
+
+        def chunk(delta: Dict[str, Any], reason: Optional[str] = None, **extra) -> str:
+            data = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": reason}],
+                **extra,
+            }
+            return f"data: {json.dumps(data)}\n\n"
+
+        async def events() -> AsyncGenerator[str, None]:
+            yield chunk({"role": "assistant", "content": ""})
+            for field in ("reasoning_content", "content"):
+                for token in _tokens(message.get(field) or "") if message.get(field) else []:
+                    await stub.pace(1)
+                    yield chunk({field: token})
+            for index, call in enumerate(message.get("tool_calls") or []):
+                yield chunk({"tool_calls": [{
+                    "index": index, "id": call["id"], "type": "function",
+                    "function": {"name": call["function"]["name"], "arguments": ""},
+                }]})
+                for token in _tokens(call["function"]["arguments"]):
+                    await stub.pace(1)
+                    yield chunk({"tool_calls": [{"index": index, "function": {"arguments": token}}]})
+            yield chunk({}, finish_reason)
+            if (body.get("stream_options") or {}).get("include_usage"):
+                yield f"data: {json.dumps({'id': completion_id, 'object': 'chat.completion.chunk', 'created': created, 'model': model, 'choices': [], 'usage': usage})}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+
+class _ThreadServer(uvicorn.Server):
+    def install_signal_handlers(self):
+        # Runs in a background thread; the host process keeps its own signal handling
+        pass
+
+
+class StubLLMServer:
+    """Runs the stub on a background thread with its own event loop, so it does not compete with the agents."""
+
+    def __init__(self, stub: StubLLM, host: str = "127.0.0.1", port: int = 0):
+        self.stub = stub
+        self.host = host
+        self.port = port
+        self._server: Optional[_ThreadServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/v1"
+
+    def start(self) -> str:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.host, self.port))
+        self.port = sock.getsockname()[1]
+        config = uvicorn.Config(create_app(self.stub), log_level="warning", access_log=False)
+        self._server = _ThreadServer(config)
+        self._thread = threading.Thread(target=self._server.run, kwargs={"sockets": [sock]}, daemon=True)
+        self._thread.start()
+        while not self._server.started:
+            time.sleep(0.02)
+        return self.base_url
+
+    def stop(self):
+        if self._server:
+            self._server.should_exit = True
+            self._thread.join(timeout=10)
+            self._server = None
+
+
+def load_script(path: str, replacements: Optional[Dict[str, str]] = None) -> List[Dict[str, Any]]:
+    """Loads script rules; ``{name}`` placeholders in the file are replaced from ``replacements``."""
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    for name, value in (replacements or {}).items():
+        text = text.replace("{" + name + "}", value)
+    return json.loads(text)["rules"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible stub LLM server")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--script", type=str, default=None, help="JSON file with scripted response rules")
+    parser.add_argument("--recording", type=str, default=None, help="JSONL file of recorded responses")
+    parser.add_argument("--upstream", type=str, default=None, help="Record responses from this OpenAI-compatible URL")
+    parser.add_argument("--upstream-api-key", type=str, default=None)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds before the first token")
+    parser.add_argument("--tps", type=float, default=None, help="Tokens per second of the response")
+    args = parser.parse_args()
+
+    stub = StubLLM(
+        rules=load_script(args.script) if args.script else None,
+        recording_path=args.recording,
+        upstream_url=args.upstream,
+        upstream_api_key=args.upstream_api_key,
+        latency=args.latency,
+        tokens_per_second=args.tps,
+    )
+    uvicorn.run(create_app(stub), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.language_models.chat_models import BaseChatModel
+
+logger = logging.getLogger(__name__)
+
+# Tags (agent, task_id, node) of the code currently calling the LLM
+usage_tags: ContextVar[Dict[str, str]] = ContextVar("llm_usage_tags", default={})
+
+_COUNTERS = ["calls", "errors", "retries", "input_tokens", "output_tokens", "cached_tokens", "latency_seconds"]
+
+
+@contextmanager
+def usage_scope(**tags: Optional[str]):
+    """
+    Tags every LLM call made inside the block. Tags already set by an enclosing
+    scope win, so a browser agent started by a deep research node is accounted
+    to the research task and node.
+    """
+    current = usage_tags.get()
+    token = usage_tags.set({**{k: v for k, v in tags.items() if v}, **current})
+    try:
+        yield
+    finally:
+        usage_tags.reset(token)
+
+
+def tracked_node(node: str, func):
+    """Wraps a LangGraph node function so its LLM calls are tagged with the node name."""
+
+    async def wrapper(state):
+        with usage_scope(node=node):
+            return await func(state)
+
+    return wrapper
+
+
+def extract_token_usage(response) -> Dict[str, int]:
+    """Input/output/cached tokens of an LLMResult, from ``usage_metadata`` or the provider's ``token_usage``."""
+    usage = {"input_tokens": 0, "output_tokens": 0, "cached_tokens": 0}
+    for generations in response.generations:
+        for generation in generations:
+            metadata = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if metadata:
+                usage["input_tokens"] += metadata.get("input_tokens", 0)
+                usage["output_tokens"] += metadata.get("output_tokens", 0)
+                usage["cached_tokens"] += (metadata.get("input_token_details") or {}).get("cache_read", 0)
+    llm_output = response.llm_output or {}
+    token_usage = llm_output.get("token_usage") or llm_output.get("usage") or {}
+    if not usage["input_tokens"]:
+        usage["input_tokens"] = token_usage.get("prompt_tokens", 0) or token_usage.get("input_tokens", 0)
+        usage["output_tokens"] = token_usage.get("completion_tokens", 0) or token_usage.get("output_tokens", 0)
+        usage["cached_tokens"] = (token_usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0)
+    if not usage["cached_tokens"]:
+        # DeepSeek reports its prefix cache hits outside the OpenAI usage fields
+        usage["cached_tokens"] = token_usage.get("prompt_cache_hit_tokens", 0)
+    return usage
+
+
+class UsageTracker:
+    """
+    Token, latency and retry accounting of LLM calls, aggregated per task.
+
+    Totals are kept per task and broken down by agent, graph node and model;
+    ``save`` persists them next to the task's other artefacts.
+    """
+
+    def __init__(self):
+        self._tasks: Dict[str, Dict[tuple, Dict[str, float]]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, tags: Dict[str, str], model: str, usage: Dict[str, int], latency: float, retries: int = 0,
+               error: bool = False):
+        key = (tags.get("agent", "unknown"), tags.get("node", ""), model)
+        with self._lock:
+            entry = self._tasks.setdefault(tags.get("task_id", "unknown"), {}).setdefault(
+                key, dict.fromkeys(_COUNTERS, 0)
+            )
+            entry["calls"] += 1
+            entry["errors"] += int(error)
+            entry["retries"] += retries
+            entry["latency_seconds"] += latency
+            for name, value in usage.items():
+                entry[name] += value
+
+    def breakdown(self, task_id: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            entries = list(self._tasks.get(task_id, {}).items())
+        return [
+            {"agent": agent, "node": node, "model": model, **counters}
+            for (agent, node, model), counters in entries
+        ]
+
+    def totals(self, task_id: str) -> Dict[str, float]:
+        totals = dict.fromkeys(_COUNTERS, 0)
+        for entry in self.breakdown(task_id):
+            for name in _COUNTERS:
+                totals[name] += entry[name]
+        return totals
+
+    def save(self, task_id: str, path: str):
+        """Writes totals and the per agent/node/model breakdown of ``task_id`` as JSON."""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"task_id": task_id, "totals": self.totals(task_id), "breakdown": self.breakdown(task_id)},
+                      f, indent=2)
+
+    def discard(self, task_id: str):
+        with self._lock:
+            self._tasks.pop(task_id, None)
+
+
+class UsageCallbackHandler(BaseCallbackHandler):
+    """
+    Feeds every chat model call into a ``UsageTracker``.
+
+    Runs inline so the tags of the calling task are visible. A call counts as a
+    retry when ``with_retry`` marks it as a later attempt (``retry:attempt:N`` tag);
+    repeated calls under one parent run are not retries, e.g. the steps of an agent
+    started from a tool or a hedged duplicate.
+    """
+
+    run_inline = True
+
+    def __init__(self, tracker: "UsageTracker"):
+        self.tracker = tracker
+        self._calls: Dict[UUID, tuple] = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, tags: Optional[List[str]] = None,
+                            metadata: Optional[Dict[str, Any]] = None, **kwargs: Any):
+        metadata = metadata or {}
+        scope_tags = dict(usage_tags.get())
+        if "node" not in scope_tags and metadata.get("langgraph_node"):
+            scope_tags["node"] = metadata["langgraph_node"]
+        model = metadata.get("ls_model_name") or (serialized or {}).get("name", "unknown")
+        retries = int(any(tag.startswith("retry:attempt:") for tag in tags or []))
+        self._calls[run_id] = (time.perf_counter(), scope_tags, model, retries)
+
+    def on_llm_end(self, response, *, run_id: UUID, **kwargs: Any):
+        call = self._calls.pop(run_id, None)
+        if call:
+            start, tags, model, retries = call
+            self.tracker.record(tags, model, extract_token_usage(response), time.perf_counter() - start, retries)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        call = self._calls.pop(run_id, None)
+        if call:
+            start, tags, model, retries = call
+            self.tracker.record(tags, model, {}, time.perf_counter() - start, retries, error=True)
+
+
+_default_tracker: Optional[UsageTracker] = None
+_default_handler: Optional[UsageCallbackHandler] = None
+
+
+def get_usage_tracker() -> UsageTracker:
+    """Process-wide tracker shared by all agents."""
+    global _default_tracker
+    if _default_tracker is None:
+        _default_tracker = UsageTracker()
+    return _default_tracker
+
+
+def track_usage(llm: BaseChatModel) -> BaseChatModel:
+    """Attaches the usage handler to ``llm`` in place, so the model keeps its class and behaviour."""
+    global _default_handler
+    if _default_handler is None:
+        _default_handler = UsageCallbackHandler(get_usage_tracker())
+    callbacks = llm.callbacks
+    if callbacks is None:
+        llm.callbacks = [_default_handler]
+    elif isinstance(callbacks, list):
+        if _default_handler not in callbacks:
+            callbacks.append(_default_handler)
+    else:
+        callbacks.add_handler(_default_handler, inherit=False)
+    return llm
+
+
+def format_usage(totals: Dict[str, float]) -> str:
+    cached_ratio = totals["cached_tokens"] / totals["input_tokens"] if totals["input_tokens"] else 0.0
+    return (
+        f"{int(totals['input_tokens'])} input ({int(totals['cached_tokens'])} cached, {cached_ratio:.0%}), "
+        f"{int(totals['output_tokens'])} output tokens in {int(totals['calls'])} LLM calls"
+    )
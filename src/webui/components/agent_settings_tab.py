@@ -52,6 +52,16 @@ async def update_mcp_server(mcp_file: str, webui_manager: WebuiManager):
     return json.dumps(mcp_server, indent=2), gr.update(visible=True)
 
 
+async def reset_mcp_controller(webui_manager: WebuiManager):
+    """
+    Closes the controller so the next run registers the MCP tools with the new setting.
+    """
+    if hasattr(webui_manager, "bu_controller") and webui_manager.bu_controller:
+        logger.warning("⚠️ Close controller because the MCP tool loading setting has changed!")
+        await webui_manager.bu_controller.close_mcp_client()
+        webui_manager.bu_controller = None
+
+
 def create_agent_settings_tab(webui_manager: WebuiManager):
     """
     Creates an agent settings tab.
@@ -67,6 +77,12 @@ def create_agent_settings_tab(webui_manager: WebuiManager):
     with gr.Group():
         mcp_json_file = gr.File(label="MCP server json", interactive=True, file_types=[".json"])
         mcp_server_config = gr.Textbox(label="MCP server", lines=6, interactive=True, visible=False)
+        mcp_lazy_tools = gr.Checkbox(
+            label="Load MCP Tools on Demand",
+            value=False,
+            info="Show the agent only MCP tool names and short descriptions until it loads a tool; tools matching the task are loaded up front",
+            interactive=True
+        )
 
     with gr.Group():
         with gr.Row():
@@ -211,6 +227,13 @@ def create_agent_settings_tab(webui_manager: WebuiManager):
             precision=0,
             interactive=True
         )
+        max_history_in_memory = gr.Number(
+            label="History Steps Kept in Memory",
+            value=20,
+            precision=0,
+            info="Older steps are streamed to a JSONL file next to the agent history",
+            interactive=True
+        )
         tool_calling_method = gr.Dropdown(
             label="Tool Calling Method",
             value="auto",
@@ -219,6 +242,12 @@ def create_agent_settings_tab(webui_manager: WebuiManager):
             choices=['function_calling', 'json_mode', 'raw', 'auto', 'tools', "None"],
             visible=True
         )
+        prompt_cache = gr.Checkbox(
+            label="Prompt Caching Layout",
+            value=True,
+            info="Keep the prompt prefix identical across steps and mark cache breakpoints for providers that need them",
+            interactive=True
+        )
     tab_components.update(dict(
         override_system_prompt=override_system_prompt,
         extend_system_prompt=extend_system_prompt,
@@ -239,9 +268,12 @@ def create_agent_settings_tab(webui_manager: WebuiManager):
         max_steps=max_steps,
         max_actions=max_actions,
         max_input_tokens=max_input_tokens,
+        max_history_in_memory=max_history_in_memory,
         tool_calling_method=tool_calling_method,
+        prompt_cache=prompt_cache,
         mcp_json_file=mcp_json_file,
         mcp_server_config=mcp_server_config,
+        mcp_lazy_tools=mcp_lazy_tools,
     ))
     webui_manager.add_components("agent_settings", tab_components)
 
@@ -266,13 +298,18 @@ def create_agent_settings_tab(webui_manager: WebuiManager):
         outputs=[planner_llm_model_name]
     )
 
-    async def update_wrapper(mcp_file):
+    async def update_wrapper(mcp_file, request: gr.Request):
         """Wrapper for handle_pause_resume."""
-        update_dict = await update_mcp_server(mcp_file, webui_manager)
+        update_dict = await update_mcp_server(mcp_file, await webui_manager.get_session(request))
         yield update_dict
 
     mcp_json_file.change(
         update_wrapper,
         inputs=[mcp_json_file],
         outputs=[mcp_server_config, mcp_server_config]
-    )
\ No newline at end of file
+    )
+
+    async def reset_wrapper(request: gr.Request):
+        await reset_mcp_controller(await webui_manager.get_session(request))
+
+    mcp_lazy_tools.change(reset_wrapper)
\ No newline at end of file
@@ -6,6 +6,7 @@ from gradio.components import Component
 
 from src.webui.webui_manager import WebuiManager
 from src.utils import config
+from src.utils.run_recorder import RECORDING_FORMATS
 
 logger = logging.getLogger(__name__)
 
@@ -17,15 +18,9 @@ async def close_browser(webui_manager: WebuiManager):
         webui_manager.bu_current_task.cancel()
         webui_manager.bu_current_task = None
 
-    if webui_manager.bu_browser_context:
+    if webui_manager.bu_browser_context or webui_manager.bu_browser:
         logger.info("⚠️ Closing browser context when changing browser config.")
-        await webui_manager.bu_browser_context.close()
-        webui_manager.bu_browser_context = None
-
-    if webui_manager.bu_browser:
-        logger.info("⚠️ Closing browser when changing browser config.")
-        await webui_manager.bu_browser.close()
-        webui_manager.bu_browser = None
+        await webui_manager.close_browser()
 
 def create_browser_settings_tab(webui_manager: WebuiManager):
     """
@@ -131,6 +126,58 @@ def create_browser_settings_tab(webui_manager: WebuiManager):
                 info="Specify the directory where downloaded files should be saved.",
                 interactive=True,
             )
+        with gr.Row():
+            screenshot_format = gr.Dropdown(
+                label="Screenshot Format",
+                choices=["jpeg", "webp", "png"],
+                value="jpeg",
+                info="Format of step screenshots saved with the agent history",
+                interactive=True,
+            )
+            screenshot_quality = gr.Slider(
+                label="Screenshot Quality",
+                minimum=10,
+                maximum=100,
+                value=80,
+                step=5,
+                info="JPEG/WebP quality of saved step screenshots",
+                interactive=True,
+            )
+            screenshot_retention = gr.Number(
+                label="Full-size Screenshots Kept",
+                value=0,
+                precision=0,
+                info="Keep only the newest N full-size screenshots per task (0 = keep all); thumbnails are always kept",
+                interactive=True,
+            )
+        with gr.Row():
+            recording_format = gr.Dropdown(
+                label="Task Recording Format",
+                choices=RECORDING_FORMATS,
+                value="gif",
+                info="Recording encoded while the agent runs; WebM requires ffmpeg",
+                interactive=True,
+            )
+            recording_max_width = gr.Number(
+                label="Recording Max Width",
+                value=1280,
+                precision=0,
+                info="Frames are scaled down to at most this width",
+                interactive=True,
+            )
+            recording_frame_skip = gr.Number(
+                label="Recording Frame Skip",
+                value=0,
+                precision=0,
+                info="Steps skipped between recorded frames; the final step is always recorded",
+                interactive=True,
+            )
+            recording_drop_frames = gr.Checkbox(
+                label="Drop Frames When Behind",
+                value=False,
+                info="Skip frames the encoder cannot keep up with instead of pausing the agent",
+                interactive=True,
+            )
     tab_components.update(
         dict(
             browser_binary_path=browser_binary_path,
@@ -143,6 +190,13 @@ def create_browser_settings_tab(webui_manager: WebuiManager):
             save_trace_path=save_trace_path,
             save_agent_history_path=save_agent_history_path,
             save_download_path=save_download_path,
+            screenshot_format=screenshot_format,
+            screenshot_quality=screenshot_quality,
+            screenshot_retention=screenshot_retention,
+            recording_format=recording_format,
+            recording_max_width=recording_max_width,
+            recording_frame_skip=recording_frame_skip,
+            recording_drop_frames=recording_drop_frames,
             cdp_url=cdp_url,
             wss_url=wss_url,
             window_h=window_h,
@@ -151,9 +205,9 @@ def create_browser_settings_tab(webui_manager: WebuiManager):
     )
     webui_manager.add_components("browser_settings", tab_components)
 
-    async def close_wrapper():
+    async def close_wrapper(request: gr.Request):
         """Wrapper for handle_clear."""
-        await close_browser(webui_manager)
+        await close_browser(await webui_manager.get_session(request))
 
     headless.change(close_wrapper)
     keep_browser_open.change(close_wrapper)
@@ -3,7 +3,8 @@ import json
 import logging
 import os
 import uuid
-from typing import Any, AsyncGenerator, Dict, Optional
+from functools import partial
+from typing import Any, AsyncGenerator, Dict, Optional, Set
 
 import gradio as gr
 
@@ -12,16 +13,19 @@ from browser_use.agent.views import (
     AgentHistoryList,
     AgentOutput,
 )
-from browser_use.browser.browser import BrowserConfig
 from browser_use.browser.context import BrowserContext, BrowserContextConfig
 from browser_use.browser.views import BrowserState
 from gradio.components import Component
 from langchain_core.language_models.chat_models import BaseChatModel
 
 from src.agent.browser_use.browser_use_agent import BrowserUseAgent
-from src.browser.custom_browser import CustomBrowser
+from src.browser.screencast import BrowserScreencast
 from src.controller.custom_controller import CustomController
 from src.utils import llm_provider
+from src.utils.run_recorder import RunRecorder
+from src.utils.step_profiler import StepProfiler
+from src.utils.usage_tracker import format_usage, get_usage_tracker
+from src.utils.screenshot_store import ScreenshotStore
 from src.webui.webui_manager import WebuiManager
 
 logger = logging.getLogger(__name__)
@@ -29,6 +33,29 @@ logger = logging.getLogger(__name__)
 
 # --- Helper Functions --- (Defined at module level)
 
+# Directories passed to gr.set_static_paths, which appends to a process-wide list on every call
+_static_history_dirs: Set[str] = set()
+
+
+def _serve_history_dir(path: str):
+    """Lets Gradio serve the step screenshots under an agent history directory, registering it once."""
+    root = os.path.abspath(path)
+    if root not in _static_history_dirs:
+        _static_history_dirs.add(root)
+        gr.set_static_paths([root])
+
+
+def _publish_event(webui_manager: WebuiManager, event_type: str):
+    """Wakes up the streaming loop of run_agent_task, if a task is running."""
+    if webui_manager.bu_event_queue is not None:
+        webui_manager.bu_event_queue.put_nowait(event_type)
+
+
+def _append_chat_message(webui_manager: WebuiManager, message: Dict[str, Optional[str]]):
+    """Appends a message to the chat history and notifies the streaming loop."""
+    webui_manager.bu_chat_history.append(message)
+    _publish_event(webui_manager, "chat")
+
 
 async def _initialize_llm(
         provider: Optional[str],
@@ -48,7 +75,7 @@ async def _initialize_llm(
             f"Initializing LLM: Provider={provider}, Model={model_name}, Temp={temperature}"
         )
         # Example using a placeholder function
-        llm = llm_provider.get_llm_model(
+        llm = llm_provider.get_routed_llm_model(
             provider=provider,
             model_name=model_name,
             temperature=temperature,
@@ -128,9 +155,41 @@ def _format_agent_output(model_output: AgentOutput) -> str:
     return content.strip()
 
 
+async def _save_step_screenshot(
+        webui_manager: WebuiManager, screenshot_b64: str, step_num: int
+) -> str:
+    """
+    Writes the step screenshot to the task's screenshot store and returns an <img> tag
+    showing its thumbnail, linked to the full-size file. Both are served by Gradio.
+    Falls back to an inline data URI if there is no store.
+    """
+    style = "max-width: 800px; max-height: 600px; object-fit:contain;"
+    store = webui_manager.bu_screenshot_store
+    if not store:
+        return f'<img src="data:image/png;base64,{screenshot_b64}" alt="Step {step_num} Screenshot" style="{style}" />'
+
+    ref = await store.asave(step_num, screenshot_b64)
+    return (
+        f'<a href="/gradio_api/file={ref.path}" target="_blank">'
+        f'<img src="/gradio_api/file={ref.thumbnail_path}" alt="Step {step_num} Screenshot" style="{style}" /></a>'
+    )
+
+
 # --- Updated Callback Implementation ---
 
 
+REASONING_TITLE = "🧠 Reasoning"
+
+
+def _handle_reasoning(webui_manager: WebuiManager, text: str):
+    """Streams the reasoning of reasoning models (DeepSeek R1) into a collapsible message above the next step."""
+    history = webui_manager.bu_chat_history
+    if not history or (history[-1].get("metadata") or {}).get("title") != REASONING_TITLE:
+        history.append({"role": "assistant", "content": "", "metadata": {"title": REASONING_TITLE}})
+    history[-1]["content"] += text
+    _publish_event(webui_manager, "reasoning")
+
+
 async def _handle_new_step(
         webui_manager: WebuiManager, state: BrowserState, output: AgentOutput, step_num: int
 ):
@@ -158,8 +217,10 @@ async def _handle_new_step(
             if (
                     isinstance(screenshot_data, str) and len(screenshot_data) > 100
             ):  # Arbitrary length check
-                # *** UPDATED STYLE: Removed centering, adjusted width ***
-                img_tag = f'<img src="data:image/jpeg;base64,{screenshot_data}" alt="Step {step_num} Screenshot" style="max-width: 800px; max-height: 600px; object-fit:contain;" />'
+                # Reference the screenshot by URL so it is not resent with every chat update
+                img_tag = await _save_step_screenshot(
+                    webui_manager, screenshot_data, step_num
+                )
                 screenshot_html = (
                         img_tag + "<br/>"
                 )  # Use <br/> for line break after inline-block image
@@ -192,9 +253,7 @@ async def _handle_new_step(
     }
 
     # Append to the correct chat history list
-    webui_manager.bu_chat_history.append(chat_message)
-
-    await asyncio.sleep(0.05)
+    _append_chat_message(webui_manager, chat_message)
 
 
 def _handle_done(webui_manager: WebuiManager, history: AgentHistoryList):
@@ -205,6 +264,9 @@ def _handle_done(webui_manager: WebuiManager, history: AgentHistoryList):
     final_summary = "**Task Completed**\n"
     final_summary += f"- Duration: {history.total_duration_seconds():.2f} seconds\n"
     final_summary += f"- Total Input Tokens: {history.total_input_tokens()}\n"  # Or total tokens if available
+    if webui_manager.bu_agent_task_id:
+        usage = get_usage_tracker().totals(webui_manager.bu_agent_task_id)
+        final_summary += f"- LLM Usage: {format_usage(usage)}, {usage['retries']} retries\n"
 
     final_result = history.final_result()
     if final_result:
@@ -216,9 +278,7 @@ def _handle_done(webui_manager: WebuiManager, history: AgentHistoryList):
     else:
         final_summary += "- Status: Success\n"
 
-    webui_manager.bu_chat_history.append(
-        {"role": "assistant", "content": final_summary}
-    )
+    _append_chat_message(webui_manager, {"role": "assistant", "content": final_summary})
 
 
 async def _ask_assistant_callback(
@@ -227,7 +287,7 @@ async def _ask_assistant_callback(
     """Callback triggered by the agent's ask_for_assistant action."""
     logger.info("Agent requires assistance. Waiting for user input.")
 
-    if not hasattr(webui_manager, "_chat_history"):
+    if not hasattr(webui_manager, "bu_chat_history"):
         logger.error("Chat history not found in webui_manager during ask_assistant!")
         return {"response": "Internal Error: Cannot display help request."}
 
@@ -241,6 +301,7 @@ async def _ask_assistant_callback(
     # Use state stored in webui_manager
     webui_manager.bu_response_event = asyncio.Event()
     webui_manager.bu_user_help_response = None  # Reset previous response
+    _publish_event(webui_manager, "ask_help")
 
     try:
         logger.info("Waiting for user response event...")
@@ -257,6 +318,7 @@ async def _ask_assistant_callback(
             }
         )
         webui_manager.bu_response_event = None  # Clear the event
+        _publish_event(webui_manager, "help_answered")
         return {"response": "Timeout: User did not respond."}  # Inform the agent
 
     response = webui_manager.bu_user_help_response
@@ -266,6 +328,7 @@ async def _ask_assistant_callback(
     webui_manager.bu_response_event = (
         None  # Clear the event for the next potential request
     )
+    _publish_event(webui_manager, "help_answered")
     return {"response": response}
 
 
@@ -295,6 +358,7 @@ async def run_agent_task(
         "browser_use_agent.agent_history_file"
     )
     gif_comp = webui_manager.get_component_by_id("browser_use_agent.recording_gif")
+    video_comp = webui_manager.get_component_by_id("browser_use_agent.recording_video")
     browser_view_comp = webui_manager.get_component_by_id(
         "browser_use_agent.browser_view"
     )
@@ -320,6 +384,7 @@ async def run_agent_task(
         chatbot_comp: gr.update(value=webui_manager.bu_chat_history),
         history_file_comp: gr.update(value=None),
         gif_comp: gr.update(value=None),
+        video_comp: gr.update(value=None, visible=False),
     }
 
     # --- Agent Settings ---
@@ -342,8 +407,10 @@ async def run_agent_task(
     max_steps = get_setting("max_steps", 100)
     max_actions = get_setting("max_actions", 10)
     max_input_tokens = get_setting("max_input_tokens", 128000)
+    max_history_in_memory = int(get_setting("max_history_in_memory", 20) or 20)
     tool_calling_str = get_setting("tool_calling_method", "auto")
     tool_calling_method = tool_calling_str if tool_calling_str != "None" else None
+    prompt_cache = get_setting("prompt_cache", True)
     mcp_server_config_comp = webui_manager.id_to_component.get(
         "agent_settings.mcp_server_config"
     )
@@ -398,6 +465,13 @@ async def run_agent_task(
         "save_agent_history_path", "./tmp/agent_history"
     )
     save_download_path = get_browser_setting("save_download_path", "./tmp/downloads")
+    screenshot_format = get_browser_setting("screenshot_format", "jpeg")
+    screenshot_quality = get_browser_setting("screenshot_quality", 80)
+    screenshot_retention = get_browser_setting("screenshot_retention", 0)
+    recording_format = get_browser_setting("recording_format", "gif")
+    recording_max_width = int(get_browser_setting("recording_max_width", 1280) or 1280)
+    recording_frame_skip = int(get_browser_setting("recording_frame_skip", 0) or 0)
+    recording_drop_frames = bool(get_browser_setting("recording_drop_frames", False))
 
     stream_vw = 70
     stream_vh = int(70 * window_h // window_w)
@@ -430,7 +504,9 @@ async def run_agent_task(
         webui_manager.bu_controller = CustomController(
             ask_assistant_callback=ask_callback_wrapper
         )
-        await webui_manager.bu_controller.setup_mcp_client(mcp_server_config)
+        await webui_manager.bu_controller.setup_mcp_client(
+            mcp_server_config, lazy=get_setting("mcp_lazy_tools", False)
+        )
 
     # --- 4. Initialize Browser and Context ---
     should_close_browser_on_finish = not keep_browser_open
@@ -438,42 +514,22 @@ async def run_agent_task(
     try:
         # Close existing resources if not keeping open
         if not keep_browser_open:
-            if webui_manager.bu_browser_context:
-                logger.info("Closing previous browser context.")
-                await webui_manager.bu_browser_context.close()
-                webui_manager.bu_browser_context = None
-            if webui_manager.bu_browser:
-                logger.info("Closing previous browser.")
-                await webui_manager.bu_browser.close()
-                webui_manager.bu_browser = None
-
-        # Create Browser if needed
+            logger.info("Closing previous browser context.")
+            await webui_manager.close_browser()
+
+        # Take a browser from the shared pool if needed
         if not webui_manager.bu_browser:
-            logger.info("Launching new browser instance.")
-            extra_args = []
-            if use_own_browser:
-                browser_binary_path = os.getenv("BROWSER_PATH", None) or browser_binary_path
-                if browser_binary_path == "":
-                    browser_binary_path = None
-                browser_user_data = browser_user_data_dir or os.getenv("BROWSER_USER_DATA", None)
-                if browser_user_data:
-                    extra_args += [f"--user-data-dir={browser_user_data}"]
-            else:
-                browser_binary_path = None
-
-            webui_manager.bu_browser = CustomBrowser(
-                config=BrowserConfig(
-                    headless=headless,
-                    disable_security=disable_security,
-                    browser_binary_path=browser_binary_path,
-                    extra_browser_args=extra_args,
-                    wss_url=wss_url,
-                    cdp_url=cdp_url,
-                    new_context_config=BrowserContextConfig(
-                        window_width=window_w,
-                        window_height=window_h,
-                    )
-                )
+            logger.info("Acquiring browser instance from pool.")
+            await webui_manager.acquire_browser(
+                headless=headless,
+                disable_security=disable_security,
+                use_own_browser=use_own_browser,
+                browser_binary_path=browser_binary_path,
+                browser_user_data_dir=browser_user_data_dir,
+                window_w=window_w,
+                window_h=window_h,
+                cdp_url=cdp_url,
+                wss_url=wss_url,
             )
 
         # Create Context if needed
@@ -510,6 +566,26 @@ async def run_agent_task(
             webui_manager.bu_agent_task_id,
             f"{webui_manager.bu_agent_task_id}.gif",
         )
+        webui_manager.bu_screenshot_store = ScreenshotStore(
+            os.path.join(save_agent_history_path, webui_manager.bu_agent_task_id, "screenshots"),
+            image_format=screenshot_format,
+            quality=int(screenshot_quality),
+            max_full_screenshots=int(screenshot_retention) or None,
+        )
+        # Normally registered when the tab is built; only a changed history path is new here
+        _serve_history_dir(save_agent_history_path)
+        recorder = RunRecorder(
+            gif_path,
+            task,
+            video_format=recording_format,
+            max_width=recording_max_width,
+            frame_skip=recording_frame_skip,
+            drop_frames=recording_drop_frames,
+        )
+        profiler = StepProfiler(
+            webui_manager.bu_agent_task_id,
+            os.path.join(save_agent_history_path, webui_manager.bu_agent_task_id, "step_timings.jsonl"),
+        )
 
         # Pass the webui_manager to callbacks when wrapping them
         async def step_callback_wrapper(
@@ -543,103 +619,115 @@ async def run_agent_task(
                 planner_llm=planner_llm,
                 use_vision_for_planner=planner_use_vision if planner_llm else False,
                 source="webui",
+                screenshot_store=webui_manager.bu_screenshot_store,
+                recorder=recorder,
+                history_spill_path=os.path.join(
+                    save_agent_history_path, webui_manager.bu_agent_task_id, "history.jsonl"
+                ),
+                max_history_in_memory=max_history_in_memory,
+                prompt_cache=prompt_cache,
+                profiler=profiler,
+                register_reasoning_callback=partial(_handle_reasoning, webui_manager),
             )
             webui_manager.bu_agent.state.agent_id = webui_manager.bu_agent_task_id
-            webui_manager.bu_agent.settings.generate_gif = gif_path
         else:
             webui_manager.bu_agent.state.agent_id = webui_manager.bu_agent_task_id
             webui_manager.bu_agent.add_new_task(task)
-            webui_manager.bu_agent.settings.generate_gif = gif_path
+            # The history is per task; the conversation with the LLM carries over
+            webui_manager.bu_agent.spill_history_to(
+                os.path.join(save_agent_history_path, webui_manager.bu_agent_task_id, "history.jsonl"),
+                max_history_in_memory,
+            )
             webui_manager.bu_agent.browser = webui_manager.bu_browser
             webui_manager.bu_agent.browser_context = webui_manager.bu_browser_context
             webui_manager.bu_agent.controller = webui_manager.bu_controller
+            webui_manager.bu_agent.screenshot_store = webui_manager.bu_screenshot_store
+            webui_manager.bu_agent.recorder = recorder
+            webui_manager.bu_agent.profiler = profiler
+            webui_manager.bu_agent.register_reasoning_callback = partial(_handle_reasoning, webui_manager)
 
         # --- 6. Run Agent Task and Stream Updates ---
+        # Callbacks and button handlers publish events to this queue; the loop below
+        # sleeps until an event arrives or the task finishes instead of polling.
+        event_queue: asyncio.Queue = asyncio.Queue()
+        webui_manager.bu_event_queue = event_queue
         agent_run_coro = webui_manager.bu_agent.run(max_steps=max_steps)
         agent_task = asyncio.create_task(agent_run_coro)
         webui_manager.bu_current_task = agent_task  # Store the task
 
-        last_chat_len = len(webui_manager.bu_chat_history)
-        while not agent_task.done():
-            is_paused = webui_manager.bu_agent.state.paused
-            is_stopped = webui_manager.bu_agent.state.stopped
-
-            # Check for pause state
-            if is_paused:
-                yield {
-                    pause_resume_button_comp: gr.update(
-                        value="▶️ Resume", interactive=True
-                    ),
-                    stop_button_comp: gr.update(interactive=True),
-                }
-                # Wait until pause is released or task is stopped/done
-                while is_paused and not agent_task.done():
-                    # Re-check agent state in loop
-                    is_paused = webui_manager.bu_agent.state.paused
-                    is_stopped = webui_manager.bu_agent.state.stopped
-                    if is_stopped:  # Stop signal received while paused
-                        break
-                    await asyncio.sleep(0.2)
-
-                if (
-                        agent_task.done() or is_stopped
-                ):  # If stopped or task finished while paused
-                    break
-
-                # If resumed, yield UI update
-                yield {
-                    pause_resume_button_comp: gr.update(
-                        value="⏸️ Pause", interactive=True
-                    ),
-                    run_button_comp: gr.update(
-                        value="⏳ Running...", interactive=False
-                    ),
-                }
+        # Headless live view: with the live view endpoint mounted, the browser streams
+        # screencast frames itself; otherwise fall back to a screenshot every second.
+        use_screencast = headless and webui_manager.live_view_enabled
+        live_view_interval = 1.0 if headless and not use_screencast else None
+        # Every yield below carries the chat history. Gradio's queue sends each generator
+        # output as a diff against the previous one (Blocks.handle_streaming_diffs), so only
+        # newly appended messages go over the wire; leaving the chatbot out of a yield would
+        # make the next update resend the whole history.
+        if use_screencast:
+            if not webui_manager.bu_screencast:
+                webui_manager.bu_screencast = BrowserScreencast(
+                    webui_manager.bu_browser_context, max_width=window_w, max_height=window_h
+                )
+            await webui_manager.bu_screencast.start()
+            html_content = f'<img src="/live/{webui_manager.session_id}" style="width:{stream_vw}vw; height:{stream_vh}vh ; border:1px solid #ccc;">'
+            yield {
+                browser_view_comp: gr.update(value=html_content, visible=True),
+                chatbot_comp: gr.update(value=webui_manager.bu_chat_history),
+            }
+        elif not headless:
+            yield {
+                browser_view_comp: gr.update(visible=False),
+                chatbot_comp: gr.update(value=webui_manager.bu_chat_history),
+            }
 
-            # Check if agent stopped itself or stop button was pressed (which sets agent.state.stopped)
-            if is_stopped:
-                logger.info("Agent has stopped (internally or via stop button).")
-                if not agent_task.done():
-                    # Ensure the task coroutine finishes if agent just set flag
-                    try:
-                        await asyncio.wait_for(
-                            agent_task, timeout=1.0
-                        )  # Give it a moment to exit run()
-                    except asyncio.TimeoutError:
-                        logger.warning(
-                            "Agent task did not finish quickly after stop signal, cancelling."
-                        )
-                        agent_task.cancel()
-                    except Exception:  # Catch task exceptions if it errors on stop
-                        pass
-                break  # Exit the streaming loop
+        while not agent_task.done():
+            next_event = asyncio.ensure_future(event_queue.get())
+            await asyncio.wait(
+                {next_event, agent_task},
+                timeout=live_view_interval,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            events = []
+            if next_event.done():
+                events.append(next_event.result())
+            else:
+                next_event.cancel()  # A cancelled get() leaves the item in the queue
+            while not event_queue.empty():
+                events.append(event_queue.get_nowait())
 
-            # Check if agent is asking for help (via response_event)
             update_dict = {}
-            if webui_manager.bu_response_event is not None:
-                update_dict = {
-                    user_input_comp: gr.update(
-                        placeholder="Agent needs help. Enter response and submit.",
-                        interactive=True,
-                    ),
-                    run_button_comp: gr.update(
-                        value="✔️ Submit Response", interactive=True
-                    ),
-                    pause_resume_button_comp: gr.update(interactive=False),
-                    stop_button_comp: gr.update(interactive=False),
-                    chatbot_comp: gr.update(value=webui_manager.bu_chat_history),
-                }
-                last_chat_len = len(webui_manager.bu_chat_history)
-                yield update_dict
-                # Wait until response is submitted or task finishes
-                while (
-                        webui_manager.bu_response_event is not None
-                        and not agent_task.done()
-                ):
-                    await asyncio.sleep(0.2)
-                # Restore UI after response submitted or if task ended unexpectedly
-                if not agent_task.done():
-                    yield {
+            is_stopped = False
+            for event in events:
+                if event == "paused":
+                    update_dict.update({
+                        pause_resume_button_comp: gr.update(
+                            value="▶️ Resume", interactive=True
+                        ),
+                        stop_button_comp: gr.update(interactive=True),
+                    })
+                elif event == "resumed":
+                    update_dict.update({
+                        pause_resume_button_comp: gr.update(
+                            value="⏸️ Pause", interactive=True
+                        ),
+                        run_button_comp: gr.update(
+                            value="⏳ Running...", interactive=False
+                        ),
+                    })
+                elif event == "ask_help":
+                    update_dict.update({
+                        user_input_comp: gr.update(
+                            placeholder="Agent needs help. Enter response and submit.",
+                            interactive=True,
+                        ),
+                        run_button_comp: gr.update(
+                            value="✔️ Submit Response", interactive=True
+                        ),
+                        pause_resume_button_comp: gr.update(interactive=False),
+                        stop_button_comp: gr.update(interactive=False),
+                    })
+                elif event == "help_answered":
+                    update_dict.update({
                         user_input_comp: gr.update(
                             placeholder="Agent is running...", interactive=False
                         ),
@@ -648,19 +736,12 @@ async def run_agent_task(
                         ),
                         pause_resume_button_comp: gr.update(interactive=True),
                         stop_button_comp: gr.update(interactive=True),
-                    }
-                else:
-                    break  # Task finished while waiting for response
-
-            # Update Chatbot if new messages arrived via callbacks
-            if len(webui_manager.bu_chat_history) > last_chat_len:
-                update_dict[chatbot_comp] = gr.update(
-                    value=webui_manager.bu_chat_history
-                )
-                last_chat_len = len(webui_manager.bu_chat_history)
+                    })
+                elif event == "stopped":
+                    is_stopped = True
 
-            # Update Browser View
-            if headless and webui_manager.bu_browser_context:
+            # Update Browser View (screenshot fallback)
+            if live_view_interval and webui_manager.bu_browser_context:
                 try:
                     screenshot_b64 = (
                         await webui_manager.bu_browser_context.take_screenshot()
@@ -681,16 +762,37 @@ async def run_agent_task(
                         value="<div style='...'>Error loading view...</div>",
                         visible=True,
                     )
-            else:
-                update_dict[browser_view_comp] = gr.update(visible=False)
 
             # Yield accumulated updates
-            if update_dict:
+            if update_dict or events:
+                update_dict[chatbot_comp] = gr.update(value=webui_manager.bu_chat_history)
                 yield update_dict
 
-            await asyncio.sleep(0.1)  # Polling interval
+            # Stop button was pressed (which sets agent.state.stopped)
+            if is_stopped:
+                logger.info("Agent has stopped (via stop button).")
+                if not agent_task.done():
+                    # Ensure the task coroutine finishes if agent just set flag
+                    try:
+                        await asyncio.wait_for(
+                            asyncio.shield(agent_task), timeout=1.0
+                        )  # Give it a moment to exit run()
+                    except asyncio.TimeoutError:
+                        logger.warning(
+                            "Agent task did not finish quickly after stop signal, cancelling."
+                        )
+                        agent_task.cancel()
+                    except Exception:  # Catch task exceptions if it errors on stop
+                        pass
+                break  # Exit the streaming loop
 
         # --- 7. Task Finalization ---
+        agent = webui_manager.bu_agent
+        webui_manager.bu_event_queue = None
+        if webui_manager.bu_screencast:
+            await webui_manager.bu_screencast.stop()
+            webui_manager.bu_screencast = None
+        webui_manager.bu_screenshot_store = None
         webui_manager.bu_agent.state.paused = False
         webui_manager.bu_agent.state.stopped = False
         final_update = {}
@@ -703,15 +805,13 @@ async def run_agent_task(
                 agent_task.result()  # Raise the exception to be caught below
             logger.info("Agent task completed processing.")
 
-            logger.info(f"Explicitly saving agent history to: {history_file}")
-            webui_manager.bu_agent.save_history(history_file)
-
-            if os.path.exists(history_file):
-                final_update[history_file_comp] = gr.File(value=history_file)
-
-            if gif_path and os.path.exists(gif_path):
-                logger.info(f"GIF found at: {gif_path}")
-                final_update[gif_comp] = gr.Image(value=gif_path)
+            logger.info(f"Saving agent history to: {history_file}")
+            agent.save_history_in_background(history_file)
+            usage_file = os.path.join(os.path.dirname(history_file), "usage.json")
+            task_id = agent.state.agent_id
+            usage_saved = agent.artifact_writer.submit("usage", get_usage_tracker().save, task_id, usage_file)
+            # The totals were shown by _handle_done and are on disk now, so the tracker can drop them
+            usage_saved.add_done_callback(lambda _: get_usage_tracker().discard(task_id))
 
         except asyncio.CancelledError:
             logger.info("Agent task was cancelled.")
@@ -745,14 +845,8 @@ async def run_agent_task(
 
             # Close browser/context if requested
             if should_close_browser_on_finish:
-                if webui_manager.bu_browser_context:
-                    logger.info("Closing browser context after task.")
-                    await webui_manager.bu_browser_context.close()
-                    webui_manager.bu_browser_context = None
-                if webui_manager.bu_browser:
-                    logger.info("Closing browser after task.")
-                    await webui_manager.bu_browser.close()
-                    webui_manager.bu_browser = None
+                logger.info("Closing browser context after task.")
+                await webui_manager.close_browser()
 
             # --- 8. Final UI Update ---
             final_update.update(
@@ -774,10 +868,31 @@ async def run_agent_task(
             )
             yield final_update
 
+        # --- 9. Artefacts ---
+        # History and recording are written off the event loop; the controls above are
+        # already re-enabled, the files are shown as soon as they are ready.
+        written = await agent.wait_for_artifacts()
+        artifact_update = {}
+        if written.get("history") and os.path.exists(history_file):
+            artifact_update[history_file_comp] = gr.File(value=history_file)
+        if written.get("recording") and os.path.exists(recorder.output_path):
+            logger.info(f"Recording ready at: {recorder.output_path}")
+            if recorder.video_format == "gif":
+                artifact_update[gif_comp] = gr.Image(value=recorder.output_path)
+            else:
+                artifact_update[video_comp] = gr.update(value=recorder.output_path, visible=True)
+            if recorder.frames_dropped:
+                gr.Warning(f"The recording skipped {recorder.frames_dropped} steps the encoder could not keep up with.")
+        if artifact_update:
+            gr.Info("Agent history and recording are ready.")
+            artifact_update[chatbot_comp] = gr.update(value=webui_manager.bu_chat_history)
+            yield artifact_update
+
     except Exception as e:
         # Catch errors during setup (before agent run starts)
         logger.error(f"Error setting up agent task: {e}", exc_info=True)
         webui_manager.bu_current_task = None  # Ensure state is reset
+        webui_manager.bu_event_queue = None
         yield {
             user_input_comp: gr.update(
                 interactive=True, placeholder="Error during setup. Enter task..."
@@ -846,6 +961,7 @@ async def handle_stop(webui_manager: WebuiManager):
         # Signal the agent to stop by setting its internal flag
         agent.state.stopped = True
         agent.state.paused = False  # Ensure not paused if stopped
+        _publish_event(webui_manager, "stopped")
         return {
             webui_manager.get_component_by_id(
                 "browser_use_agent.stop_button"
@@ -885,7 +1001,7 @@ async def handle_pause_resume(webui_manager: WebuiManager):
         if agent.state.paused:
             logger.info("Resume button clicked.")
             agent.resume()
-            # UI update happens in main loop
+            _publish_event(webui_manager, "resumed")
             return {
                 webui_manager.get_component_by_id(
                     "browser_use_agent.pause_resume_button"
@@ -894,6 +1010,7 @@ async def handle_pause_resume(webui_manager: WebuiManager):
         else:
             logger.info("Pause button clicked.")
             agent.pause()
+            _publish_event(webui_manager, "paused")
             return {
                 webui_manager.get_component_by_id(
                     "browser_use_agent.pause_resume_button"
@@ -951,6 +1068,9 @@ async def handle_clear(webui_manager: WebuiManager):
         webui_manager.get_component_by_id("browser_use_agent.recording_gif"): gr.update(
             value=None
         ),
+        webui_manager.get_component_by_id("browser_use_agent.recording_video"): gr.update(
+            value=None, visible=False
+        ),
         webui_manager.get_component_by_id("browser_use_agent.browser_view"): gr.update(
             value="<div style='...'>Browser Cleared</div>"
         ),
@@ -976,13 +1096,11 @@ def create_browser_use_agent_tab(webui_manager: WebuiManager):
     """
     Create the run agent tab, defining UI, state, and handlers.
     """
-    webui_manager.init_browser_use_agent()
-
     # --- Define UI Components ---
     tab_components = {}
     with gr.Column():
         chatbot = gr.Chatbot(
-            lambda: webui_manager.bu_chat_history,  # Load history dynamically
+            [],  # Every session starts with its own empty history
             elem_id="browser_use_chatbot",
             label="Agent Interaction",
             type="messages",
@@ -1023,6 +1141,7 @@ def create_browser_use_agent_tab(webui_manager: WebuiManager):
                 interactive=False,
                 type="filepath",
             )
+            recording_video = gr.Video(label="Task Recording", interactive=False, visible=False)
 
     # --- Store Components in Manager ---
     tab_components.update(
@@ -1035,12 +1154,15 @@ def create_browser_use_agent_tab(webui_manager: WebuiManager):
             pause_resume_button=pause_resume_button,
             agent_history_file=agent_history_file,
             recording_gif=recording_gif,
+            recording_video=recording_video,
             browser_view=browser_view,
         )
     )
     webui_manager.add_components(
         "browser_use_agent", tab_components
     )  # Use "browser_use_agent" as tab_name prefix
+    # Step screenshots in the chat are served from the default agent history directory
+    _serve_history_dir(webui_manager.get_component_by_id("browser_settings.save_agent_history_path").value)
 
     all_managed_components = set(
         webui_manager.get_components()
@@ -1048,25 +1170,26 @@ def create_browser_use_agent_tab(webui_manager: WebuiManager):
     run_tab_outputs = list(tab_components.values())
 
     async def submit_wrapper(
-            components_dict: Dict[Component, Any],
+            components_dict: Dict[Component, Any], request: gr.Request
     ) -> AsyncGenerator[Dict[Component, Any], None]:
         """Wrapper for handle_submit that yields its results."""
-        async for update in handle_submit(webui_manager, components_dict):
+        session = await webui_manager.get_session(request)
+        async for update in handle_submit(session, components_dict):
             yield update
 
-    async def stop_wrapper() -> AsyncGenerator[Dict[Component, Any], None]:
+    async def stop_wrapper(request: gr.Request) -> AsyncGenerator[Dict[Component, Any], None]:
         """Wrapper for handle_stop."""
-        update_dict = await handle_stop(webui_manager)
+        update_dict = await handle_stop(await webui_manager.get_session(request))
         yield update_dict
 
-    async def pause_resume_wrapper() -> AsyncGenerator[Dict[Component, Any], None]:
+    async def pause_resume_wrapper(request: gr.Request) -> AsyncGenerator[Dict[Component, Any], None]:
         """Wrapper for handle_pause_resume."""
-        update_dict = await handle_pause_resume(webui_manager)
+        update_dict = await handle_pause_resume(await webui_manager.get_session(request))
         yield update_dict
 
-    async def clear_wrapper() -> AsyncGenerator[Dict[Component, Any], None]:
+    async def clear_wrapper(request: gr.Request) -> AsyncGenerator[Dict[Component, Any], None]:
         """Wrapper for handle_clear."""
-        update_dict = await handle_clear(webui_manager)
+        update_dict = await handle_clear(await webui_manager.get_session(request))
         yield update_dict
 
     # --- Connect Event Handlers using the Wrappers --
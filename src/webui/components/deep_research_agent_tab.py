@@ -10,6 +10,8 @@ from typing import Any, Dict, AsyncGenerator, Optional, Tuple, Union
 import asyncio
 import json
 from src.agent.deep_research.deep_research_agent import DeepResearchAgent
+from src.agent.deep_research import progress
+from src.agent.deep_research.plan_cache import PlanCache
 from src.utils import llm_provider
 
 logger = logging.getLogger(__name__)
@@ -24,7 +26,7 @@ async def _initialize_llm(provider: Optional[str], model_name: Optional[str], te
     try:
         logger.info(f"Initializing LLM: Provider={provider}, Model={model_name}, Temp={temperature}")
         # Use your actual LLM provider logic here
-        llm = llm_provider.get_llm_model(
+        llm = llm_provider.get_routed_llm_model(
             provider=provider,
             model_name=model_name,
             temperature=temperature,
@@ -54,6 +56,107 @@ def _read_file_safe(file_path: str) -> Optional[str]:
 
 # --- Deep Research Agent Specific Logic ---
 
+
+async def _follow_agent_progress(webui_manager: WebuiManager, progress_queue: asyncio.Queue,
+                                 agent_task: asyncio.Task) -> AsyncGenerator[Dict[Component, Any], None]:
+    """
+    Follows the events the agent publishes on its progress channel until the run finishes.
+    The plan arrives once; afterwards only the changed item is applied to the local copy.
+    """
+    resume_task_id_comp = webui_manager.get_component_by_id("deep_research_agent.resume_task_id")
+    markdown_display_comp = webui_manager.get_component_by_id("deep_research_agent.markdown_display")
+
+    plan = None
+    next_event = None
+    try:
+        while True:
+            next_event = next_event or asyncio.create_task(progress_queue.get())
+            await asyncio.wait({next_event, agent_task}, return_when=asyncio.FIRST_COMPLETED)
+            if not next_event.done():
+                break  # Agent ended without publishing run_finished (e.g. it was already running)
+            event = next_event.result()
+            next_event = None
+
+            if event["type"] == progress.RUN_STARTED:
+                webui_manager.dr_task_id = event["task_id"]
+                logger.info(f"Agent started with Task ID: {event['task_id']}")
+                yield {resume_task_id_comp: gr.update(value=event["task_id"])}
+            elif event["type"] == progress.PLAN:
+                plan = event["plan"]
+                yield {markdown_display_comp: gr.update(value=progress.render_plan_markdown(plan))}
+            elif event["type"] == progress.TASK and plan is not None:
+                plan[event["category_index"]]["tasks"][event["task_index"]] = event["task"]
+                yield {markdown_display_comp: gr.update(value=progress.render_plan_markdown(plan))}
+            elif event["type"] == progress.RUN_FINISHED:
+                break
+    finally:
+        if next_event:
+            next_event.cancel()
+
+
+async def _follow_plan_file(webui_manager: WebuiManager, agent_task: asyncio.Task,
+                            base_save_dir: str) -> AsyncGenerator[Dict[Component, Any], None]:
+    """
+    Fallback for agents without a progress channel: shows research_plan.md whenever it changes,
+    using filesystem notifications when ``watchfiles`` is installed and mtime polling otherwise.
+    """
+    resume_task_id_comp = webui_manager.get_component_by_id("deep_research_agent.resume_task_id")
+    markdown_display_comp = webui_manager.get_component_by_id("deep_research_agent.markdown_display")
+
+    # Wait briefly for the agent to start and create the task ID/folder
+    await asyncio.sleep(1.0)
+    running_task_id = webui_manager.dr_agent.current_task_id or webui_manager.dr_task_id
+    if not running_task_id:
+        logger.warning("Cannot monitor plan file: Task ID unknown.")
+        await asyncio.wait({agent_task})
+        return
+    webui_manager.dr_task_id = running_task_id
+    yield {resume_task_id_comp: gr.update(value=running_task_id)}
+
+    task_specific_dir = os.path.join(base_save_dir, str(running_task_id))
+    plan_file_path = os.path.join(task_specific_dir, "research_plan.md")
+    logger.info(f"Monitoring plan file: {plan_file_path}")
+
+    try:
+        from watchfiles import awatch
+    except ImportError:
+        awatch = None
+
+    last_plan_content = _read_file_safe(plan_file_path)
+    if last_plan_content is not None:
+        yield {markdown_display_comp: gr.update(value=last_plan_content)}
+
+    if awatch and os.path.isdir(task_specific_dir):
+        stop_watching = asyncio.Event()
+        agent_task.add_done_callback(lambda _: stop_watching.set())
+        watched_path = os.path.abspath(plan_file_path)
+        async for changes in awatch(task_specific_dir, stop_event=stop_watching):
+            if not any(os.path.abspath(path) == watched_path for _, path in changes):
+                continue
+            plan_content = _read_file_safe(plan_file_path)
+            if plan_content is not None and plan_content != last_plan_content:
+                last_plan_content = plan_content
+                yield {markdown_display_comp: gr.update(value=plan_content)}
+        return
+
+    last_plan_mtime = 0
+    while not agent_task.done():
+        if getattr(webui_manager.dr_agent, 'stopped', False):
+            logger.info("Stop signal detected from agent state.")
+            break
+        try:
+            current_mtime = os.path.getmtime(plan_file_path) if os.path.exists(plan_file_path) else 0
+            if current_mtime > last_plan_mtime:
+                plan_content = _read_file_safe(plan_file_path)
+                if plan_content is not None and plan_content != last_plan_content:
+                    yield {markdown_display_comp: gr.update(value=plan_content)}
+                    last_plan_content = plan_content
+                last_plan_mtime = current_mtime if plan_content is not None else 0
+        except Exception as e:
+            logger.warning(f"Error checking/reading plan file {plan_file_path}: {e}")
+        await asyncio.sleep(1.0)  # Check file changes every second
+
+
 async def run_deep_research(webui_manager: WebuiManager, components: Dict[Component, Any]) -> AsyncGenerator[
     Dict[Component, Any], None]:
     """Handles initializing and running the DeepResearchAgent."""
@@ -100,11 +203,8 @@ async def run_deep_research(webui_manager: WebuiManager, components: Dict[Compon
     }
 
     agent_task = None
-    running_task_id = None
-    plan_file_path = None
+    running_task_id = task_id_to_resume
     report_file_path = None
-    last_plan_content = None
-    last_plan_mtime = 0
 
     try:
         # --- 3. Get LLM and Browser Config from other tabs ---
@@ -145,11 +245,16 @@ async def run_deep_research(webui_manager: WebuiManager, components: Dict[Compon
             webui_manager.dr_agent = DeepResearchAgent(
                 llm=llm,
                 browser_config=browser_config_dict,
-                mcp_server_config=mcp_config
+                mcp_server_config=mcp_config,
+                plan_cache=PlanCache(os.path.join(base_save_dir, "plan_cache")),
             )
             logger.info("DeepResearchAgent initialized.")
 
         # --- 5. Start Agent Run ---
+        webui_manager.dr_task_id = running_task_id  # Store for stop handler
+        progress_channel = getattr(webui_manager.dr_agent, "progress", None)
+        # Subscribe before starting so the run_started and plan events are not missed
+        progress_queue = progress_channel.subscribe() if progress_channel else None
         agent_run_coro = webui_manager.dr_agent.run(
             topic=task_topic,
             task_id=task_id_to_resume,
@@ -159,68 +264,19 @@ async def run_deep_research(webui_manager: WebuiManager, components: Dict[Compon
         agent_task = asyncio.create_task(agent_run_coro)
         webui_manager.dr_current_task = agent_task
 
-        # Wait briefly for the agent to start and potentially create the task ID/folder
-        await asyncio.sleep(1.0)
-
-        # Determine the actual task ID being used (agent sets this)
-        running_task_id = webui_manager.dr_agent.current_task_id
-        if not running_task_id:
-            # Agent might not have set it yet, try to get from result later? Risky.
-            # Or derive from resume_task_id if provided?
-            running_task_id = task_id_to_resume
-            if not running_task_id:
-                logger.warning("Could not determine running task ID immediately.")
-                # We can still monitor, but might miss initial plan if ID needed for path
-            else:
-                logger.info(f"Assuming task ID based on resume ID: {running_task_id}")
+        # --- 6. Monitor Progress ---
+        if progress_queue is not None:
+            try:
+                async for update_dict in _follow_agent_progress(webui_manager, progress_queue, agent_task):
+                    yield update_dict
+            finally:
+                progress_channel.unsubscribe(progress_queue)
         else:
-            logger.info(f"Agent started with Task ID: {running_task_id}")
-
-        webui_manager.dr_task_id = running_task_id  # Store for stop handler
-
-        # --- 6. Monitor Progress via research_plan.md ---
-        if running_task_id:
-            task_specific_dir = os.path.join(base_save_dir, str(running_task_id))
-            plan_file_path = os.path.join(task_specific_dir, "research_plan.md")
-            report_file_path = os.path.join(task_specific_dir, "report.md")
-            logger.info(f"Monitoring plan file: {plan_file_path}")
-        else:
-            logger.warning("Cannot monitor plan file: Task ID unknown.")
-            plan_file_path = None
-        last_plan_content = None
-        while not agent_task.done():
-            update_dict = {}
-            update_dict[resume_task_id_comp] = gr.update(value=running_task_id)
-            agent_stopped = getattr(webui_manager.dr_agent, 'stopped', False)
-            if agent_stopped:
-                logger.info("Stop signal detected from agent state.")
-                break  # Exit monitoring loop
-
-            # Check and update research plan display
-            if plan_file_path:
-                try:
-                    current_mtime = os.path.getmtime(plan_file_path) if os.path.exists(plan_file_path) else 0
-                    if current_mtime > last_plan_mtime:
-                        logger.info(f"Detected change in {plan_file_path}")
-                        plan_content = _read_file_safe(plan_file_path)
-                        if last_plan_content is None or (
-                                plan_content is not None and plan_content != last_plan_content):
-                            update_dict[markdown_display_comp] = gr.update(value=plan_content)
-                            last_plan_content = plan_content
-                            last_plan_mtime = current_mtime
-                        elif plan_content is None:
-                            # File might have been deleted or became unreadable
-                            last_plan_mtime = 0  # Reset to force re-read attempt later
-                except Exception as e:
-                    logger.warning(f"Error checking/reading plan file {plan_file_path}: {e}")
-                    # Avoid continuous logging for the same error
-                    await asyncio.sleep(2.0)
-
-            # Yield updates if any
-            if update_dict:
+            async for update_dict in _follow_plan_file(webui_manager, agent_task, base_save_dir):
                 yield update_dict
-
-            await asyncio.sleep(1.0)  # Check file changes every second
+        running_task_id = webui_manager.dr_task_id
+        if running_task_id:
+            report_file_path = os.path.join(base_save_dir, str(running_task_id), "report.md")
 
         # --- 7. Task Finalization ---
         logger.info("Agent task processing finished. Awaiting final result...")
@@ -412,11 +468,10 @@ def create_deep_research_agent_tab(webui_manager: WebuiManager):
         )
     )
     webui_manager.add_components("deep_research_agent", tab_components)
-    webui_manager.init_deep_research_agent()
 
-    async def update_wrapper(mcp_file):
+    async def update_wrapper(mcp_file, request: gr.Request):
         """Wrapper for handle_pause_resume."""
-        update_dict = await update_mcp_server(mcp_file, webui_manager)
+        update_dict = await update_mcp_server(mcp_file, await webui_manager.get_session(request))
         yield update_dict
 
     mcp_json_file.change(
@@ -429,12 +484,14 @@ def create_deep_research_agent_tab(webui_manager: WebuiManager):
     all_managed_inputs = set(webui_manager.get_components())
 
     # --- Define Event Handler Wrappers ---
-    async def start_wrapper(comps: Dict[Component, Any]) -> AsyncGenerator[Dict[Component, Any], None]:
-        async for update in run_deep_research(webui_manager, comps):
+    async def start_wrapper(comps: Dict[Component, Any], request: gr.Request) -> AsyncGenerator[
+        Dict[Component, Any], None]:
+        session = await webui_manager.get_session(request)
+        async for update in run_deep_research(session, comps):
             yield update
 
-    async def stop_wrapper() -> AsyncGenerator[Dict[Component, Any], None]:
-        update_dict = await stop_deep_research(webui_manager)
+    async def stop_wrapper(request: gr.Request) -> AsyncGenerator[Dict[Component, Any], None]:
+        update_dict = await stop_deep_research(await webui_manager.get_session(request))
         yield update_dict
 
     # --- Connect Handlers ---
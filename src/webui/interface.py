@@ -1,5 +1,9 @@
+from typing import Optional
+
 import gradio as gr
+from fastapi import FastAPI
 
+from src.webui.live_view import mount_live_view
 from src.webui.webui_manager import WebuiManager
 from src.webui.components.agent_settings_tab import create_agent_settings_tab
 from src.webui.components.browser_settings_tab import create_browser_settings_tab
@@ -19,7 +23,12 @@ theme_map = {
 }
 
 
-def create_ui(theme_name="Ocean"):
+def create_ui(
+        theme_name="Ocean",
+        max_sessions: int = 10,
+        session_idle_timeout: float = 3600.0,
+        ui_manager: Optional[WebuiManager] = None,
+):
     css = """
     .gradio-container {
         width: 70vw !important; 
@@ -54,7 +63,7 @@ def create_ui(theme_name="Ocean"):
     }
     """
 
-    ui_manager = WebuiManager()
+    ui_manager = ui_manager or WebuiManager(max_sessions=max_sessions, session_idle_timeout=session_idle_timeout)
 
     with gr.Blocks(
             title="Browser Use WebUI", theme=theme_map[theme_name], css=css, js=js_func,
@@ -92,4 +101,21 @@ def create_ui(theme_name="Ocean"):
             with gr.TabItem("📁 Load & Save Config"):
                 create_load_save_config_tab(ui_manager)
 
+        async def close_session(request: gr.Request):
+            await ui_manager.close_session(request.session_hash)
+
+        demo.unload(close_session)
+
     return demo
+
+
+def create_app(theme_name="Ocean", max_sessions: int = 10, session_idle_timeout: float = 3600.0) -> FastAPI:
+    """
+    Builds the WebUI as a FastAPI app that also serves the MJPEG live view of headless
+    browsers. Run it with any ASGI server, e.g. ``uvicorn`` with ``factory=True``.
+    """
+    ui_manager = WebuiManager(max_sessions=max_sessions, session_idle_timeout=session_idle_timeout)
+    demo = create_ui(theme_name, ui_manager=ui_manager)
+    app = FastAPI()
+    mount_live_view(app, ui_manager)
+    return gr.mount_gradio_app(app, demo.queue(), path="")
@@ -0,0 +1,29 @@
+from fastapi import APIRouter, FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
+
+from src.browser.screencast import MJPEG_BOUNDARY
+from src.webui.webui_manager import WebuiManager
+
+
+def create_live_view_router(webui_manager: WebuiManager) -> APIRouter:
+    """Routes streaming the headless browser of a WebUI session as MJPEG."""
+    router = APIRouter()
+
+    @router.get("/live/{session_id}")
+    async def live_view(session_id: str):
+        session = webui_manager.sessions.get(session_id)
+        screencast = session.bu_screencast if session else None
+        if not screencast or not screencast.running:
+            raise HTTPException(status_code=404, detail="No live view for this session")
+        return StreamingResponse(
+            screencast.mjpeg_stream(),
+            media_type=f"multipart/x-mixed-replace; boundary={MJPEG_BOUNDARY}",
+        )
+
+    return router
+
+
+def mount_live_view(app: FastAPI, webui_manager: WebuiManager) -> None:
+    """Adds the live view routes to the app serving the WebUI and switches the Run Agent tab to use them."""
+    app.include_router(create_live_view_router(webui_manager))
+    webui_manager.live_view_enabled = True
@@ -8,24 +8,43 @@ from typing import Optional, Dict, List
 import uuid
 import asyncio
 import time
+import logging
 
 from gradio.components import Component
 from browser_use.browser.browser import Browser
 from browser_use.browser.context import BrowserContext
 from browser_use.agent.service import Agent
+from src.browser.browser_pool import BrowserPool
 from src.browser.custom_browser import CustomBrowser
 from src.browser.custom_context import CustomBrowserContext
+from src.browser.screencast import BrowserScreencast
 from src.controller.custom_controller import CustomController
+from src.utils.screenshot_store import ScreenshotStore
 from src.agent.deep_research.deep_research_agent import DeepResearchAgent
 
+logger = logging.getLogger(__name__)
 
-class WebuiManager:
-    def __init__(self, settings_save_dir: str = "./tmp/webui_settings"):
-        self.id_to_component: dict[str, Component] = {}
-        self.component_to_id: dict[Component, str] = {}
 
-        self.settings_save_dir = settings_save_dir
-        os.makedirs(self.settings_save_dir, exist_ok=True)
+class WebuiSession:
+    """
+    Agent state of one browser tab (Gradio session).
+
+    Component lookups are forwarded to the owning ``WebuiManager``, so tab handlers
+    can use a session wherever they used the manager before.
+    """
+
+    def __init__(self, manager: "WebuiManager", session_id: str):
+        self.manager = manager
+        self.session_id = session_id
+        self.last_active = time.time()
+        self.init_browser_use_agent()
+        self.init_deep_research_agent()
+
+    def __getattr__(self, name):
+        # Only called for attributes not set on the session itself
+        if name == "manager":
+            raise AttributeError(name)
+        return getattr(self.manager, name)
 
     def init_browser_use_agent(self) -> None:
         """
@@ -40,6 +59,9 @@ class WebuiManager:
         self.bu_user_help_response: Optional[str] = None
         self.bu_current_task: Optional[asyncio.Task] = None
         self.bu_agent_task_id: Optional[str] = None
+        self.bu_event_queue: Optional[asyncio.Queue] = None
+        self.bu_screenshot_store: Optional[ScreenshotStore] = None
+        self.bu_screencast: Optional[BrowserScreencast] = None
 
     def init_deep_research_agent(self) -> None:
         """
@@ -50,6 +72,108 @@ class WebuiManager:
         self.dr_agent_task_id: Optional[str] = None
         self.dr_save_dir: Optional[str] = None
 
+    def is_busy(self) -> bool:
+        return any(task and not task.done() for task in (self.bu_current_task, self.dr_current_task))
+
+    async def acquire_browser(self, **browser_kwargs) -> CustomBrowser:
+        """Takes a browser from the shared pool for this session."""
+        self.bu_browser = await self.manager.browser_pool.acquire(**browser_kwargs)
+        return self.bu_browser
+
+    async def close_browser(self) -> None:
+        """Closes this session's browser context and hands the browser back to the pool."""
+        if self.bu_screencast:
+            await self.bu_screencast.stop()
+            self.bu_screencast = None
+        if self.bu_browser_context:
+            await self.bu_browser_context.close()
+            self.bu_browser_context = None
+        if self.bu_browser:
+            await self.manager.browser_pool.release(self.bu_browser)
+            self.bu_browser = None
+
+    async def close(self) -> None:
+        """Stops running agents and releases all resources held by this session."""
+        if self.dr_agent:
+            await self.dr_agent.stop()
+        for task in (self.bu_current_task, self.dr_current_task):
+            if task and not task.done():
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        await self.close_browser()
+        if self.bu_controller:
+            await self.bu_controller.close_mcp_client()
+            self.bu_controller = None
+        self.init_browser_use_agent()
+        self.init_deep_research_agent()
+
+
+class WebuiManager:
+    def __init__(
+            self,
+            settings_save_dir: str = "./tmp/webui_settings",
+            max_sessions: int = 10,
+            session_idle_timeout: float = 3600.0,
+    ):
+        self.id_to_component: dict[str, Component] = {}
+        self.component_to_id: dict[Component, str] = {}
+
+        self.settings_save_dir = settings_save_dir
+        os.makedirs(self.settings_save_dir, exist_ok=True)
+
+        self.max_sessions = max_sessions
+        self.session_idle_timeout = session_idle_timeout
+        self.sessions: Dict[str, WebuiSession] = {}
+        self.browser_pool = BrowserPool()
+        # Set by mount_live_view once the MJPEG live view endpoint is served
+        self.live_view_enabled = False
+        self._reaper_task: Optional[asyncio.Task] = None
+
+    async def get_session(self, request: Optional[gr.Request] = None) -> WebuiSession:
+        """
+        Returns the state of the calling Gradio session, creating it on first use.
+        Idle sessions are reaped first; raises gr.Error when max_sessions are active.
+        """
+        if self._reaper_task is None or self._reaper_task.done():
+            self._reaper_task = asyncio.create_task(self.run_session_reaper())
+        session_id = getattr(request, "session_hash", None) or "default"
+        session = self.sessions.get(session_id)
+        if session is None:
+            await self.reap_idle_sessions()
+            if len(self.sessions) >= self.max_sessions:
+                raise gr.Error(f"Too many active sessions ({self.max_sessions}). Please try again later.")
+            session = WebuiSession(self, session_id)
+            self.sessions[session_id] = session
+            logger.info(f"Created WebUI session {session_id} ({len(self.sessions)} active).")
+        session.last_active = time.time()
+        return session
+
+    async def close_session(self, session_id: str) -> None:
+        session = self.sessions.pop(session_id, None)
+        if session:
+            await session.close()
+            logger.info(f"Closed WebUI session {session_id} ({len(self.sessions)} active).")
+
+    async def reap_idle_sessions(self) -> int:
+        """Closes sessions without activity for session_idle_timeout that are not running an agent."""
+        now = time.time()
+        idle_ids = [
+            session_id for session_id, session in self.sessions.items()
+            if now - session.last_active > self.session_idle_timeout and not session.is_busy()
+        ]
+        for session_id in idle_ids:
+            await self.close_session(session_id)
+        return len(idle_ids)
+
+    async def run_session_reaper(self, interval: float = 60.0) -> None:
+        """Periodically reaps idle sessions. Meant to run as a background task."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.reap_idle_sessions()
+            except Exception as e:
+                logger.error(f"Error while reaping idle sessions: {e}", exc_info=True)
+
     def add_components(self, tab_name: str, components_dict: dict[str, "Component"]) -> None:
         """
         Add tab components
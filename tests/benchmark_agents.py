@@ -0,0 +1,173 @@
+"""
+Offline end-to-end benchmark of the agents against the local stub LLM server.
+
+The agents browse static pages from tests/fixtures/benchmark, served locally,
+and get scripted answers from src/utils/stub_llm_server.py, so runs need no
+network access or API key and are repeatable. Reports wall time, steps/s, peak
+RSS and LLM call counts per run.
+
+    python tests/benchmark_agents.py --agent browser_use --runs 3 --latency 0.5 --tps 50
+"""
+import argparse
+import asyncio
+import functools
+import http.server
+import json
+import os
+import resource
+import sys
+import threading
+import time
+import uuid
+
+sys.path.append(".")
+
+from src.utils.stub_llm_server import StubLLM, StubLLMServer, load_script
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "benchmark")
+
+
+def serve_fixtures():
+    handler = functools.partial(QuietHandler, directory=FIXTURE_DIR)
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+class QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def stub_llm(base_url: str):
+    from src.utils import llm_provider
+
+    return llm_provider.get_llm_model(
+        provider="openai",
+        model_name="stub-model",
+        temperature=0.0,
+        base_url=base_url,
+        api_key="stub",
+    )
+
+
+async def benchmark_browser_use_agent(llm, fixture_url: str) -> dict:
+    from browser_use.browser.browser import BrowserConfig
+    from browser_use.browser.context import BrowserContextConfig
+
+    from src.agent.browser_use.browser_use_agent import BrowserUseAgent
+    from src.browser.custom_browser import CustomBrowser
+    from src.controller.custom_controller import CustomController
+    from src.utils.step_profiler import StepProfiler
+
+    browser = CustomBrowser(config=BrowserConfig(headless=True))
+    browser_context = await browser.new_context(config=BrowserContextConfig(window_width=1280, window_height=1100))
+    profiler = StepProfiler(str(uuid.uuid4()))
+    try:
+        agent = BrowserUseAgent(
+            task=f"Find the price and specifications of the Solar Lantern on {fixture_url}/index.html",
+            llm=llm,
+            browser=browser,
+            browser_context=browser_context,
+            controller=CustomController(),
+            use_vision=False,
+            profiler=profiler,
+        )
+        history = await agent.run(max_steps=10)
+    finally:
+        await browser_context.close()
+        await browser.close()
+    return {
+        "steps": history.number_of_steps(),
+        "success": bool(history.is_done() and history.is_successful()),
+        "phases": profiler.summary(),
+    }
+
+
+async def benchmark_deep_research_agent(llm, fixture_url: str) -> dict:
+    from src.agent.deep_research.deep_research_agent import DeepResearchAgent
+
+    agent = DeepResearchAgent(llm=llm, browser_config={"headless": True, "use_own_browser": False})
+    result = await agent.run(
+        f"Price and specifications of the Solar Lantern sold on {fixture_url}/index.html",
+        save_dir="./tmp/benchmark/deep_research",
+    )
+    plan = result["final_state"].get("research_plan", [])
+    return {
+        "steps": sum(len(category["tasks"]) for category in plan),
+        "success": result["status"] == "completed",
+    }
+
+
+BENCHMARKS = {
+    "browser_use": benchmark_browser_use_agent,
+    "deep_research": benchmark_deep_research_agent,
+}
+
+
+async def run_benchmarks(agents, runs: int, latency: float, tps: float, output: str):
+    fixture_server, fixture_url = serve_fixtures()
+    stub = StubLLM(
+        rules=load_script(os.path.join(FIXTURE_DIR, "stub_script.json"), {"fixture_url": fixture_url}),
+        latency=latency,
+        tokens_per_second=tps,
+    )
+    stub_server = StubLLMServer(stub)
+    base_url = stub_server.start()
+    llm = stub_llm(base_url)
+    results = []
+    try:
+        for agent in agents:
+            for run in range(runs):
+                stub.stats.clear()
+                start = time.perf_counter()
+                result = await BENCHMARKS[agent](llm, fixture_url)
+                wall = time.perf_counter() - start
+                stats = dict(stub.stats)
+                result.update({
+                    "agent": agent,
+                    "run": run,
+                    "wall_seconds": wall,
+                    "steps_per_second": result["steps"] / wall if wall else 0.0,
+                    "peak_rss_mb": peak_rss_mb(),
+                    "llm_calls": stats.get("calls", 0),
+                    "llm_stats": stats,
+                })
+                results.append(result)
+                print(
+                    f"{agent} run {run}: {result['steps']} steps in {wall:.2f}s "
+                    f"({result['steps_per_second']:.2f} steps/s), {result['llm_calls']} LLM calls, "
+                    f"peak RSS {result['peak_rss_mb']:.0f} MB, success={result['success']}"
+                )
+    finally:
+        stub_server.stop()
+        fixture_server.shutdown()
+
+    if output:
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {output}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline agent benchmark against the stub LLM server")
+    parser.add_argument("--agent", choices=[*BENCHMARKS, "all"], default="all")
+    parser.add_argument("--runs", type=int, default=1)
+    parser.add_argument("--latency", type=float, default=0.0, help="Stub LLM seconds before the first token")
+    parser.add_argument("--tps", type=float, default=None, help="Stub LLM tokens per second")
+    parser.add_argument("--output", type=str, default="./tmp/benchmark/results.json")
+    args = parser.parse_args()
+    agents = list(BENCHMARKS) if args.agent == "all" else [args.agent]
+    asyncio.run(run_benchmarks(agents, args.runs, args.latency, args.tps, args.output))
+
+
+if __name__ == "__main__":
+    main()
@@ -394,7 +394,48 @@ async def test_deep_research_agent():
         print(e)
 
 
+async def test_deep_research_job_queue():
+    from src.agent.deep_research.deep_research_agent import DeepResearchAgent
+    from src.agent.deep_research.job_queue import ResearchJobQueue
+    from src.utils import llm_provider
+
+    llm = llm_provider.get_llm_model(
+        provider="openai",
+        model_name="gpt-4o",
+        temperature=0.5
+    )
+    browser_config = {"headless": True, "window_width": 1280, "window_height": 1100, "use_own_browser": False}
+
+    queue = ResearchJobQueue(
+        agent_factory=lambda: DeepResearchAgent(llm=llm, browser_config=browser_config),
+        save_dir="./tmp/deep_research",
+        num_workers=2,
+        max_browsers=2,
+        llm_requests_per_second=1.0,
+    )
+    await queue.start()
+    job_ids = [
+        queue.submit(topic)
+        for topic in [
+            "Give me investment advices of nvidia and tesla.",
+            "Compare the latest open source LLMs.",
+            "Summarize recent progress in solid state batteries.",
+        ]
+    ]
+
+    try:
+        while any(queue.get_job(job_id)["status"] in ("queued", "running") for job_id in job_ids):
+            for job in queue.list_jobs():
+                print(job["job_id"], job["status"], job["progress"])
+            await asyncio.sleep(10)
+    finally:
+        await queue.shutdown()
+
+    pprint(queue.list_jobs(), indent=4)
+
+
 if __name__ == "__main__":
     asyncio.run(test_browser_use_agent())
     # asyncio.run(test_browser_use_parallel())
     # asyncio.run(test_deep_research_agent())
+    # asyncio.run(test_deep_research_job_queue())
@@ -0,0 +1,81 @@
+"""
+Drives the headless API (/api/tasks) end to end against the local stub LLM server.
+
+A browser-use task browses the benchmark fixtures with scripted LLM answers, while
+its events are followed over SSE, replayed from a later sequence number and the
+task's history, timings and metrics are read back. Needs a local Chromium.
+
+    python tests/test_api_server.py
+"""
+import asyncio
+import json
+import os
+import sys
+
+sys.path.append(".")
+
+import httpx
+
+from src.server.api_server import create_app
+from src.utils.stub_llm_server import StubLLM, StubLLMServer, load_script
+from tests.benchmark_agents import FIXTURE_DIR, serve_fixtures, stub_llm
+
+# browser-use's procedural memory builds an OpenAI embedder for OpenAI models; the stub run never reaches it
+os.environ.setdefault("OPENAI_API_KEY", "stub")
+
+
+async def read_events(client: httpx.AsyncClient, task_id: str, since: int = 0) -> list:
+    events = []
+    async with client.stream("GET", f"/api/tasks/{task_id}/events", params={"since": since}) as response:
+        async for line in response.aiter_lines():
+            if line.startswith("data: "):
+                event = json.loads(line[len("data: "):])
+                events.append(event)
+                print(f"event {event['seq']}: {event['type']}")
+    return events
+
+
+async def test_browser_use_task_api():
+    fixture_server, fixture_url = serve_fixtures()
+    stub = StubLLM(rules=load_script(os.path.join(FIXTURE_DIR, "stub_script.json"), {"fixture_url": fixture_url}))
+    stub_server = StubLLMServer(stub)
+    base_url = stub_server.start()
+    app = create_app(llm_factory=lambda settings, prefix: None if prefix else stub_llm(base_url))
+    manager = app.state.manager
+    transport = httpx.ASGITransport(app=app)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://api", timeout=None) as client:
+            response = await client.post("/api/browser-use/tasks", json={
+                "task": f"Find the price and specifications of the Solar Lantern on {fixture_url}/index.html",
+                "agent_settings": {"max_steps": 10, "use_vision": False},
+                "browser_settings": {"headless": True},
+            })
+            response.raise_for_status()
+            task_id = response.json()["task_id"]
+
+            events = await read_events(client, task_id)
+            task = (await client.get(f"/api/tasks/{task_id}")).json()
+            print(f"status: {task['status']}, message: {task['message']}")
+            assert task["num_events"] == len(events)
+            assert [event["seq"] for event in events] == list(range(len(events)))
+
+            # A client joining late replays from its last seen sequence number
+            since = max(0, len(events) - 2)
+            replayed = await read_events(client, task_id, since=since)
+            assert [event["seq"] for event in replayed] == list(range(since, len(events)))
+
+            assert task_id in [run["task_id"] for run in (await client.get("/api/tasks")).json()]
+            history = (await client.get(f"/api/tasks/{task_id}/history")).json()
+            print(f"history steps: {len(history['history'].get('history', []))}")
+            print(json.dumps((await client.get(f"/api/tasks/{task_id}/timings")).json(), indent=2)[:1000])
+            print((await client.get("/metrics")).text[:1000])
+            print(f"LLM calls: {dict(stub.stats)}")
+            assert (await client.delete(f"/api/tasks/{task_id}")).json()["deleted"]
+    finally:
+        await manager.shutdown()
+        stub_server.stop()
+        fixture_server.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(test_browser_use_task_api())
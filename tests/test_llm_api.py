@@ -86,8 +86,8 @@ def test_llm(config, query, image_path=None, system_message=None):
     ai_msg = llm.invoke(messages)
 
     # Handle different response types
-    if hasattr(ai_msg, "reasoning_content"):
-        print(ai_msg.reasoning_content)
+    if ai_msg.additional_kwargs.get("reasoning_content"):
+        print(ai_msg.additional_kwargs["reasoning_content"])
     print(ai_msg.content)
 
 def test_openai_model():
@@ -2,7 +2,7 @@ import argparse
 import asyncio
 import os
 import json
-from src.webui.webui_manager import WebuiManager
+from src.webui.webui_manager import WebuiManager, WebuiSession
 from src.agent.browser_use.browser_use_agent import BrowserUseAgent
 from src.browser.custom_browser import CustomBrowser
 from src.browser.custom_context import CustomBrowserContext
@@ -94,7 +94,7 @@ async def run_agent(agent):
 
 
 def main():
-    webui_manager = WebuiManager()
+    webui_manager = WebuiSession(WebuiManager(), "cli")
     # 读取配置文件
     config = read_config()
     process_recorder = ProcessRecorder()